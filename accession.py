@@ -52,6 +52,8 @@ from metadatautilspkg.metadatautils import *
 from metadatautilspkg.dbfunctions import *
 from metadatautilspkg.premis import *
 from metadatautilspkg.adminmetadatautils import *
+from metadatautilspkg.arrangementsummary import *
+from metadatautilspkg.outbox import *
 
 
 def main():
@@ -133,10 +135,12 @@ def main():
     globalvars.vocab = readControlledVocabulary()
 
     # CREATE DATABASE CONNECTION
-    dbParams = init_db()  # TODO: there needs to be a check to determine if the 
-                        # database connection was successful or not.
+    # If the catalog is down, the records are written to the outbox.
+    dbParams = init_db(offline=True)
     globalvars.dbHandle = dbParams["handle"]
     globalvars.dbCollection = dbParams["collection_name"]
+    if globalvars.dbHandle == None:
+        print_info("Continuing without the catalog. The records will be written to the outbox '{}'".format(globalvars.outboxFileName))
 
     # PROCESS ALL TRANSFERS
     for row in globalvars.transferList:
@@ -159,6 +163,8 @@ def main():
             continue
 
         transferStatus = transferFiles(src, dst, arrangementInfo)
+        if isCatalogAvailable():
+            flushSummaryDeltas()
 
         if transferStatus['status'] != True:
             # Something bad happened during this particular transfer.
@@ -168,6 +174,17 @@ def main():
             #row.append(transferStatus['comment'])
             globalvars.errorList.append(row + [transferStatus['comment']])
 
+    # The summary counts of the records that reached the catalog are kept in the
+    # outbox, if they cannot be written to the catalog now.
+    if len(globalvars.summaryDeltas) > 0:
+        if globalvars.dbHandle == None or flushSummaryDeltas() == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+            queueOutboxSummaryDeltas()
+            print_error("The arrangement summary could not be updated. Its changes have been written to the outbox '{}'. Run 'dbmaintenance.py --sync' once the catalog is available.".format(globalvars.outboxFileName))
+
+    numOutboxRecords = countOutboxRecords()
+    if numOutboxRecords > 0:
+        print_error("{} records are waiting in the outbox '{}'. Run 'dbmaintenance.py --sync' once the catalog is available.".format(numOutboxRecords, globalvars.outboxFileName))
+
     # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
     if len(globalvars.errorList) > 1:  # Because at least the header row will always be there!
         errorsCSVFileName = ("transfer_errors_" + strftime("%Y-%m-%d_%H%M%S", localtime(time())) + ".csv")
@@ -196,6 +213,7 @@ def defineCommandLineOptions():
     argParser.add_argument('-f', '--file', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file to be used with the -f option.')
     argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
     argParser.add_argument('-m', '--move', action='store_true', help='Enable this option to move the files instead of copying them.')
+    argParser.add_argument('-o', '--outbox', nargs=1, default=False, metavar='OUTBOXPATH', help='OUTBOXPATH is the path to the file the records are written to while the catalog is down or slow. Defaults to "{}".'.format(globalvars.outboxFileName))
 
     return argParser
 
@@ -211,6 +229,9 @@ def parseCommandLineArgs(argParser, args):
     globalvars.quietMode = parsedArgs.quiet
     globalvars.move = parsedArgs.move
 
+    if parsedArgs.outbox:
+        globalvars.outboxFileName = parsedArgs.outbox[0]
+
     if parsedArgs.file:
         globalvars.batchMode = True
         globalvars.csvFile = parsedArgs.file[0]
@@ -270,7 +291,11 @@ def transferFiles(src, dst, arrangementInfo):
         prevHighestSerialNo = 0  # Initialize the serial number to 1, since this
                           # destination directory has just been created.
     else:
-        prevHighestSerialNo = getHighestSerialNo(srcDirectory)
+        prevHighestSerialNo = getStoredHighestSerialNo(srcDirectory)
+        if prevHighestSerialNo == None:
+            returnData['status'] = False
+            returnData['comment'] = "The catalog is unavailable, and the serial numbers of the files of '{}' are unknown.".format(srcDirectory)
+            return returnData
 
     print_info("Previous highest file serial number: {}".format(prevHighestSerialNo))
 
@@ -302,8 +327,7 @@ def transferFiles(src, dst, arrangementInfo):
             recordParams = {}
             recordParams["fileName"] = fileName
             recordParams["fileSize"] = os.path.getsize(fileName)
-            recordParams["fmtName"] = getFileFormatName(srcFileName)
-            recordParams["fmtVer"] = getFileFormatVersion(srcFileName)
+            recordParams["fmtName"], recordParams["fmtVer"] = identifyFileFormat(fileName)
             recordParams[globalvars.ARRANGEMENT_INFO_LABEL] = arrangementInfo
 
             metadataRecord = initMetadataRecord(recordParams)
@@ -399,13 +423,11 @@ def transferFiles(src, dst, arrangementInfo):
                 accessionEvent = createAccessionEvent()
                 metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.evt_parent_entity.name].append(accessionEvent)
                 # Insert the record into the DB first, and THEN copy/move the file.
-                dbRetValue = insertRecordInDB(metadataRecord)
-
-                if dbRetValue != uniqueId:
-                    print_error("DB Insert operation not successful. Unique ID returned by DB does not match the one provided by the script. Exiting.")
-                    returnData['status'] = False
-                    returnData['comment'] = "DB Insert operation not successful."
-                    return(returnData)
+                # If the DB is down, or slow, the record is written to the outbox,
+                # and counted in the arrangement summary once synced.
+                if storeRecord(metadataRecord) == True:
+                    addSummaryDelta(metadataRecord[globalvars.labels.admn_entity.name][globalvars.labels.arrangement.name],
+                                    recordParams["fileSize"], recordParams["fmtName"])
 
                 if globalvars.move == True:
                     try:
@@ -48,6 +48,8 @@ from metadatautilspkg.globalvars import *
 from metadatautilspkg.errorcodes import *
 from metadatautilspkg.dbfunctions import *
 from metadatautilspkg.metadatautils import *
+from metadatautilspkg.arrangementsummary import *
+from metadatautilspkg.compliancemetadatautils import getDisposedField
 
 def main():
 
@@ -140,6 +142,26 @@ def main():
         # function to store the data in csv
         adminStatus = adminRecord(arrangementInfo)
 
+        if adminStatus['status'] != True:
+            # Add this row to the list globalvars.adminerrorList, with the
+            # reason it could not be processed, and move on to the next row.
+            globalvars.adminerrorList.append(row + [adminStatus['comment']])
+
+    flushSummaryDeltas()
+
+    # REBUILD THE ARRANGEMENT SUMMARY
+    if globalvars.rebuildSummaryMode == True:
+        print_info("Rebuilding the arrangement summary in the collection '{}'".format(globalvars.dbSummaryCollection))
+        rebuildSummary({getDisposedField() : {'$exists' : True}})
+
+    # PRINT THE ARRANGEMENT SUMMARY
+    if globalvars.summaryPath != None:
+        printSummary(globalvars.summaryPath)
+
+    # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
+    if len(globalvars.adminerrorList) > 1:
+        errorCSV()
+
 def errorCSV():
     # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
     if len(globalvars.adminerrorList) > 0:
@@ -165,6 +187,8 @@ def defineCommandLineOptions():
     argParser = argparse.ArgumentParser(description="Migrate Files for Preservation")
     argParser.add_argument('-f', '--file', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file to be used with the -f option.')
     argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
+    argParser.add_argument('-s', '--summary', nargs='?', const="", default=None, metavar='PATH', help='Print the no. of records, total size and formats of the arrangement PATH (e.g., 3/12 for sub-series 12 of series 3), and of each of its children. The whole collection if PATH is not given.')
+    argParser.add_argument('--rebuildsummary', action='store_true', help='Enable this option to rebuild the arrangement summary from all the records.')
     return argParser
 
 def parseCommandLineArgs(argParser, args):
@@ -177,9 +201,14 @@ def parseCommandLineArgs(argParser, args):
 
     globalvars.quietMode = parsedArgs.quiet
 
+    globalvars.summaryPath = parsedArgs.summary
+    globalvars.rebuildSummaryMode = parsedArgs.rebuildsummary
+
     if parsedArgs.file:
         globalvars.batchMode = True
         globalvars.csvFile = parsedArgs.file[0]
+    elif globalvars.summaryPath != None or globalvars.rebuildSummaryMode == True:
+        globalvars.batchMode = False
     else:
         print_error(errorcodes.ERROR_FILE_ARGUMENT["message"])
         globalvars.adminerrorList.append([errorcodes.ERROR_FILE_ARGUMENT["message"]])
@@ -187,46 +216,77 @@ def parseCommandLineArgs(argParser, args):
         exit(errorcodes.ERROR_FILE_ARGUMENT["code"])
 
 def adminRecord(arrangementInfo):
-    """adminRecord(): Adds the admin details to the existing record.
+    """adminRecord(): Adds the admin details to the existing records.
 
     Arguments:
         [1] arrangementInfo: dictionary containing the details to be added to the record.
 
+    The details are merged into the arrangement of all the records matching the
+    labels, that miss at least one of the details, with a single update on the
+    database server.
+
+    Returns:
+        A dictionary with a 'status' (True or False) and a 'comment' describing the
+        outcome.
     """
+    returnData = {}
+
+    arrangementField = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name])
+
     # query the databse with the label values read from the csv.
     query = []
     for label in arrangementInfo:
         if 'Label' in label:
-            query.append({".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name, label]) : arrangementInfo[label]})
+            query.append({".".join([arrangementField, label]) : arrangementInfo[label]})
 
-    records = globalvars.dbHandle[globalvars.dbCollection].find({'$and' : query})
-    records = [record for record in records]
+    # Records that have all the details already are left untouched.
+    missingQuery = [{".".join([arrangementField, key]) : {'$exists' : False}} for key in arrangementInfo if 'Label' not in key]
+    if len(missingQuery) == 0:
+        missingQuery = [{'_id' : {'$exists' : False}}]
 
-    if(len(records) > 0):
-        for document in records:
-            id = document['_id']
+    arrangementUpdate = {".".join([arrangementField, key]) : arrangementInfo[key] for key in arrangementInfo}
 
-            for keys in arrangementInfo:
-                if keys in document['admin']['arrangement']:
-                    flag = True
-                else:
-                    flag = False
-                    print_info("The following record has been initialized: {}".format(arrangementInfo))
-                    document['admin']['arrangement'].update(arrangementInfo)
-                    dbUpdatePremisProfile = updateRecordInDB(id, document)
-                    break
-
-            if flag == True:
-                globalvars.adminerrorList.append([errorcodes.ERROR_ADMIN_UPDATED["message"]])
-                print_error(errorcodes.ERROR_ADMIN_UPDATED["message"])
-                errorCSV()
-                exit(errorcodes.ERROR_ADMIN_UPDATED["code"])
+    dbUpdateResult = updateRecordsInDB({'$and' : query + [{'$or' : missingQuery}]}, arrangementUpdate, [])
 
-    else:
-        globalvars.adminerrorList.append([errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"]])
-        print_error(errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"])
-        errorCSV()
+    if dbUpdateResult == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+        returnData['status'] = False
+        returnData['comment'] = errorcodes.ERROR_CANNOT_UPDATE_DB["message"]
+        return returnData
+
+    if dbUpdateResult.matched_count == 0:
+        if globalvars.dbHandle[globalvars.dbCollection].find_one({'$and' : query}, {'_id' : 1}) != None:
+            print_error(errorcodes.ERROR_ADMIN_UPDATED["message"])
+            returnData['comment'] = errorcodes.ERROR_ADMIN_UPDATED["message"]
+        else:
+            print_error(errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"].format(arrangementInfo))
+            returnData['comment'] = errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"].format(arrangementInfo)
+        returnData['status'] = False
+        return returnData
+
+    print_info("The following details have been added to {} records: {}".format(dbUpdateResult.modified_count, arrangementInfo))
+    setSummaryNames(arrangementInfo)
+
+    returnData['status'] = True
+    returnData['comment'] = "Successfully completed process"
+    return returnData
+
+def printSummary(summaryPath):
+    """printSummary(): Prints the arrangement summary of a series, sub-series, etc.
+
+    Arguments:
+        [1] summaryPath: labels of the arrangement, from the series down, separated by '/'.
+
+    """
+    labelList = [label for label in summaryPath.split('/') if label != ""]
+    node, children = getSummaryNode(labelList)
+
+    if node == None:
+        print_error(errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"].format(summaryPath))
         exit(errorcodes.ERROR_CANNOT_FIND_DOCUMENT["code"])
 
+    print(json.dumps(node, indent=4, sort_keys=True))
+    for child in sorted(children, key=lambda child: child['_id']):
+        print("{}: {} records, {} bytes".format("/".join(json.loads(child['_id'])), child.get('count', 0), child.get('size', 0)))
+
 if __name__ == "__main__":
     main()
@@ -150,6 +150,14 @@ def main():
             globalvars.complianceErrorList.append(row + [processStatus['comment']])
             errorCSV()
 
+    # COMPUTE THE MISSING DISPOSITION DUE DATES
+    if globalvars.backfillMode == True:
+        backfillDueDates()
+
+    # REPORT THE RECORDS DUE FOR DISPOSITION
+    if globalvars.reportMode == True:
+        dispositionReport()
+
 # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
 def errorCSV():
     # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
@@ -176,6 +184,11 @@ def defineCommandLineOptions():
     argParser = argparse.ArgumentParser(description="Add Compliance Information to documents")
     argParser.add_argument('-f', '--file', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file to be used with the -f option.')
     argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
+    argParser.add_argument('-r', '--report', action='store_true', help='Enable this option to write a CSV report of the records due for disposition.')
+    argParser.add_argument('--from', nargs=1, default=False, dest='duefrom', metavar='DATE', help='Report only the records due on or after DATE. By default, all overdue records are reported.')
+    argParser.add_argument('--to', nargs=1, default=False, dest='dueto', metavar='DATE', help='Report only the records due on or before DATE. Defaults to today.')
+    argParser.add_argument('--series', nargs=1, default=False, metavar='SERIES', help='Report only the records of the series SERIES.')
+    argParser.add_argument('-b', '--backfill', action='store_true', help='Enable this option to compute the disposition due dates of the records that have a compliance profile, but no due date.')
 
     return argParser
 
@@ -195,6 +208,149 @@ def parseCommandLineArgs(argParser, args):
     else:
         globalvars.batchMode = False
 
+    globalvars.reportMode = parsedArgs.report
+    globalvars.backfillMode = parsedArgs.backfill
+
+    if parsedArgs.duefrom:
+        globalvars.dueFrom = parseDateArg(parsedArgs.duefrom[0])
+
+    if parsedArgs.dueto:
+        globalvars.dueTo = parseDateArg(parsedArgs.dueto[0])
+    else:
+        globalvars.dueTo = datetime.combine(datetime.now().date(), datetime.min.time())
+
+    if parsedArgs.series:
+        globalvars.dueSeries = parsedArgs.series[0]
+
+def parseDateArg(value):
+    dateValue = parseComplianceDate(value)
+
+    if dateValue == None:
+        print_error(errorcodes.ERROR_INVALID_DATE["message"].format(value))
+        exit(errorcodes.ERROR_INVALID_DATE["code"])
+
+    return dateValue
+
+def backfillDueDates():
+    """backfillDueDates(): Computes the disposition due dates of the records that do not have one
+
+    Arguments:
+        None
+
+    Records sharing a retention duration and effective date share the due date, so
+    the distinct pairs are looked up first, and each pair is then set with a single
+    update on the database server. Records whose due date cannot be computed (e.g.,
+    a "Permanent" retention) get a due date of None, and are not reported.
+    """
+    retentionField = ".".join([globalvars.labels.com_entity.name, globalvars.labels.com_retention_schedule.name])
+    durationField = ".".join([retentionField, globalvars.labels.com_rt_duration.name])
+    effDateField = ".".join([retentionField, globalvars.labels.com_eff_date.name])
+
+    missingQuery = {globalvars.labels.com_entity.name : {'$exists' : True}, getDueDateField() : {'$exists' : False}}
+    pairs = globalvars.dbHandle[globalvars.dbCollection].aggregate([{'$match' : missingQuery},
+                                                                    {'$group' : {'_id' : {'duration' : '$' + durationField, 'effectiveDate' : '$' + effDateField}}}])
+
+    numUpdated = 0
+    for pair in pairs:
+        duration = pair['_id'].get('duration')
+        effectiveDate = pair['_id'].get('effectiveDate')
+        dueDate = getDispositionDueDate(duration, effectiveDate)
+
+        pairQuery = dict(missingQuery)
+        pairQuery[durationField] = duration
+        pairQuery[effDateField] = effectiveDate
+
+        dbUpdateResult = updateRecordsInDB(pairQuery, {getDueDateField() : dueDate}, [])
+        if dbUpdateResult == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+            continue
+
+        print_info("Due date {} set on {} records (retention '{}' from '{}')".format(dueDate, dbUpdateResult.modified_count, duration, effectiveDate))
+        numUpdated += dbUpdateResult.modified_count
+
+    print_info("Disposition due dates computed for {} records".format(numUpdated))
+
+def dispositionReport():
+    """dispositionReport(): Writes a CSV report of the records due for disposition
+
+    Arguments:
+        None
+
+    The records due between globalvars.dueFrom and globalvars.dueTo (inclusive),
+    optionally restricted to the series globalvars.dueSeries, are looked up on the
+    indexed due date, in due date order. Records that have been disposed of already
+    are left out.
+    """
+    query = getDispositionDueQuery(globalvars.dueFrom, globalvars.dueTo, globalvars.dueSeries)
+
+    arrangementField = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name])
+    dispositionField = ".".join([globalvars.labels.com_entity.name, globalvars.labels.com_disposition.name])
+    methodField = ".".join([dispositionField, globalvars.labels.com_disp_method.name])
+    projection = {arrangementField : 1, methodField : 1, getDueDateField() : 1}
+
+    records = getReadCollection(globalvars.dbCollection).find(query, projection).sort(getDueDateField(), 1)
+
+    reportCSVFileName = ("disposition_due_" + strftime("%Y-%m-%d_%H%M%S", localtime(time())) + ".csv")
+
+    try:
+        reportCSVFileHandle = open(reportCSVFileName, 'w')
+    except IOError as ioErrorCsvWrite:
+        print_error(ioErrorCsvWrite)
+        print_error(errorcodes.ERROR_CANNOT_WRITE_CSV_FILE["message"])
+        exit (errorcodes.ERROR_CANNOT_WRITE_CSV_FILE["code"])
+
+    csvWriter = csv.writer(reportCSVFileHandle, delimiter=',', quotechar='"', lineterminator='\n')
+    csvWriter.writerow(["id", "arrangement", "dueDate", "method"])
+
+    numRecords = 0
+    for record in records:
+        arrangement = record.get(globalvars.labels.admn_entity.name, {}).get(globalvars.labels.arrangement.name, {})
+        disposition = record[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name]
+        csvWriter.writerow([record['_id'], json.dumps(arrangement, sort_keys=True),
+                            disposition[globalvars.labels.com_disp_due.name].strftime("%Y-%m-%d"),
+                            disposition.get(globalvars.labels.com_disp_method.name, "")])
+        numRecords += 1
+
+    reportCSVFileHandle.close()
+    print_info("{} records due for disposition have been written to the following file: {}.".format(numRecords, reportCSVFileName))
+
+def getComplianceRecord(Complianceinfo):
+    """getComplianceRecord(): Builds the compliance profile from the compliance information of a CSV row
+
+    Arguments:
+        [1] compliance information that needs to be added for a series/sub-series.
+
+    Returns:
+        The compliance profile, to be set on the records of the series/sub-series.
+    """
+    metadataRecord = createComplianceProfile()
+
+    complianceEntity = metadataRecord[globalvars.labels.com_entity.name]
+    retentionSchedule = complianceEntity[globalvars.labels.com_retention_schedule.name]
+    disposition = complianceEntity[globalvars.labels.com_disposition.name]
+
+    complianceEntity[globalvars.labels.com_record_type.name] = Complianceinfo["recordTypeLabel"]
+
+    retentionSchedule[globalvars.labels.com_authority.name][globalvars.labels.com_auth_name.name] = Complianceinfo["retentionSchedule-authority-nameLabel"]
+    retentionSchedule[globalvars.labels.com_authority.name][globalvars.labels.com_auth_url.name] = Complianceinfo["retentionSchedule-authority-urlLabel"]
+    retentionSchedule[globalvars.labels.com_authority.name][globalvars.labels.com_auth_aff.name] = Complianceinfo["retentionSchedule-authority-affiliationLabel"]
+    retentionSchedule[globalvars.labels.com_rt_init_event.name] = Complianceinfo["retentionSchedule-initiatingEventLabel"]
+    retentionSchedule[globalvars.labels.com_rt_duration.name] = Complianceinfo["retentionSchedule-durationLabel"]
+    retentionSchedule[globalvars.labels.com_url.name] = Complianceinfo["retentionSchedule-urlLabel"]
+    retentionSchedule[globalvars.labels.com_eff_date.name] = Complianceinfo["retentionSchedule-effectiveDateLabel"]
+
+    disposition[globalvars.labels.com_authority.name][globalvars.labels.com_auth_name.name] = Complianceinfo["disposition-authority-nameLabel"]
+    disposition[globalvars.labels.com_authority.name][globalvars.labels.com_auth_url.name] = Complianceinfo["disposition-authority-urlLabel"]
+    disposition[globalvars.labels.com_authority.name][globalvars.labels.com_auth_aff.name] = Complianceinfo["disposition-authority-affiliationLabel"]
+    disposition[globalvars.labels.com_disp_method.name] = Complianceinfo["disposition-methodLabel"]
+    disposition[globalvars.labels.com_url.name] = Complianceinfo["disposition-urlLabel"]
+    disposition[globalvars.labels.com_eff_date.name] = Complianceinfo["disposition-effectiveDateLabel"]
+    disposition[globalvars.labels.com_disp_due.name] = getDispositionDueDate(retentionSchedule[globalvars.labels.com_rt_duration.name],
+                                                                         retentionSchedule[globalvars.labels.com_eff_date.name])
+
+    complianceEntity[globalvars.labels.com_access.name][globalvars.labels.com_access_demo.name] = Complianceinfo["access-demographicLabel"]
+
+    return metadataRecord
+
 def processRecord(arrangementInfo, Complianceinfo):
     """processRecord(): Builds the metadata profile and updates the DB
 
@@ -202,6 +358,10 @@ def processRecord(arrangementInfo, Complianceinfo):
         [1] arrangementInfo for querying purpose;
         [2] compliance information that needs to be added for that record.
 
+    The compliance profile is set, and the metadata modification event appended,
+    on all the records of the series/sub-series that do not have a compliance
+    profile yet, with a single update on the database server.
+
     Returns:
         True:
         False:
@@ -219,75 +379,39 @@ def processRecord(arrangementInfo, Complianceinfo):
             if 'Label' in label:
                 query.append({".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name, label]) : arrangementInfo[label]})
 
-        records = globalvars.dbHandle[globalvars.dbCollection].find({'$and' : query})
-        records = [record for record in records]
-
-        if(len(records) != 0):
-            for rec in records:
-                if "compliance" in rec:
-                    print_error(errorcodes.ERROR_COM_UPDATED["message"])
-                    globalvars.complianceErrorList.append([errorcodes.ERROR_COM_UPDATED["message"]])
-                    errorFlag = True
-
-                elif "_id" in rec:
-                    errorFlag = False
-                    id = rec['_id']
-
-                    metadataRecord = createComplianceProfile()
-
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_record_type.name] = Complianceinfo["recordTypeLabel"]
-
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_authority.name][globalvars.labels.com_auth_name.name] = Complianceinfo["retentionSchedule-authority-nameLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_authority.name][globalvars.labels.com_auth_url.name] = Complianceinfo["retentionSchedule-authority-urlLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_authority.name][globalvars.labels.com_auth_aff.name] = Complianceinfo["retentionSchedule-authority-affiliationLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_rt_init_event.name] = Complianceinfo["retentionSchedule-initiatingEventLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_rt_duration.name] = Complianceinfo["retentionSchedule-durationLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_url.name] = Complianceinfo["retentionSchedule-urlLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_retention_schedule.name][globalvars.labels.com_eff_date.name] = Complianceinfo["retentionSchedule-effectiveDateLabel"]
-
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_authority.name][globalvars.labels.com_auth_name.name] = Complianceinfo["disposition-authority-nameLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_authority.name][globalvars.labels.com_auth_url.name] = Complianceinfo["disposition-authority-urlLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_authority.name][globalvars.labels.com_auth_aff.name] = Complianceinfo["disposition-authority-affiliationLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_disp_method.name] = Complianceinfo["disposition-methodLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_url.name] = Complianceinfo["disposition-urlLabel"]
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_eff_date.name] = Complianceinfo["disposition-effectiveDateLabel"]
+        metadataRecord = getComplianceRecord(Complianceinfo)
 
-                    metadataRecord[globalvars.labels.com_entity.name][globalvars.labels.com_access.name][globalvars.labels.com_access_demo.name] = Complianceinfo["access-demographicLabel"]
+        before = {}
+        metadataModification = createMetadataModificationEvent(before, metadataRecord)
 
-                    before = ""
-                    metadataModification = createMetadataModificationEvent(before, metadataRecord)
-                    rec['premis']['eventList'].append(metadataModification)
-                    dbUpdatePremisProfile = updateRecordInDB(id, rec)
+        # Records that already have a compliance profile are left untouched.
+        updateQuery = {'$and' : query + [{globalvars.labels.com_entity.name : {'$exists' : False}}]}
+        dbUpdateResult = updateRecordsInDB(updateQuery, metadataRecord, [metadataModification])
 
-                    print_info("The following record has been initialized: {}".format(metadataRecord))
-
-                    dbUpdateComProfile = updateRecordInDB(id, metadataRecord)
-
-                else:
-                    print_error("Cannot complete process for '{}', and '{}'".format(series, subseries))
-                    returnData['status'] = False
-                    commentString = "Process is not completed"
-                    returnData['comment'] = commentString
-                    return returnData  # Something went wrong, return False
+        if dbUpdateResult == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+            print_error("Cannot complete process for '{}'".format(arrangementInfo))
+            returnData['status'] = False
+            returnData['comment'] = errorcodes.ERROR_CANNOT_UPDATE_DB["message"]
+            return returnData  # Something went wrong, return False
 
-        else:
-            print_error("Cannot complete process for '{}', and '{}'".format(series, subseries))
+        if dbUpdateResult.matched_count == 0:
+            if globalvars.dbHandle[globalvars.dbCollection].find_one({'$and' : query}, {'_id' : 1}) != None:
+                print_error(errorcodes.ERROR_COM_UPDATED["message"])
+                commentString = errorcodes.ERROR_COM_UPDATED["message"]
+            else:
+                print_error("Cannot complete process for '{}'".format(arrangementInfo))
+                commentString = "No records found"
             returnData['status'] = False
-            commentString = "Process is not completed"
             returnData['comment'] = commentString
             return returnData  # Something went wrong, return False
 
-        if errorFlag == True:
-            errorCSV()
-        else:
-            errorFlag = False
+        print_info("The compliance profile has been added to {} records: {}".format(dbUpdateResult.modified_count, metadataRecord))
 
     except Exception as shutilException:  # Catching top-level exception to simplify the code.
         print_error(shutilException)
-        print_error("Cannot complete process for '{}', and '{}'".format(series, subseries))
-        print_error(shutilException)
+        print_error("Cannot complete process for '{}'".format(arrangementInfo))
         returnData['status'] = False
-        commentString = "Error: " + shutilException
+        commentString = "Error: " + str(shutilException)
         returnData['comment'] = commentString
         return returnData  # Something went wrong, return False
 
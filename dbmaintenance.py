@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+#
+# DETAILS:
+# File Name: dbmaintenance.py
+# Description: This file contains source code for the maintenance of the database:
+#              the creation and verification of the indexes the workflows need,
+#              the check of the query plans of the workflow queries, and the sync
+#              of the records accession.py wrote to the outbox while the catalog
+#              was down.
+#
+# IMPORT NEEDED MODULES
+import sys
+
+from metadatautilspkg.globalvars import *
+from metadatautilspkg.errorcodes import *
+from metadatautilspkg.dbfunctions import *
+from metadatautilspkg.metadatautils import *
+from metadatautilspkg.outbox import syncOutbox
+
+def main():
+    argParser = defineCommandLineOptions()
+    parseCommandLineArgs(argParser, sys.argv[1:])
+
+    print_info("quiet mode: ", globalvars.quietMode)
+
+    # CREATE DATABASE CONNECTION
+    # The labels are read after connecting, so that init_db() does not provision
+    # the indexes itself.
+    dbParams = init_db()
+    globalvars.dbHandle = dbParams["handle"]
+    globalvars.dbCollection = dbParams["collection_name"]
+
+    # READ-IN THE LABEL DICTIONARY
+    globalvars.labels = readLabelDictionary()
+
+    # READ-IN THE CONTROLLED VOCABULARY
+    globalvars.vocab = readControlledVocabulary()
+
+    missingIndexes = ensureIndexes(globalvars.createIndexes)
+    if len(missingIndexes) == 0:
+        print_info("All the indexes are in place.")
+
+    if globalvars.explainQueries == True:
+        for collectionName, query, description in getWorkflowQueries():
+            checkQueryPlan(collectionName, query, description)
+
+    if globalvars.syncMode == True:
+        numSynced = syncOutbox()
+        if numSynced == errorcodes.ERROR_CANNOT_INSERT_INTO_DB["code"]:
+            exit(numSynced)
+        print_info("{} records synced from the outbox '{}'".format(numSynced, globalvars.outboxFileName))
+
+    if len(missingIndexes) > 0:
+        exit(errorcodes.ERROR_MISSING_INDEXES["code"])
+
+def defineCommandLineOptions():
+    #PARSE AND VALIDATE COMMAND-LINE OPTIONS
+    argParser = argparse.ArgumentParser(description="Maintain the Database Indexes, and Sync the Outbox")
+    argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
+    argParser.add_argument('-c', '--create', action='store_true', help='Enable this option to create the missing indexes. By default, the missing indexes are only reported.')
+    argParser.add_argument('-x', '--explain', action='store_true', help='Enable this option to check that the workflow queries use the indexes, and warn about those that scan the whole collection.')
+    argParser.add_argument('-s', '--sync', action='store_true', help='Enable this option to send the records of the outbox, written by accession.py while the catalog was down or slow, to the catalog.')
+    argParser.add_argument('-o', '--outbox', nargs=1, default=False, metavar='OUTBOXPATH', help='OUTBOXPATH is the path to the outbox file. Defaults to "{}".'.format(globalvars.outboxFileName))
+    return argParser
+
+def parseCommandLineArgs(argParser, args):
+    parsedArgs = argParser.parse_args(args)
+
+    globalvars.quietMode = parsedArgs.quiet
+    globalvars.createIndexes = parsedArgs.create
+    globalvars.explainQueries = parsedArgs.explain
+    globalvars.syncMode = parsedArgs.sync
+
+    if parsedArgs.outbox:
+        globalvars.outboxFileName = parsedArgs.outbox[0]
+
+if __name__ == "__main__":
+    main()
@@ -44,58 +44,33 @@ import os
 
 from datetime import datetime
 from time import localtime, time, strftime
-from subprocess import PIPE, Popen
 
 from metadatautilspkg.globalvars import *
 from metadatautilspkg.errorcodes import *
 from metadatautilspkg.dbfunctions import *
 from metadatautilspkg.premis import *
 from metadatautilspkg.metadatautils import *
+from metadatautilspkg.cmdrunner import *
+from metadatautilspkg.envcache import getImageMagickVersion
+from metadatautilspkg.quarantine import *
+from metadatautilspkg.derivativeutils import *
 
 def main():
 
-    # Verify whether ImageMagick is installed in the system or not. Throws error if ImageMagick is not installed.
-    output, error, exitcode = runCmd('identify -version')
-    imgversion = output.decode('utf-8').split('\n')
+    argParser = defineCommandLineOptions()
+    parseCommandLineArgs(argParser, sys.argv[1:])
 
-    # remove null values from the list
-    while '' in imgversion:
-        imgversion.remove('')
+    print_info("quiet mode: ", globalvars.quietMode)
 
-    imgver = []
-    for str in imgversion:
-            if ': ' in str:
-                imgver.append(str)
-            else:
-                globalvars.derivativeErrorList.append([errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"]])
-                print_error(errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"])
-                errorCSV()
-                exit(errorcodes.ERROR_INSTALL_IMAGEMAGICK["code"])
-
-    version = {}
-    for item in imgver:
-        key, value = item.split(": ")
-        key = key.strip(" ")
-        value = value.strip(" ")
-        version[key] = value
-
-    if 'Version' in version:
-        ver = version['Version']
-        if 'ImageMagick' not in ver:
-            globalvars.derivativeErrorList.append([errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"]])
-            print_error(errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"])
-            errorCSV()
-            exit(errorcodes.ERROR_INSTALL_IMAGEMAGICK["code"])
-    else:
+    # Verify whether ImageMagick is installed in the system or not. Throws error if ImageMagick is not installed.
+    ver = getImageMagickVersion()
+    if ver == None:
         globalvars.derivativeErrorList.append([errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"]])
         print_error(errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"])
         errorCSV()
         exit(errorcodes.ERROR_INSTALL_IMAGEMAGICK["code"])
 
-    argParser = defineCommandLineOptions()
-    parseCommandLineArgs(argParser, sys.argv[1:])
-
-    print_info("quiet mode: ", globalvars.quietMode)
+    readQuarantineList()
 
     if globalvars.batchMode == True:  # Batch mode. Read and validate CSV file.
     # Read CSV file contents into globalvars.technicalList.
@@ -147,19 +122,28 @@ def main():
     globalvars.dbHandle = dbParams["handle"]
     globalvars.dbCollection = dbParams["collection_name"]
 
+    printDerivativeParams()
+
     # PROCESS ALL RECORDS
-    for row in globalvars.derivativeList:
+    if globalvars.catalogMode == True:
+        derivativeCatalogRecords([row[0] for row in globalvars.derivativeList])
+    else:
+        for row in globalvars.derivativeList:
+            filePath = row[0]
+            print_info("filepath Info Data: {}".format(filePath))
 
-        filePath = row[0]
-        print_info("filepath Info Data: {}".format(filePath))
+            if os.path.isdir(filePath) != True:
+                globalvars.technicalErrorList.append([errorcodes.ERROR_CANNOT_FIND_DIRECTORY["message"].format(filePath)])
+                print_error(errorcodes.ERROR_CANNOT_FIND_DIRECTORY["message"].format(filePath))
+                errorCSV()
+                exit(errorcodes.ERROR_CANNOT_FIND_DIRECTORY["code"])
+            else:
+                derivativeFile = derivativeRecord(filePath)
 
-        if os.path.isdir(filePath) != True:
-            globalvars.technicalErrorList.append([errorcodes.ERROR_CANNOT_FIND_DIRECTORY["message"].format(filePath)])
-            print_error(errorcodes.ERROR_CANNOT_FIND_DIRECTORY["message"].format(filePath))
-            errorCSV()
-            exit(errorcodes.ERROR_CANNOT_FIND_DIRECTORY["code"])
-        else:
-            derivativeFile = derivativeRecord(filePath)
+    closeRenderPool()
+
+    # WRITE ALL FILES THAT COULD NOT BE PROCESSED TO A CSV FILE
+    errorCSV()
 
 def errorCSV():
     # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
@@ -186,9 +170,19 @@ def defineCommandLineOptions():
     argParser = argparse.ArgumentParser(description="Migrate Files for Preservation")
     argParser.add_argument('-f', '--file', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file to be used with the -f option.')
     argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
-    argParser.add_argument('-s', '--sourcefiletype', nargs=1, default=False, metavar='SOURCEFILETYPE', help='CSVPATH is the path to the CSV file to be used with the -f option.')
-    argParser.add_argument('-c', '--destfiletype', nargs=1, default=False, metavar='DESTFILETYPE', help='Enable this option to suppress all logging, except critical error messages.')
-    argParser.add_argument('-r', '--resize', nargs=1, default=False, metavar='RESIZEDIM', help='CSVPATH is the path to the CSV file to be used with the -f option.')
+    argParser.add_argument('-d', '--catalog', action='store_true', help='Enable this option to select the files from the database instead of walking the directories: the image files of SOURCEFILETYPE with a technical profile which lack a migration event for at least one of the requested derivatives. Derivatives that are up to date are skipped, as with -i. With -f, only the files under the directories in the CSV file are processed.')
+    argParser.add_argument('-i', '--incremental', action='store_true', help='Enable this option to skip derivatives that already exist, are newer than their source file and were generated with the same parameters, and regenerate the others, instead of stopping at the first existing derivative.')
+    argParser.add_argument('-s', '--sourcefiletype', nargs=1, default=False, metavar='SOURCEFILETYPE', help='SOURCEFILETYPE is the filetype of the source files (e.g., tif). With -d, only the files with this extension are processed.')
+    argParser.add_argument('-c', '--destfiletype', nargs=1, default=False, metavar='DESTFILETYPE', help='DESTFILETYPE is the filetype of the derivatives, or a comma-separated list of filetypes (e.g., jpg,png). "dzi" generates a deep zoom pyramid of tiles at full resolution.')
+    argParser.add_argument('-r', '--resize', nargs=1, default=False, metavar='RESIZEDIM', help='RESIZEDIM is the size of the derivatives, or a comma-separated list of sizes (e.g., 64,300,1200). All the sizes are generated from a single decode of each file.')
+    argParser.add_argument('--tilesize', nargs=1, type=int, default=False, metavar='PIXELS', help='Size of the tiles of the deep zoom pyramids generated with "-c dzi". Default: {}.'.format(globalvars.tileSize))
+    argParser.add_argument('--tileformat', nargs=1, default=False, metavar='TILEFILETYPE', help='Filetype of the tiles of the deep zoom pyramids generated with "-c dzi". Default: {}.'.format(globalvars.tileFileType))
+    argParser.add_argument('--quality', nargs=1, type=int, default=False, metavar='QUALITY', help='QUALITY (1-100) of lossy derivative formats such as JPEG and WebP. Default: {}.'.format(globalvars.quality))
+    argParser.add_argument('-t', '--timeout', nargs=1, type=int, default=False, metavar='SECONDS', help='Kill the external command run on a file after SECONDS seconds, and quarantine the file. 0 disables the timeout. Default: {}.'.format(globalvars.cmdTimeout))
+    argParser.add_argument('--maxmemory', nargs=1, type=int, default=False, metavar='MB', help='Limit the memory of the external command run on a file to MB megabytes.')
+    argParser.add_argument('--maxcputime', nargs=1, type=int, default=False, metavar='SECONDS', help='Limit the CPU time of the external command run on a file to SECONDS seconds.')
+    argParser.add_argument('-w', '--workers', nargs=1, type=int, default=False, metavar='NUMWORKERS', help='Run the external command on up to NUMWORKERS files in parallel. Default: no. of CPUs ({}).'.format(globalvars.numWorkers))
+    argParser.add_argument('--quarantinefile', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file listing quarantined files. Default: {}.'.format(globalvars.quarantineFileName))
     return argParser
 
 def parseCommandLineArgs(argParser, args):
@@ -200,11 +194,30 @@ def parseCommandLineArgs(argParser, args):
         exit(errorcodes.ERROR_INVALID_ARGUMENT_STRING["code"])
 
     globalvars.quietMode = parsedArgs.quiet
+    globalvars.incrementalMode = parsedArgs.incremental
+    globalvars.catalogMode = parsedArgs.catalog
+
+    if parsedArgs.quality:
+        globalvars.quality = parsedArgs.quality[0]
+    if parsedArgs.tilesize:
+        globalvars.tileSize = parsedArgs.tilesize[0]
+    if parsedArgs.tileformat:
+        globalvars.tileFileType = parsedArgs.tileformat[0]
+    if parsedArgs.timeout:
+        globalvars.cmdTimeout = parsedArgs.timeout[0]
+    if parsedArgs.maxmemory:
+        globalvars.cmdMaxMemory = parsedArgs.maxmemory[0]
+    if parsedArgs.maxcputime:
+        globalvars.cmdMaxCpuTime = parsedArgs.maxcputime[0]
+    if parsedArgs.workers:
+        globalvars.numWorkers = parsedArgs.workers[0]
+    if parsedArgs.quarantinefile:
+        globalvars.quarantineFileName = parsedArgs.quarantinefile[0]
 
     if parsedArgs.file:
         globalvars.batchMode = True
         globalvars.csvFile = parsedArgs.file[0]
-    else:
+    elif globalvars.catalogMode != True:
         print_error(errorcodes.ERROR_FILE_ARGUMENT["message"])
         globalvars.derivativeErrorList.append([errorcodes.ERROR_FILE_ARGUMENT["message"]])
         errorCSV()
@@ -226,27 +239,16 @@ def parseCommandLineArgs(argParser, args):
     if parsedArgs.resize:
         globalvars.resize = parsedArgs.resize[0]
 
+    globalvars.destfiletypeList = globalvars.destfiletype.split(",")
+    globalvars.resizeList = globalvars.resize.split(",")
+
     if((globalvars.destfiletype == "") and (globalvars.resize == "")):
         print_error(errorcodes.ERROR_DESTTYPE_RESIZE["message"])
         globalvars.derivativeErrorList.append([errorcodes.ERROR_DESTTYPE_RESIZE["message"]])
         errorCSV()
         exit(errorcodes.ERROR_DESTTYPE_RESIZE["code"])
 
-def runCmd(cmd):
-    """
-    This method runs a command and returns a list
-    with the contents of its stdout and stderr and
-    the exit code of the command.
-    """
-    shell_cmd = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=PIPE, close_fds=True)
-    (handleChildStdin,handleChildStdout,handleChildStderr) = (shell_cmd.stdin, shell_cmd.stdout, shell_cmd.stderr)
-    childStdout = handleChildStdout.read()
-    childStderr = handleChildStderr.read()
-    shell_cmd.wait()
-    return [childStdout, childStderr, shell_cmd.returncode]
-
-def derivativeRecord(filePath):
-
+def printDerivativeParams():
     if((globalvars.destfiletype == "")):
         print("Source filetype '{}' and re-dimension value '{}' as given by in the input command."
               .format(globalvars.sourcefiletype, globalvars.resize))
@@ -257,43 +259,242 @@ def derivativeRecord(filePath):
         print("Source filetype '{}', destination filetype '{}' and re-dimension value '{}' as given by in the input command."
               .format(globalvars.sourcefiletype, globalvars.destfiletype, globalvars.resize))
 
+    # Derivatives are rendered with Pillow, unless it is not installed or cannot write the destination filetype.
+    for destfiletype in globalvars.destfiletypeList:
+        globalvars.outputFormats[destfiletype] = getOutputFormat(destfiletype)
+        if globalvars.outputFormats[destfiletype] is None:
+            print_info("Pillow cannot write '{}' files, ImageMagick will be used to generate the derivatives.".format(destfiletype))
+
+        # Tile pyramids can only be written with Pillow.
+        if destfiletype.lower() == DZI_FILETYPE and (globalvars.outputFormats[destfiletype] is None or getOutputFormat(globalvars.tileFileType) is None):
+            print_error(errorcodes.ERROR_CANNOT_WRITE_TILES["message"].format(globalvars.tileFileType))
+            globalvars.derivativeErrorList.append([errorcodes.ERROR_CANNOT_WRITE_TILES["message"].format(globalvars.tileFileType)])
+            errorCSV()
+            exit(errorcodes.ERROR_CANNOT_WRITE_TILES["code"])
+
+def getDerivativeOutputs(queryName):
+    # One derivative for each size and destination filetype.
+    derOutputs = []
+    for destfiletype in globalvars.destfiletypeList:
+        if destfiletype.lower() == DZI_FILETYPE:
+            # A single tile pyramid, whatever the sizes requested.
+            tiling = "{}{}".format(globalvars.tileSize, globalvars.tileFileType)
+            derOutputs.append({"resize": "", "destfiletype": destfiletype, "format": globalvars.outputFormats[destfiletype],
+                               "quality": globalvars.quality, "derFileNameExt": ".".join([queryName, destfiletype]),
+                               "tileSize": globalvars.tileSize, "tileFileType": globalvars.tileFileType,
+                               "paramHash": getParamHash(destfiletype, "", globalvars.quality, tiling)})
+
+    for resize in globalvars.resizeList:
+        for destfiletype in globalvars.destfiletypeList:
+            if destfiletype.lower() == DZI_FILETYPE:
+                continue
+            derFileName = "_".join([queryName, resize])
+            derOutputs.append({"resize": resize, "destfiletype": destfiletype, "format": globalvars.outputFormats[destfiletype],
+                               "quality": globalvars.quality, "derFileNameExt": ".".join([derFileName, destfiletype]),
+                               "paramHash": getParamHash(destfiletype, resize, globalvars.quality)})
+
+    return derOutputs
+
+def getRecordFields():
+    # Only the image properties of the technical profile are needed from the records, and when
+    # up-to-date derivatives are skipped, the type and details of the events.
+    recordFields = [".".join([globalvars.labels.tech_entity.name, globalvars.labels.img_entity.name])]
+    if globalvars.incrementalMode == True or globalvars.catalogMode == True:
+        eventField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name, globalvars.labels.evt_entity.name])
+        recordFields += [".".join([eventField, globalvars.labels.evt_typ.name]), ".".join([eventField, globalvars.labels.evt_detail_parent.name])]
+
+    return recordFields
+
+def getDerivativeJob(document, fullPath, derOutputs, fileSet=None):
+    """getDerivativeJob(): Returns the render job generating the derivatives of a file, or
+    None if there is nothing to generate.
+
+    Arguments:
+        [1] document: record of the file.
+        [2] fullPath: path to the file.
+        [3] derOutputs: derivatives of the file, as returned by getDerivativeOutputs().
+        [4] fileSet: names of the files in the directory of the file, if already listed.
+    """
+    xRes = document['technical']['image']['xResolution']
+    yRes = document['technical']['image']['yResolution']
+    width = document['technical']['image']['width']
+    height = document['technical']['image']['length']
+
+    if isQuarantined(fullPath):
+        print_error(errorcodes.ERROR_FILE_QUARANTINED["message"].format(fullPath))
+        globalvars.derivativeErrorList.append([errorcodes.ERROR_FILE_QUARANTINED["message"].format(fullPath)])
+        return None
+
+    if globalvars.incrementalMode == True or globalvars.catalogMode == True:
+        migratedOutputs = getMigratedOutputs(document)
+        srcModTime = os.path.getmtime(fullPath)
+
+    jobOutputs = []
+    for derOutput in derOutputs:
+        if derOutput["format"] == DZI_FORMAT:
+            derRes = "{}x{}".format(width, height)  # Tile pyramids are at full resolution.
+        else:
+            derRes = getDerivativeGeometry(xRes, yRes, derOutput["resize"])
+
+        derBox = parseGeometry(derRes) if derOutput["format"] != DZI_FORMAT else (None, None)
+        if derBox is None:
+            print_error(errorcodes.ERROR_INVALID_GEOMETRY["message"].format(derRes, fullPath))
+            globalvars.derivativeErrorList.append([errorcodes.ERROR_INVALID_GEOMETRY["message"].format(derRes, fullPath)])
+            continue
+
+        derivedFilePath = os.path.join(os.path.dirname(os.path.abspath(fullPath)), derOutput["derFileNameExt"])
+
+        # Skip the derivatives that are up to date.
+        if ((globalvars.incrementalMode == True or globalvars.catalogMode == True)
+                and (derOutput["derFileNameExt"], derOutput["paramHash"]) in migratedOutputs
+                and (fileSet is None or derOutput["derFileNameExt"] in fileSet)
+                and os.path.isfile(derivedFilePath) and os.path.getmtime(derivedFilePath) >= srcModTime):
+            continue
+
+        jobOutputs.append(dict(derOutput, derRes=derRes, boxWidth=derBox[0], boxHeight=derBox[1], derivedFilePath=derivedFilePath))
+
+    if len(jobOutputs) == 0:
+        return None
+
+    return {"id": document['_id'], "fullPath": fullPath, "width": width, "height": height, "outputs": jobOutputs}
+
+def renderJobs(derivativeJobs):
+    # Generate the derivative images for a batch of files at a time, using the pool of render workers.
+    for batchStart in range(0, len(derivativeJobs), globalvars.CMD_BATCH_SIZE):
+        jobBatch = derivativeJobs[batchStart:batchStart + globalvars.CMD_BATCH_SIZE]
+        renderResults = renderDerivatives(jobBatch)
+
+        for job, result in zip(jobBatch, renderResults):
+            if result["message"] != "":
+                print_error(result["message"])
+            cmdError = checkCmdExitCode(result["exitCode"], job["fullPath"])
+            if cmdError != None:
+                globalvars.derivativeErrorList.append([cmdError])
+                continue
+
+            migrationEvents = []
+            for derOutput, outputResult in zip(job["outputs"], result["outputs"]):
+                if outputResult["exitCode"] != 0:
+                    print_error(errorcodes.ERROR_CANNOT_WRITE_DERIVATIVE["message"].format(derOutput["derivedFilePath"], outputResult["message"]))
+                    globalvars.derivativeErrorList.append([errorcodes.ERROR_CANNOT_WRITE_DERIVATIVE["message"].format(derOutput["derivedFilePath"], outputResult["message"])])
+                    continue
+
+                migration = createMigrationEvent(derOutput["destfiletype"], derOutput["derRes"], job["width"], job["height"],
+                                                 derOutput["derFileNameExt"], derOutput["paramHash"])
+                print_info("The following record has been initialized for the file: '{}': {}".format(derOutput["derFileNameExt"], migration))
+                migrationEvents.append(migration)
+
+            if len(migrationEvents) > 0:
+                dbUpdatePremisProfile = queueRecordUpdate(job["id"], {}, migrationEvents)
+
+    dbUpdatePremisProfile = flushRecordUpdates()
+
+def derivativeRecord(filePath):
+
+    recordFields = getRecordFields()
+
     for path, subdirs, files in os.walk(filePath):
+        derivativeJobs = []  # Files in this directory for which derivatives are to be generated.
+        fileSet = set(files)
+
+        derivativeCandidates = []  # (name, record id, derivative outputs) of the files in this directory.
+
         for name in files:
-            derRes = ""
             queryName = name.split(".")[0]
-            derFileName = "_".join([queryName, globalvars.resize])
-            derFileNameExt = ".".join([derFileName, globalvars.destfiletype])
-
-            if derFileNameExt in files:
-                print_error(errorcodes.ERROR_FILE_EXISTS["message"])
-                globalvars.derivativeErrorList.append([errorcodes.ERROR_FILE_EXISTS["message"].format(derFileNameExt)])
-                errorCSV()
-                exit(errorcodes.ERROR_FILE_EXISTS["code"])
-            else:
-                records = globalvars.dbHandle[globalvars.dbCollection].find({"_id": queryName})
-                records = [record for record in records]
-                if(len(records) > 0):
-                    for document in records:
-                        if "technical" in document:
-                            xRes = document['technical']['image']['xResolution']
-                            yRes = document['technical']['image']['yResolution']
-                            width = document['technical']['image']['width']
-                            height = document['technical']['image']['length']
-                            if(xRes >= yRes):
-                                derRes = "x".join([globalvars.resize, yRes])
-                            else:
-                                derRes = "x".join([xRes, globalvars.resize])
-
-                            fullPath = os.path.sep.join([os.path.abspath(filePath), name])
-                            derivedFilePath = os.path.sep.join([os.path.abspath(filePath), derFileNameExt])
-                            # execute the command "convert <original_filePath> -resize 64x64 <derived_filePath>" to generate derivative image.
-                            commandInput = " ".join(['convert', fullPath, '-resize', derRes, derivedFilePath])
-                            output, error, exitcode = runCmd(commandInput)
-
-                            migration = createMigrationEvent(globalvars.destfiletype, derRes, width, height, derFileNameExt)
-                            print_info("The following record has been initialized for the file: '{}': {}".format(derFileNameExt, migration))
-                            document['premis']['eventList'].append(migration)
-                            dbUpdatePremisProfile = updateRecordInDB(queryName, document)
+            derOutputs = getDerivativeOutputs(queryName)
+
+            for derOutput in derOutputs:
+                if globalvars.incrementalMode != True and derOutput["derFileNameExt"] in fileSet:
+                    print_error(errorcodes.ERROR_FILE_EXISTS["message"].format(derOutput["derFileNameExt"]))
+                    globalvars.derivativeErrorList.append([errorcodes.ERROR_FILE_EXISTS["message"].format(derOutput["derFileNameExt"])])
+                    errorCSV()
+                    exit(errorcodes.ERROR_FILE_EXISTS["code"])
+
+            derivativeCandidates.append((name, queryName, derOutputs))
+
+        # Look up the technical profiles of the files with one query per chunk of files.
+        for chunkStart in range(0, len(derivativeCandidates), globalvars.DB_QUERY_CHUNK_SIZE):
+            candidateChunk = derivativeCandidates[chunkStart:chunkStart + globalvars.DB_QUERY_CHUNK_SIZE]
+            records = findRecordsById([queryName for name, queryName, derOutputs in candidateChunk], recordFields)
+
+            for name, queryName, derOutputs in candidateChunk:
+                document = records.get(queryName)
+                if document is None or "technical" not in document:
+                    continue
+
+                fullPath = os.path.sep.join([os.path.abspath(path), name])
+                derivativeJob = getDerivativeJob(document, fullPath, derOutputs, fileSet)
+                if derivativeJob != None:
+                    derivativeJobs.append(derivativeJob)
+
+        renderJobs(derivativeJobs)
+
+def derivativeCatalogRecords(dirList):
+    """derivativeCatalogRecords(): Generates the derivatives of the files selected from the
+    database, instead of from the directories: the image files of the source filetype
+    (-s) with a technical profile that lack a migration event for at least one of the
+    requested derivatives (see getDerivativeSourceQuery()).
+
+    Arguments:
+        [1] dirList: if not empty, only the files under these directories are processed.
+    """
+    paramHashList = sorted(set(derOutput["paramHash"] for derOutput in getDerivativeOutputs("")))
+    recordFields = getRecordFields()  # The event details include the archived path.
+    dirList = [os.path.join(os.path.abspath(dirPath), "") for dirPath in dirList]
+
+    # The records are read a page at a time, in _id order, and each page is read in
+    # full before any of its files is rendered, so that no cursor is left open (and
+    # idle for longer than the server's cursor timeout) while rendering. The files
+    # are rendered a batch at a time as the pages are read.
+    ASCENDING = globalvars.dbBackend.ASCENDING
+    projection = {field: 1 for field in recordFields}
+    lastId = ""
+    derivativeJobs = []
+    while True:
+        pageQuery = getDerivativeSourceQuery(paramHashList, globalvars.sourcefiletype, lastId)
+        records = list(getReadCollection(globalvars.dbCollection).find(pageQuery, projection)
+                       .sort('_id', ASCENDING).limit(globalvars.DB_QUERY_CHUNK_SIZE))
+        if len(records) == 0:
+            break
+        lastId = records[-1]['_id']
+
+        for document in assembleEvents(records):
+            fullPath = getArchivedFilePath(document)
+            if fullPath is None or os.path.splitext(fullPath)[1].lower() != "." + globalvars.sourcefiletype.lower():
+                continue
+            if len(dirList) > 0 and not any(os.path.abspath(fullPath).startswith(dirPath) for dirPath in dirList):
+                continue
+            if os.path.isfile(fullPath) != True:
+                print_error(errorcodes.ERROR_CANNOT_FIND_FILE["message"].format(fullPath))
+                globalvars.derivativeErrorList.append([errorcodes.ERROR_CANNOT_FIND_FILE["message"].format(fullPath)])
+                continue
+
+            derivativeJob = getDerivativeJob(document, fullPath, getDerivativeOutputs(document['_id']))
+            if derivativeJob != None:
+                derivativeJobs.append(derivativeJob)
+            if len(derivativeJobs) >= globalvars.CMD_BATCH_SIZE:
+                renderJobs(derivativeJobs)
+                derivativeJobs = []
+
+    renderJobs(derivativeJobs)
+
+def getMigratedOutputs(document):
+    """getMigratedOutputs(): Returns the set of (fileName, parameterHash) of the
+    derivatives recorded by the migration events of a record.
+    """
+    migratedOutputs = set()
+    events = document.get(globalvars.labels.pres_entity.name, {}).get(globalvars.labels.evt_parent_entity.name, [])
+
+    for event in events:
+        event = event.get(globalvars.labels.evt_entity.name, {})
+        if event.get(globalvars.labels.evt_typ.name) != globalvars.vocab.evtTyp.migration:
+            continue
+        for eventDetail in event.get(globalvars.labels.evt_detail_parent.name, []):
+            eventDetailExt = eventDetail.get(globalvars.labels.evt_detail_info.name, {}).get(globalvars.labels.evt_detail_ext.name, {})
+            migratedOutputs.add((eventDetailExt.get(globalvars.labels.evt_detail_fileName.name),
+                                 eventDetailExt.get(globalvars.labels.evt_detail_paramHash.name)))
+
+    return migratedOutputs
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# DETAILS:
+# File Name: derivserver.py
+# Description: This file contains source code for a local HTTP service that generates
+#              derivatives on demand from the archived files, and caches them on disk.
+#
+# IMPORT NEEDED MODULES
+import json
+import mimetypes
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metadatautilspkg.globalvars import *
+from metadatautilspkg.errorcodes import *
+from metadatautilspkg.dbfunctions import *
+from metadatautilspkg.premis import *
+from metadatautilspkg.metadatautils import *
+from metadatautilspkg.quarantine import *
+from metadatautilspkg.derivativeutils import *
+
+# URL of a derivative: /derivative/<record id>/<size>.<filetype>, e.g., /derivative/<uuid>/300.jpg
+DERIVATIVE_URL_PATTERN = re.compile(r'^/derivative/([^/]+)/(\d+)\.(\w+)$')
+STATS_URL = "/stats"
+CACHE_TMP_SUFFIX = ".tmp"
+
+cacheLock = threading.Lock()  # Guards the cache index, the in-flight renders and the statistics.
+cacheIndex = OrderedDict()  # Size of each cached derivative, by file name, from the least to the most recently used.
+cacheSize = 0  # Total size of the cached derivatives, in bytes.
+inFlight = {}  # Future of each derivative being rendered, by file name, shared by concurrent requests for it.
+cacheStats = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0, "renders": 0, "renderErrors": 0,
+              "evictions": 0, "evictedBytes": 0}
+
+activeRenders = 0  # No. of renders waiting on the render pool.
+poolNeedsRestart = False  # Set when a render timed out, to stop its stuck worker once the pool is idle.
+
+def main():
+
+    argParser = defineCommandLineOptions()
+    parseCommandLineArgs(argParser, sys.argv[1:])
+
+    print_info("quiet mode: ", globalvars.quietMode)
+
+    if isPillowAvailable() != True:
+        print_error(errorcodes.ERROR_INSTALL_PILLOW["message"])
+        exit(errorcodes.ERROR_INSTALL_PILLOW["code"])
+
+    readQuarantineList()
+
+    # READ-IN THE LABEL DICTIONARY
+    globalvars.labels = readLabelDictionary()
+
+    # READ-IN THE CONTROLLED VOCABULARY
+    globalvars.vocab = readControlledVocabulary()
+
+    # CREATE DATABASE CONNECTION
+    dbParams = init_db()
+    globalvars.dbHandle = dbParams["handle"]
+    globalvars.dbCollection = dbParams["collection_name"]
+
+    loadCacheIndex()
+
+    # The render pool is (re)started from the request handler threads, so its workers are
+    # started by a fork server rather than forked from this multi-threaded process.
+    globalvars.renderStartMethod = "forkserver"
+    getRenderPool()
+
+    server = ThreadingHTTPServer((globalvars.serverHost, globalvars.serverPort), DerivativeRequestHandler)
+    print_info("Serving derivatives on http://{}:{}/ from the cache directory '{}' ({} of {} MB used)."
+               .format(globalvars.serverHost, globalvars.serverPort, globalvars.cacheDir,
+                       cacheSize // (1024 * 1024), globalvars.cacheMaxSize))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
+    closeRenderPool(terminate=True)
+    print_info("Cache statistics: {}".format(getCacheStats()))
+
+def defineCommandLineOptions():
+    #PARSE AND VALIDATE COMMAND-LINE OPTIONS
+    argParser = argparse.ArgumentParser(description="Serve Derivatives Generated on Demand")
+    argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
+    argParser.add_argument('--host', nargs=1, default=False, metavar='HOST', help='HOST is the address the service listens on. Default: {}.'.format(globalvars.serverHost))
+    argParser.add_argument('-p', '--port', nargs=1, type=int, default=False, metavar='PORT', help='PORT is the port the service listens on. Default: {}.'.format(globalvars.serverPort))
+    argParser.add_argument('--cachedir', nargs=1, default=False, metavar='CACHEDIR', help='CACHEDIR is the directory the derivatives are cached in. Default: {}.'.format(globalvars.cacheDir))
+    argParser.add_argument('--cachesize', nargs=1, type=int, default=False, metavar='MB', help='Max. size of the cache, in MB. The least recently used derivatives are removed beyond it. Default: {}.'.format(globalvars.cacheMaxSize))
+    argParser.add_argument('--quality', nargs=1, type=int, default=False, metavar='QUALITY', help='QUALITY (1-100) of lossy derivative formats such as JPEG and WebP. Default: {}.'.format(globalvars.quality))
+    argParser.add_argument('-t', '--timeout', nargs=1, type=int, default=False, metavar='SECONDS', help='Stop rendering a file after SECONDS seconds, and quarantine the file. 0 disables the timeout. Default: {}.'.format(globalvars.cmdTimeout))
+    argParser.add_argument('--maxmemory', nargs=1, type=int, default=False, metavar='MB', help='Limit the memory of each render worker to MB megabytes.')
+    argParser.add_argument('-w', '--workers', nargs=1, type=int, default=False, metavar='NUMWORKERS', help='Render up to NUMWORKERS derivatives in parallel. Default: no. of CPUs ({}).'.format(globalvars.numWorkers))
+    argParser.add_argument('--quarantinefile', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file listing quarantined files. Default: {}.'.format(globalvars.quarantineFileName))
+    return argParser
+
+def parseCommandLineArgs(argParser, args):
+    parsedArgs = argParser.parse_args(args)
+
+    globalvars.quietMode = parsedArgs.quiet
+
+    if parsedArgs.host:
+        globalvars.serverHost = parsedArgs.host[0]
+    if parsedArgs.port:
+        globalvars.serverPort = parsedArgs.port[0]
+    if parsedArgs.cachedir:
+        globalvars.cacheDir = parsedArgs.cachedir[0]
+    if parsedArgs.cachesize:
+        globalvars.cacheMaxSize = parsedArgs.cachesize[0]
+    if parsedArgs.quality:
+        globalvars.quality = parsedArgs.quality[0]
+    if parsedArgs.timeout:
+        globalvars.cmdTimeout = parsedArgs.timeout[0]
+    if parsedArgs.maxmemory:
+        globalvars.cmdMaxMemory = parsedArgs.maxmemory[0]
+    if parsedArgs.workers:
+        globalvars.numWorkers = parsedArgs.workers[0]
+    if parsedArgs.quarantinefile:
+        globalvars.quarantineFileName = parsedArgs.quarantinefile[0]
+
+def loadCacheIndex():
+    """loadCacheIndex(): Indexes the derivatives already in the cache directory, from the
+    least to the most recently used, and removes leftover partial files. The files are
+    ordered by modification time, which getDerivative() updates on every cache hit, since
+    access times are not kept up to date on filesystems mounted with relatime or noatime.
+    """
+    global cacheSize
+
+    os.makedirs(globalvars.cacheDir, exist_ok=True)
+
+    cachedFiles = []
+    for entry in os.scandir(globalvars.cacheDir):
+        if entry.is_file() != True:
+            continue
+        if entry.name.endswith(CACHE_TMP_SUFFIX):
+            os.remove(entry.path)
+            continue
+        fileStat = entry.stat()
+        cachedFiles.append((fileStat.st_mtime, entry.name, fileStat.st_size))
+
+    for useTime, fileName, fileSize in sorted(cachedFiles):
+        cacheIndex[fileName] = fileSize
+        cacheSize += fileSize
+
+    evictCachedFiles()
+
+def evictCachedFiles():
+    """evictCachedFiles(): Removes the least recently used derivatives until the cache fits
+    in its max. size. Must be called with cacheLock held, once the cache is serving.
+    """
+    global cacheSize
+
+    maxSize = globalvars.cacheMaxSize * 1024 * 1024
+    while cacheSize > maxSize and len(cacheIndex) > 0:
+        fileName, fileSize = cacheIndex.popitem(last=False)
+        try:
+            os.remove(os.path.join(globalvars.cacheDir, fileName))
+        except OSError as cacheRemoveException:
+            print_error(cacheRemoveException)
+        cacheSize -= fileSize
+        cacheStats["evictions"] += 1
+        cacheStats["evictedBytes"] += fileSize
+
+def getCacheStats():
+    with cacheLock:
+        stats = dict(cacheStats)
+        stats["cachedFiles"] = len(cacheIndex)
+        stats["cacheSize"] = cacheSize
+        stats["cacheMaxSize"] = globalvars.cacheMaxSize * 1024 * 1024
+        stats["inFlight"] = len(inFlight)
+    return stats
+
+def getDerivative(recordId, resize, destfiletype):
+    """getDerivative(): Returns the path to a cached derivative, rendering it first if it
+    is not cached yet.
+
+    Arguments:
+        [1] recordId: id of the record of the archived file.
+        [2] resize: size of the derivative, as given with "derivatives.py -r".
+        [3] destfiletype: filetype of the derivative.
+
+    Returns:
+        A (path, errorMessage, httpStatus) tuple, with a path of None on error.
+
+    Concurrent requests for a derivative that is being rendered wait for that render,
+    instead of rendering it again.
+    """
+    global cacheSize
+
+    paramHash = getParamHash(destfiletype, resize, globalvars.quality)
+    cacheFileName = "{}_{}_{}.{}".format(recordId, resize, paramHash[:8], destfiletype)
+    cacheFilePath = os.path.join(globalvars.cacheDir, cacheFileName)
+
+    with cacheLock:
+        cacheStats["requests"] += 1
+        isCached = cacheFileName in cacheIndex
+        if isCached == True:
+            cacheIndex.move_to_end(cacheFileName)
+            cacheStats["hits"] += 1
+        else:
+            renderFuture = inFlight.get(cacheFileName)
+            isLeader = renderFuture is None
+            if isLeader == True:
+                renderFuture = Future()
+                inFlight[cacheFileName] = renderFuture
+                cacheStats["misses"] += 1
+            else:
+                cacheStats["coalesced"] += 1
+
+    if isCached == True:
+        # Record the use on disk too, for the order of the cache after a restart.
+        try:
+            os.utime(cacheFilePath)
+        except OSError:
+            pass  # Evicted in the meantime.
+        return (cacheFilePath, None, 200)
+
+    if isLeader != True:
+        return renderFuture.result()
+
+    try:
+        result = renderCacheFile(recordId, resize, destfiletype, cacheFilePath)
+    except Exception as renderException:
+        print_error(renderException)
+        result = (None, str(renderException), 500)
+
+    with cacheLock:
+        if result[0] != None:
+            fileSize = os.path.getsize(cacheFilePath)
+            cacheIndex[cacheFileName] = fileSize
+            cacheSize += fileSize
+            cacheStats["renders"] += 1
+            evictCachedFiles()
+        else:
+            cacheStats["renderErrors"] += 1
+        del inFlight[cacheFileName]
+
+    renderFuture.set_result(result)
+    return result
+
+def renderCacheFile(recordId, resize, destfiletype, cacheFilePath):
+    global activeRenders, poolNeedsRestart
+
+    eventField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name, globalvars.labels.evt_entity.name])
+    recordFields = [".".join([globalvars.labels.tech_entity.name, globalvars.labels.img_entity.name]),
+                    ".".join([eventField, globalvars.labels.evt_typ.name]), ".".join([eventField, globalvars.labels.evt_detail_parent.name])]
+    document = findRecordsById([recordId], recordFields).get(recordId)
+    if document is None or "technical" not in document:
+        return (None, errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"].format(recordId), 404)
+
+    fullPath = getArchivedFilePath(document)
+    if fullPath is None or os.path.isfile(fullPath) != True:
+        return (None, errorcodes.ERROR_CANNOT_FIND_FILE["message"].format(fullPath), 404)
+    if isQuarantined(fullPath):
+        return (None, errorcodes.ERROR_FILE_QUARANTINED["message"].format(fullPath), 422)
+
+    derRes = getDerivativeGeometry(document['technical']['image']['xResolution'], document['technical']['image']['yResolution'], resize)
+    derBox = parseGeometry(derRes)
+    if derBox is None:
+        return (None, errorcodes.ERROR_INVALID_GEOMETRY["message"].format(derRes, fullPath), 422)
+
+    tmpFilePath = "".join([cacheFilePath, ".", str(threading.get_ident()), CACHE_TMP_SUFFIX])
+    job = {"fullPath": fullPath, "outputs": [{"derivedFilePath": tmpFilePath, "boxWidth": derBox[0], "boxHeight": derBox[1],
+                                              "format": getOutputFormat(destfiletype), "quality": globalvars.quality}]}
+
+    exitCode = None
+    with cacheLock:
+        activeRenders += 1
+    try:
+        timeout = globalvars.cmdTimeout if globalvars.cmdTimeout > 0 else None
+        result = waitForRender(submitRender(job), timeout, fromSubmission=True)
+        exitCode, message = result["outputs"][0]["exitCode"], result["outputs"][0]["message"]
+    except multiprocessing.TimeoutError:
+        exitCode, message = globalvars.CMD_TIMEOUT_EXIT_CODE, ""
+    finally:
+        stalePool = None
+        with cacheLock:
+            activeRenders -= 1
+            if exitCode == globalvars.CMD_TIMEOUT_EXIT_CODE:
+                poolNeedsRestart = True
+            # The stuck worker of a timed out render is stopped once no other render uses the
+            # pool. The pool is only detached under the lock, and stopped once it is released,
+            # so that the cache is not held up while the workers are killed.
+            if poolNeedsRestart == True and activeRenders == 0:
+                stalePool = detachRenderPool()
+                poolNeedsRestart = False
+        stopRenderPool(stalePool, terminate=True)
+
+    if exitCode != 0:
+        if os.path.isfile(tmpFilePath):
+            os.remove(tmpFilePath)
+        cmdError = checkCmdExitCode(exitCode, fullPath)
+        return (None, message if message != "" else cmdError, 504 if exitCode == globalvars.CMD_TIMEOUT_EXIT_CODE else 500)
+
+    os.replace(tmpFilePath, cacheFilePath)
+    return (cacheFilePath, None, 200)
+
+class DerivativeRequestHandler(BaseHTTPRequestHandler):
+    """DerivativeRequestHandler: Serves GET /derivative/<record id>/<size>.<filetype>, and
+    the cache statistics as JSON on GET /stats.
+    """
+
+    def do_GET(self):
+        if self.path == STATS_URL:
+            self.sendBody(200, "application/json", json.dumps(getCacheStats(), indent=4).encode('utf-8'))
+            return
+
+        urlMatch = DERIVATIVE_URL_PATTERN.match(self.path)
+        if urlMatch is None:
+            self.sendBody(404, "text/plain", b"Not found.")
+            return
+
+        recordId, resize, destfiletype = urlMatch.groups()
+        if getOutputFormat(destfiletype) in (None, DZI_FORMAT):
+            self.sendBody(415, "text/plain", "Unsupported filetype '{}'.".format(destfiletype).encode('utf-8'))
+            return
+
+        cacheFilePath, errorMessage, httpStatus = getDerivative(recordId, resize, destfiletype)
+        if cacheFilePath is None:
+            print_error(errorMessage)
+            self.sendBody(httpStatus, "text/plain", errorMessage.encode('utf-8'))
+            return
+
+        try:
+            with open(cacheFilePath, "rb") as cacheFileHandle:
+                body = cacheFileHandle.read()
+        except IOError:  # Evicted in the meantime.
+            cacheFilePath, errorMessage, httpStatus = getDerivative(recordId, resize, destfiletype)
+            if cacheFilePath is None:
+                self.sendBody(httpStatus, "text/plain", errorMessage.encode('utf-8'))
+                return
+            try:
+                with open(cacheFilePath, "rb") as cacheFileHandle:
+                    body = cacheFileHandle.read()
+            except IOError:  # Evicted again, e.g., by a cache too small for the requests being served.
+                errorMessage = errorcodes.ERROR_DERIVATIVE_EVICTED["message"].format(os.path.basename(cacheFilePath))
+                print_error(errorMessage)
+                self.sendBody(503, "text/plain", errorMessage.encode('utf-8'))
+                return
+
+        contentType = mimetypes.guess_type(cacheFilePath)[0] or "application/octet-stream"
+        self.sendBody(200, contentType, body)
+
+    def sendBody(self, httpStatus, contentType, body):
+        self.send_response(httpStatus)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print_info(format % args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+#
+# DETAILS:
+# File Name: disposition.py
+# Description: This file contains source code for the disposition of the archived files
+#              that are due for disposition, per their compliance profile.
+#
+# IMPORT NEEDED MODULES
+import csv
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+
+from metadatautilspkg.globalvars import *
+from metadatautilspkg.errorcodes import *
+from metadatautilspkg.dbfunctions import *
+from metadatautilspkg.premis import *
+from metadatautilspkg.metadatautils import *
+from metadatautilspkg.arrangementsummary import *
+from metadatautilspkg.compliancemetadatautils import getDispositionDueQuery, getDisposedField, parseComplianceDate
+
+ACTION_DELETE = "delete"
+ACTION_MOVE = "move"
+
+deviceSemaphores = {}  # Semaphore limiting the no. of files disposed of in parallel, by device.
+recordSummaries = {}  # Arrangement, size and format name of the records to be disposed of, by id.
+
+def main():
+    argParser = defineCommandLineOptions()
+    parseCommandLineArgs(argParser, sys.argv[1:])
+
+    print_info("quiet mode: ", globalvars.quietMode)
+
+    # READ-IN THE LABEL DICTIONARY
+    globalvars.labels = readLabelDictionary()
+
+    # READ-IN THE CONTROLLED VOCABULARY
+    globalvars.vocab = readControlledVocabulary()
+
+    # CREATE DATABASE CONNECTION
+    dbParams = init_db()
+    globalvars.dbHandle = dbParams["handle"]
+    globalvars.dbCollection = dbParams["collection_name"]
+
+    dispositionJobs = getDispositionJobs()
+    print_info("Number of files due for disposition: {}".format(len(dispositionJobs)))
+
+    if globalvars.dryRun == True:
+        for recordId, filePath in dispositionJobs:
+            if os.path.isfile(filePath):
+                status = "Dry run"
+            else:
+                status = errorcodes.ERROR_CANNOT_FIND_FILE["message"].format(filePath)
+            globalvars.dispositionList.append([recordId, filePath, getAction(), getDestination(filePath), status])
+    else:
+        if globalvars.dispositionDir != "":
+            try:
+                os.makedirs(globalvars.dispositionDir, exist_ok=True)
+            except OSError as osError:
+                print_error(osError)
+                print_error(errorcodes.ERROR_CANNOT_CREATE_DESTINATION_DIRECTORY["message"].format(globalvars.dispositionDir))
+                exit(errorcodes.ERROR_CANNOT_CREATE_DESTINATION_DIRECTORY["code"])
+
+        disposeFiles(dispositionJobs)
+
+    dispositionCSV()
+
+def defineCommandLineOptions():
+    #PARSE AND VALIDATE COMMAND-LINE OPTIONS
+    argParser = argparse.ArgumentParser(description="Dispose of the Files Due for Disposition")
+    argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
+    argParser.add_argument('-n', '--dryrun', action='store_true', help='Enable this option to only report the files that would be disposed of, without touching the files or the database.')
+    argParser.add_argument('--from', nargs=1, default=False, dest='duefrom', metavar='DATE', help='Dispose only of the records due on or after DATE. By default, all overdue records are disposed of.')
+    argParser.add_argument('--to', nargs=1, default=False, dest='dueto', metavar='DATE', help='Dispose only of the records due on or before DATE. Defaults to today.')
+    argParser.add_argument('--series', nargs=1, default=False, metavar='SERIES', help='Dispose only of the records of the series SERIES.')
+    argParser.add_argument('-m', '--moveto', nargs=1, default=False, metavar='DIRPATH', help='Move the files to the directory DIRPATH, instead of deleting them.')
+    argParser.add_argument('--purge', action='store_true', help='Enable this option to remove the records of the disposed files from the database. By default, the records are kept, marked as disposed, with a deletion event.')
+    argParser.add_argument('-w', '--workers', nargs=1, type=int, default=False, metavar='NUMWORKERS', help='Dispose of up to NUMWORKERS files in parallel. Default: no. of CPUs ({}).'.format(globalvars.numWorkers))
+    argParser.add_argument('--deviceworkers', nargs=1, type=int, default=False, metavar='NUMWORKERS', help='Dispose of up to NUMWORKERS files in parallel on the same device. Default: {}.'.format(globalvars.numDeviceWorkers))
+
+    return argParser
+
+def parseCommandLineArgs(argParser, args):
+    parsedArgs = argParser.parse_args(args)
+
+    globalvars.quietMode = parsedArgs.quiet
+    globalvars.dryRun = parsedArgs.dryrun
+    globalvars.purgeMode = parsedArgs.purge
+
+    if parsedArgs.duefrom:
+        globalvars.dueFrom = parseDateArg(parsedArgs.duefrom[0])
+
+    if parsedArgs.dueto:
+        globalvars.dueTo = parseDateArg(parsedArgs.dueto[0])
+    else:
+        globalvars.dueTo = datetime.combine(datetime.now().date(), datetime.min.time())
+
+    if parsedArgs.series:
+        globalvars.dueSeries = parsedArgs.series[0]
+    if parsedArgs.moveto:
+        globalvars.dispositionDir = parsedArgs.moveto[0]
+    if parsedArgs.workers:
+        globalvars.numWorkers = parsedArgs.workers[0]
+    if parsedArgs.deviceworkers:
+        globalvars.numDeviceWorkers = parsedArgs.deviceworkers[0]
+
+def parseDateArg(value):
+    dateValue = parseComplianceDate(value)
+
+    if dateValue == None:
+        print_error(errorcodes.ERROR_INVALID_DATE["message"].format(value))
+        exit(errorcodes.ERROR_INVALID_DATE["code"])
+
+    return dateValue
+
+def getAction():
+    if globalvars.dispositionDir != "":
+        return ACTION_MOVE
+    return ACTION_DELETE
+
+def getDestination(filePath):
+    if globalvars.dispositionDir != "":
+        return os.path.join(globalvars.dispositionDir, os.path.basename(filePath))
+    return ""
+
+def getDispositionJobs():
+    """getDispositionJobs(): Looks up the files due for disposition
+
+    Arguments:
+        None
+
+    Returns:
+        The list of (record id, archived file path) pairs of the records due for
+        disposition. Records without an archived file are added to the report.
+    """
+    eventListField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name])
+    query = getDispositionDueQuery(globalvars.dueFrom, globalvars.dueTo, globalvars.dueSeries)
+
+    arrangementField = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name])
+    objectCharsField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.obj_entity.name, globalvars.labels.obj_chars.name])
+    projection = {eventListField : 1, arrangementField : 1,
+                  ".".join([objectCharsField, globalvars.labels.obj_size.name]) : 1,
+                  ".".join([objectCharsField, globalvars.labels.obj_fmt.name]) : 1}
+
+    records = globalvars.dbHandle[globalvars.dbCollection].find(query, projection).batch_size(globalvars.DB_QUERY_CHUNK_SIZE)
+    records = assembleEvents(records)
+
+    dispositionJobs = []
+    for record in records:
+        filePath = getArchivedFilePath(record)
+        if filePath == None:
+            globalvars.dispositionList.append([record['_id'], "", getAction(), "", "No archived file in the record"])
+            continue
+        dispositionJobs.append((record['_id'], filePath))
+
+        objectChars = record[globalvars.labels.pres_entity.name].get(globalvars.labels.obj_entity.name, {}).get(globalvars.labels.obj_chars.name, {})
+        recordSummaries[record['_id']] = (record.get(globalvars.labels.admn_entity.name, {}).get(globalvars.labels.arrangement.name, {}),
+                                          objectChars.get(globalvars.labels.obj_size.name, 0),
+                                          objectChars.get(globalvars.labels.obj_fmt.name, {}).get(globalvars.labels.obj_fmt_dsgn.name, {}).get(globalvars.labels.obj_fmt_name.name))
+
+    return dispositionJobs
+
+def getDeviceJobs(dispositionJobs):
+    """getDeviceJobs(): Orders the disposition jobs for the per-device limits
+
+    Arguments:
+        [1] dispositionJobs: list of (record id, file path) pairs.
+
+    Returns:
+        The list of (record id, file path, device) tuples, alternating between the
+        devices, so that the workers are not all held up by the limit of a single
+        device. The device of a file is that of its directory, looked up once per
+        directory. It is None if the directory cannot be found.
+    """
+    dirDevices = {}
+    jobsByDevice = {}
+
+    for recordId, filePath in dispositionJobs:
+        dirName = os.path.dirname(filePath)
+        if dirName not in dirDevices:
+            try:
+                dirDevices[dirName] = os.stat(dirName).st_dev
+            except OSError:
+                dirDevices[dirName] = None
+        device = dirDevices[dirName]
+        jobsByDevice.setdefault(device, []).append((recordId, filePath, device))
+
+    for device in jobsByDevice:
+        if device not in deviceSemaphores:
+            deviceSemaphores[device] = threading.BoundedSemaphore(max(1, globalvars.numDeviceWorkers))
+
+    return [job for jobs in zip_longest(*jobsByDevice.values()) for job in jobs if job != None]
+
+def disposeFile(job):
+    """disposeFile(): Deletes, or moves, a file due for disposition
+
+    Arguments:
+        [1] job: (record id, file path, device) tuple.
+
+    Returns:
+        (disposed, status) pair. A file that is missing from a directory that exists
+        (or, when moving, that is found at its destination) is taken to have been
+        disposed of already, e.g., by a run that could not update the database.
+    """
+    recordId, filePath, device = job
+
+    with deviceSemaphores[device]:
+        try:
+            if globalvars.dispositionDir != "":
+                dstFilePath = getDestination(filePath)
+                if os.path.exists(dstFilePath):
+                    if not os.path.exists(filePath):
+                        return (True, "Already disposed of")
+                    return (False, errorcodes.ERROR_FILE_EXISTS["message"].format(dstFilePath))
+                shutil.move(filePath, dstFilePath)
+            else:
+                os.remove(filePath)
+        except FileNotFoundError:
+            if globalvars.dispositionDir == "" and device != None:
+                return (True, "Already disposed of")
+            return (False, errorcodes.ERROR_CANNOT_FIND_FILE["message"].format(filePath))
+        except OSError as osError:
+            return (False, "{} {}".format(errorcodes.ERROR_CANNOT_REMOVE_FILE["message"], osError))
+
+    return (True, "Success")
+
+def disposeFiles(dispositionJobs):
+    """disposeFiles(): Disposes of the files, and updates their records
+
+    Arguments:
+        [1] dispositionJobs: list of (record id, file path) pairs.
+
+    The files are disposed of by up to globalvars.numWorkers threads, with at most
+    globalvars.numDeviceWorkers on the same device. The records of the disposed files
+    are marked as disposed, with a deletion event, or removed if purge mode is
+    enabled, in bulk writes of globalvars.DB_BULK_BATCH_SIZE records. Once all the
+    records are written, the disposed records are taken out of the arrangement
+    summary; if some could not be written, the summary is not updated.
+    """
+    deviceJobs = getDeviceJobs(dispositionJobs)
+    disposedDate = datetime.now()
+    disposedRecordIds = []
+    globalvars.dbFailedRecordIds = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, globalvars.numWorkers)) as executor:
+        for job, result in zip(deviceJobs, executor.map(disposeFile, deviceJobs)):
+            recordId, filePath, device = job
+            disposed, status = result
+
+            if disposed == True:
+                if globalvars.purgeMode == True:
+                    dbResult = queueRecordDelete(recordId)
+                else:
+                    deletionEvent = createDeletionEvent(filePath, getDestination(filePath))
+                    dbResult = queueRecordUpdate(recordId, {getDisposedField() : disposedDate}, [deletionEvent])
+
+                if dbResult == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+                    print_error(errorcodes.ERROR_CANNOT_UPDATE_DB["message"])
+                disposedRecordIds.append(recordId)
+            else:
+                print_error(status)
+
+            globalvars.dispositionList.append([recordId, filePath, getAction(), getDestination(filePath), status])
+
+    if flushRecordUpdates() == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+        print_error(errorcodes.ERROR_CANNOT_UPDATE_DB["message"])
+
+    # Only the records that were written are taken out of the arrangement summary, and
+    # the summary is left as it is if any record could not be written.
+    numDisposed = 0
+    for recordId in disposedRecordIds:
+        if recordId not in globalvars.dbFailedRecordIds:
+            arrangement, fileSize, fmtName = recordSummaries[recordId]
+            addSummaryDelta(arrangement, fileSize, fmtName, -1)
+            numDisposed += 1
+
+    if len(globalvars.dbFailedRecordIds) == 0:
+        flushSummaryDeltas()
+    else:
+        print_error(errorcodes.ERROR_SUMMARY_NOT_UPDATED["message"])
+
+    print_info("Number of files disposed of: {}".format(numDisposed))
+
+# WRITE THE DISPOSITION REPORT TO A CSV FILE
+def dispositionCSV():
+    dispositionCSVFileName = ("disposition_" + strftime("%Y-%m-%d_%H%M%S", localtime(time())) + ".csv")
+
+    try:
+        dispositionCSVFileHandle = open(dispositionCSVFileName, 'w')
+    except IOError as ioErrorCsvWrite:
+        print_error(ioErrorCsvWrite)
+        print_error(errorcodes.ERROR_CANNOT_WRITE_CSV_FILE["message"])
+        exit (errorcodes.ERROR_CANNOT_WRITE_CSV_FILE["code"])
+
+    csvWriter = csv.writer(dispositionCSVFileHandle, delimiter=',', quotechar='"', lineterminator='\n')
+    csvWriter.writerow(["id", "filepath", "action", "destination", "status"])
+
+    for row in globalvars.dispositionList:
+        csvWriter.writerow(row)
+
+    dispositionCSVFileHandle.close()
+    print_info("The disposition report has been written to the following file: {}.".format(dispositionCSVFileName))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+
+import metadatautilspkg.globalvars as globalvars
+import metadatautilspkg.errorcodes as errorcodes
+from metadatautilspkg.metadatautils import *
+from metadatautilspkg.dbfunctions import getReadCollection
+
+# The summary collection has one node per series, sub-series, etc., found in the
+# arrangement of the records, plus a root node for the whole collection:
+#
+#   {"_id": '["3", "12"]', "parent": '["3"]', "level": 2,
+#    "arrangement": {"seriesLabel": "3", "seriesname": "...", "sub-seriesLabel": "12"},
+#    "count": 1200, "size": 5678901234,
+#    "formats": {"TIFF": {"count": 1100, "size": 5600000000}, "JPEG": {"count": 100, "size": 78901234}}}
+#
+# The node id is the JSON list of the labels on its path, so that a node is
+# found with a single lookup by _id, and its children by the indexed parent id.
+
+def getSummaryNodeId(labelList):
+    return json.dumps(labelList)
+
+def getArrangementPath(arrangement):
+    """getArrangementPath
+
+    Arguments:
+        arrangement: the arrangement entity of a record, or a part of it.
+
+    This function returns the labels of the arrangement, from the series down, as a
+    list. It stops at the first level that has no label.
+
+    """
+
+    labelList = []
+    for level in globalvars.ARRANGEMENT_LEVELS:
+        label = arrangement.get(level + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX)
+        if label == None or label == "":
+            break
+        labelList.append(str(label))
+
+    return labelList
+
+def getFormatKey(fmtName):
+    # Field names cannot contain dots, nor start with a dollar sign.
+    if fmtName == None or fmtName == "":
+        return "unknown"
+    return str(fmtName).replace(".", "_").lstrip("$") or "unknown"
+
+def getSummaryDelta(labelList):
+    """getSummaryDelta
+
+    Arguments:
+        labelList: the labels of the node, from the series down.
+
+    This function returns the pending update of the node, creating it if needed.
+
+    """
+
+    nodeId = getSummaryNodeId(labelList)
+    delta = globalvars.summaryDeltas.get(nodeId)
+
+    if delta == None:
+        depth = len(labelList)
+        delta = {'$setOnInsert' : {'parent' : getSummaryNodeId(labelList[:-1]) if depth > 0 else None, 'level' : depth}}
+        for level, label in zip(globalvars.ARRANGEMENT_LEVELS, labelList):
+            delta['$setOnInsert']['arrangement.' + level + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX] = label
+        globalvars.summaryDeltas[nodeId] = delta
+
+    return delta
+
+def addSummaryDelta(arrangement, fileSize, fmtName, count=1):
+    """addSummaryDelta
+
+    Arguments:
+        arrangement: the arrangement entity of the record(s).
+        fileSize: total size of the file(s), in bytes.
+        fmtName: format name of the file(s).
+        count: no. of records added (positive) or removed (negative).
+
+    This function adds the record(s) to the counts of the root node, and of every
+    node on their arrangement path. The changes are accumulated in memory, and sent
+    to the database with flushSummaryDeltas().
+
+    """
+
+    if count < 0:
+        fileSize = -abs(fileSize)
+
+    labelList = getArrangementPath(arrangement)
+    formatKey = getFormatKey(fmtName)
+
+    for depth in range(len(labelList) + 1):
+        incFields = getSummaryDelta(labelList[:depth]).setdefault('$inc', {})
+
+        for field, value in [('count', count), ('size', fileSize),
+                             ('formats.' + formatKey + '.count', count), ('formats.' + formatKey + '.size', fileSize)]:
+            incFields[field] = incFields.get(field, 0) + value
+
+    if len(globalvars.summaryDeltas) >= globalvars.DB_BULK_BATCH_SIZE:
+        flushSummaryDeltas()
+
+def setSummaryNames(arrangement):
+    """setSummaryNames
+
+    Arguments:
+        arrangement: the arrangement entity of the records, with the names of
+                     (some of) its levels, e.g., "seriesname".
+
+    This function records the names of the levels on the nodes of the arrangement
+    path. Each node gets the names of its own level and of the levels above it.
+
+    """
+
+    labelList = getArrangementPath(arrangement)
+
+    for depth in range(1, len(labelList) + 1):
+        names = {}
+        for level in globalvars.ARRANGEMENT_LEVELS[:depth]:
+            if level + "name" in arrangement:
+                names['arrangement.' + level + "name"] = arrangement[level + "name"]
+        if len(names) == 0:
+            continue
+
+        getSummaryDelta(labelList[:depth]).setdefault('$set', {}).update(names)
+
+def flushSummaryDeltas():
+    """flushSummaryDeltas
+
+    Arguments:
+        none
+
+    This function sends the changes accumulated by addSummaryDelta() and
+    setSummaryNames() to the summary collection in a single unordered bulk write,
+    creating the nodes that do not exist yet. The changes are only discarded once
+    written; if the write fails, they are kept for the next flush.
+
+    """
+
+    if len(globalvars.summaryDeltas) == 0:
+        return 0
+
+    bulkOps = [globalvars.dbBackend.UpdateOne({'_id' : nodeId}, delta, upsert=True) for nodeId, delta in globalvars.summaryDeltas.items()]
+
+    try:
+        dbBulkResult = globalvars.dbHandle[globalvars.dbSummaryCollection].bulk_write(bulkOps, ordered=False)
+    except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+        print_error(ExceptionDatabase)
+        print_error(errorcodes.ERROR_CANNOT_UPDATE_DB["message"])
+        return(errorcodes.ERROR_CANNOT_UPDATE_DB["code"])
+
+    globalvars.summaryDeltas = {}
+
+    return dbBulkResult.modified_count + dbBulkResult.upserted_count
+
+def rebuildSummary(excludeQuery):
+    """rebuildSummary
+
+    Arguments:
+        excludeQuery: query matching the records to be left out, e.g., those disposed of.
+
+    This function recomputes the whole summary collection from the records, with
+    an aggregation grouping the records by arrangement and format on the database
+    server. It is meant for the initial build, and for repairs, and the summary is
+    incomplete until it returns.
+
+    """
+
+    arrangementField = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name])
+    objectCharsField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.obj_entity.name, globalvars.labels.obj_chars.name])
+    sizeField = ".".join([objectCharsField, globalvars.labels.obj_size.name])
+    fmtNameField = ".".join([objectCharsField, globalvars.labels.obj_fmt.name, globalvars.labels.obj_fmt_dsgn.name, globalvars.labels.obj_fmt_name.name])
+
+    groupId = {'fmt' : '$' + fmtNameField}
+    for levelNum, level in enumerate(globalvars.ARRANGEMENT_LEVELS):
+        groupId['l' + str(levelNum)] = '$' + arrangementField + '.' + level + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX
+        groupId['n' + str(levelNum)] = '$' + arrangementField + '.' + level + "name"
+
+    globalvars.dbHandle[globalvars.dbSummaryCollection].delete_many({})
+    globalvars.summaryDeltas = {}
+
+    groups = getReadCollection(globalvars.dbCollection).aggregate([{'$match' : {'$nor' : [excludeQuery]}},
+                                                                  {'$group' : {'_id' : groupId, 'count' : {'$sum' : 1}, 'size' : {'$sum' : '$' + sizeField}}}],
+                                                                 allowDiskUse=True)
+
+    for group in groups:
+        arrangement = {}
+        for levelNum, level in enumerate(globalvars.ARRANGEMENT_LEVELS):
+            if group['_id'].get('l' + str(levelNum)) != None:
+                arrangement[level + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX] = group['_id']['l' + str(levelNum)]
+            if group['_id'].get('n' + str(levelNum)) != None:
+                arrangement[level + "name"] = group['_id']['n' + str(levelNum)]
+        addSummaryDelta(arrangement, group['size'], group['_id'].get('fmt'), group['count'])
+        setSummaryNames(arrangement)
+
+    flushSummaryDeltas()
+
+def getSummaryNode(labelList):
+    """getSummaryNode
+
+    Arguments:
+        labelList: the labels of the node, from the series down. An empty list
+                   for the root node.
+
+    This function returns the summary node, and the list of its child nodes.
+
+    """
+
+    nodeId = getSummaryNodeId(labelList)
+    node = getReadCollection(globalvars.dbSummaryCollection).find_one({'_id' : nodeId})
+    children = list(getReadCollection(globalvars.dbSummaryCollection).find({'parent' : nodeId}))
+
+    return node, children
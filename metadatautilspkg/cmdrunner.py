@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+import os
+import shutil
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired
+
+try:
+    import resource
+except ImportError:  # resource limits are only available on POSIX systems
+    resource = None
+
+import metadatautilspkg.globalvars as globalvars
+
+
+@lru_cache(maxsize=None)
+def findExecutable(cmdName):
+    """findExecutable(): Returns the absolute path of a command found on the PATH, or
+    the command name itself if it is not found. Cached, since the same few tools are
+    run on every file.
+    """
+    cmdPath = shutil.which(cmdName)
+    return cmdPath if cmdPath != None else cmdName
+
+
+def getResourceLimits():
+    resourceLimits = []
+    if resource is None:
+        return resourceLimits
+
+    if globalvars.cmdMaxMemory > 0:
+        maxMemoryBytes = globalvars.cmdMaxMemory * 1024 * 1024
+        resourceLimits.append((resource.RLIMIT_AS, (maxMemoryBytes, maxMemoryBytes)))
+    if globalvars.cmdMaxCpuTime > 0:
+        resourceLimits.append((resource.RLIMIT_CPU, (globalvars.cmdMaxCpuTime, globalvars.cmdMaxCpuTime)))
+
+    return resourceLimits
+
+
+# Applies the resource limits given as JSON in argv[1], and executes the command in
+# argv[3:], exiting with the code in argv[2] if it cannot be executed.
+LIMIT_WRAPPER_CODE = """import json, os, resource, sys
+for limit, values in json.loads(sys.argv[1]):
+    resource.setrlimit(limit, tuple(values))
+try:
+    os.execv(sys.argv[3], sys.argv[3:])
+except OSError as osError:
+    sys.stderr.write(str(osError))
+    sys.exit(int(sys.argv[2]))
+"""
+
+
+def getLimitedArgv(argv, resourceLimits):
+    """getLimitedArgv(): Returns the command line running argv with the resource
+    limits applied, by a small Python program that sets them and then executes
+    the command in its place (in the same process, and process group), so that the
+    command and every process it starts (e.g., ImageMagick delegates) are limited
+    from the start.
+
+    The limits are not set in a preexec_fn, which is not safe in a multi-threaded
+    parent such as runCmdMap(), and would keep the child from being started with
+    vfork().
+    """
+    return ([sys.executable, "-I", "-S", "-c", LIMIT_WRAPPER_CODE, json.dumps(resourceLimits),
+             str(globalvars.CMD_NOT_FOUND_EXIT_CODE)] + argv)
+
+
+def runCmd(argv):
+    """runCmd(): Runs a command with the configured timeout and resource limits.
+
+    Arguments:
+        [1] argv: the command to be run, as a list of the program name and its
+                  arguments. No shell is involved, so arguments (e.g., paths with
+                  spaces) are passed on as they are.
+
+    Returns:
+        A list with the contents of the command's stdout and stderr, and its exit code.
+        If the command runs for longer than globalvars.cmdTimeout seconds, it is killed
+        and the exit code is globalvars.CMD_TIMEOUT_EXIT_CODE. A command killed by a
+        signal (e.g., on exceeding its CPU time limit) has a negative exit code.
+
+    The command runs in a process group of its own, so that on timeout the processes
+    it started, e.g., ImageMagick delegates such as gs, are killed along with it.
+    Its stdout and stderr are drained concurrently.
+
+    Since it is given a process group, the command is not started with posix_spawn()
+    (which subprocess only uses for children that stay in the parent's group), but
+    with no preexec_fn, CPython starts it with vfork() where available, so that the
+    memory of a large parent is not copied for each command. Resource limits, if any,
+    are applied by an exec wrapper instead (see getLimitedArgv()). The descriptors
+    opened by Python are not inherited, so they need not be closed in the child.
+    """
+    argv = [findExecutable(argv[0])] + list(argv[1:])
+    resourceLimits = getResourceLimits()
+    if len(resourceLimits) > 0:
+        argv = getLimitedArgv(argv, resourceLimits)
+
+    try:
+        childProcess = Popen(argv, stdin=DEVNULL, stdout=PIPE, stderr=PIPE, close_fds=False, process_group=0)
+    except OSError as osError:
+        return [b"", str(osError).encode("utf-8"), globalvars.CMD_NOT_FOUND_EXIT_CODE]
+
+    timeout = globalvars.cmdTimeout if globalvars.cmdTimeout > 0 else None
+    try:
+        childStdout, childStderr = childProcess.communicate(timeout=timeout)
+        exitCode = childProcess.returncode
+    except TimeoutExpired:
+        # Kill the whole process group, so that no process started by the command
+        # is left running, and holding the pipes open.
+        try:
+            os.killpg(childProcess.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # The process group has already exited.
+        try:
+            childStdout, childStderr = childProcess.communicate(timeout=globalvars.CMD_KILL_WAIT)
+        except TimeoutExpired:
+            # A process that left the group (e.g., a daemon) still holds the pipes.
+            childProcess.stdout.close()
+            childProcess.stderr.close()
+            childProcess.wait()
+            childStdout, childStderr = b"", b""
+        exitCode = globalvars.CMD_TIMEOUT_EXIT_CODE
+
+    return [childStdout, childStderr, exitCode]
+
+
+def runCmdMap(argvList):
+    """runCmdMap(): Runs many commands, at most globalvars.numWorkers at a time.
+
+    Arguments:
+        [1] argvList: list of commands, each a list of the program name and its arguments.
+
+    Returns:
+        The list of results of runCmd(), in the same order as the commands.
+    """
+    if len(argvList) == 0:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, globalvars.numWorkers)) as executor:
+        return list(executor.map(runCmd, argvList))
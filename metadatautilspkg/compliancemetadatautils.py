@@ -36,7 +36,9 @@
 #
 
 import sys
-from datetime import datetime
+import re
+import calendar
+from datetime import datetime, timedelta
 from time import localtime, time, strftime
 from collections import namedtuple
 import argparse
@@ -163,8 +165,109 @@ def createComplianceProfile():
     complianceProfile[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_disp_method.name] = {}
     complianceProfile[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_url.name] = {}
     complianceProfile[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_eff_date.name] = {}
+    complianceProfile[globalvars.labels.com_entity.name][globalvars.labels.com_disposition.name][globalvars.labels.com_disp_due.name] = None
 
     complianceProfile[globalvars.labels.com_entity.name][globalvars.labels.com_access.name] = {}
     complianceProfile[globalvars.labels.com_entity.name][globalvars.labels.com_access.name][globalvars.labels.com_access_demo.name] = {}
 
     return complianceProfile
+
+def parseComplianceDate(value):
+    """parseComplianceDate
+
+        Arguments:
+            value: a date, as entered in the compliance CSV file (e.g., "2/9/2017").
+
+        This function returns the date as a datetime, or None if it is not in one of
+        the formats in globalvars.COMPLIANCE_DATE_FORMATS.
+
+    """
+    value = str(value).strip()
+
+    for dateFormat in globalvars.COMPLIANCE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, dateFormat)
+        except ValueError:
+            pass
+
+    return None
+
+def parseRetentionDuration(value):
+    """parseRetentionDuration
+
+        Arguments:
+            value: a retention duration, as entered in the compliance CSV file (e.g., "75 Years").
+
+        This function returns the duration as a (count, unit) tuple, where unit is one
+        of "year", "month", "week" or "day", or None if the duration has no fixed
+        length (e.g., "Permanent").
+
+    """
+    match = re.match(r"^\s*(\d+)\s*(year|month|week|day)s?\s*$", str(value), re.IGNORECASE)
+    if match == None:
+        return None
+
+    return (int(match.group(1)), match.group(2).lower())
+
+def getDispositionDueDate(duration, effectiveDate):
+    """getDispositionDueDate
+
+        Arguments:
+            duration: the retention duration of the compliance profile.
+            effectiveDate: the effective date of the retention schedule.
+
+        This function returns the date a record is due for disposition, i.e., the
+        effective date plus the retention duration, or None if either cannot be parsed.
+        Dates that do not exist in the due month (e.g., Feb. 29 on a non-leap year)
+        are moved back to the last day of the month.
+
+    """
+    startDate = parseComplianceDate(effectiveDate)
+    retention = parseRetentionDuration(duration)
+    if startDate == None or retention == None:
+        return None
+
+    count, unit = retention
+    if unit == "day":
+        return startDate + timedelta(days=count)
+    if unit == "week":
+        return startDate + timedelta(weeks=count)
+
+    numMonths = count * 12 if unit == "year" else count
+    year, month = divmod(startDate.month - 1 + numMonths, 12)
+    year += startDate.year
+    month += 1
+    day = min(startDate.day, calendar.monthrange(year, month)[1])
+
+    return startDate.replace(year=year, month=month, day=day)
+
+def getDueDateField():
+    return ".".join([globalvars.labels.com_entity.name, globalvars.labels.com_disposition.name, globalvars.labels.com_disp_due.name])
+
+def getDisposedField():
+    return ".".join([globalvars.labels.com_entity.name, globalvars.labels.com_disposition.name, globalvars.labels.com_disp_done.name])
+
+def getSeriesField():
+    return ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name, "series" + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX])
+
+def getDispositionDueQuery(dueFrom, dueTo, series):
+    """getDispositionDueQuery
+
+        Arguments:
+            dueFrom: start of the due date range, or None for no start.
+            dueTo: end (inclusive) of the due date range.
+            series: series the query is restricted to, or None for all series.
+
+        This function returns the query selecting the records due for disposition in
+        the date range, that have not been disposed of yet.
+
+    """
+    dueRange = {'$lt' : dueTo + timedelta(days=1)}
+    if dueFrom != None:
+        dueRange['$gte'] = dueFrom
+
+    query = {getDueDateField() : dueRange, getDisposedField() : {'$exists' : False}}
+    if series != None:
+        query[getSeriesField()] = series
+
+    return query
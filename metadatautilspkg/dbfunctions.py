@@ -35,25 +35,36 @@
 # Update: Milind Siddhanti (milindsiddhanti at utexas dot edu)
 #
 
+import importlib
 import json
-import pymongo
 import os
+import re
+from collections import namedtuple
+from time import time_ns
 
 import metadatautilspkg.globalvars as globalvars
 import metadatautilspkg.errorcodes as errorcodes
 from metadatautilspkg.metadatautils import *
 
+UpdateResult = namedtuple('UpdateResult', ['matched_count', 'modified_count'])  # Totals of updates done in chunks.
+
 
 dbConfFileName = os.path.join(globalvars.configDir, "dbconf.json")
 
-def init_db():
+def init_db(offline=False):
     """init_db():
 
     Arguments:
-        none
+        offline: if True, and the database cannot be connected to, the handle
+                 returned is None, instead of exiting.
 
     Reads the DB Configuration file, creates a connection to the database,
     and returns a handle to the connected database
+
+    The "dbbackend" setting of the configuration file chooses the storage backend:
+    "mongodb" (the default, see mongobackend.py), or "sqlite", for an embedded
+    database in the file of the "dbpath" setting, which needs no server (see
+    sqlitebackend.py).
     """
 
     try:
@@ -64,26 +75,40 @@ def init_db():
         quit(errorcodes.ERROR_CANNOT_READ_DBCONF_FILE["code"])
 
     dbConfig = json.loads(dbConfigJson)
-    dbAddr = dbConfig['dbaddress']
-    dbUser = dbConfig['dbuser']
-    #dbPass = urllib.quote_plus(dbConfig['dbpassword'])
-    dbPass = dbConfig['dbpassword']
-    dbName = dbConfig['dbname']
     globalvars.dbCollection = dbConfig['dbcollection']
+    globalvars.dbSummaryCollection = dbConfig.get('dbsummarycollection', globalvars.dbCollection + "_arrangement")
+    globalvars.dbEventsCollection = dbConfig.get('dbeventscollection')
 
-    try:
-        handle = pymongo.MongoClient(dbAddr)[dbName]
-    except pymongo.errors.ConnectionFailure as ExceptionConnFailure:
-        print_error(ExceptionConnFailure)
-        print_error(errorcodes.ERROR_CANNOT_CONNECT_TO_DB["message"])
-        exit(errorcodes.ERROR_CANNOT_CONNECT_TO_DB["code"])
+    dbBackendName = dbConfig.get('dbbackend', "mongodb")
+    if dbBackendName not in globalvars.DB_BACKENDS:
+        print_error(errorcodes.ERROR_INVALID_DBCONF["message"].format("dbbackend: " + str(dbBackendName)))
+        exit(errorcodes.ERROR_INVALID_DBCONF["code"])
+
+    # Imported on first use, to keep the startup of the scripts fast, and so that
+    # pymongo is only needed with MongoDB.
+    globalvars.dbBackend = importlib.import_module(globalvars.DB_BACKENDS[dbBackendName])
 
     try:
-        handle.authenticate(dbUser, dbPass)
-    except pymongo.errors.PyMongoError as ExceptionPyMongoError:
-        print_error(ExceptionPyMongoError)
+        handle = globalvars.dbBackend.connect(dbConfig)
+    except (globalvars.dbBackend.ConfigurationError, KeyError, TypeError, ValueError) as ExceptionConfiguration:
+        print_error(ExceptionConfiguration)
+        print_error(errorcodes.ERROR_INVALID_DBCONF["message"].format(ExceptionConfiguration))
+        exit(errorcodes.ERROR_INVALID_DBCONF["code"])
+    except globalvars.dbBackend.AuthenticationError as ExceptionAuthentication:
+        print_error(ExceptionAuthentication)
         print_error(errorcodes.ERROR_CANNOT_AUTHENTICATE_DB_USER["message"])
         exit(errorcodes.ERROR_CANNOT_AUTHENTICATE_DB_USER["code"])
+    except globalvars.dbBackend.DatabaseError as ExceptionConnFailure:
+        print_error(ExceptionConnFailure)
+        print_error(errorcodes.ERROR_CANNOT_CONNECT_TO_DB["message"])
+        if offline == False:
+            exit(errorcodes.ERROR_CANNOT_CONNECT_TO_DB["code"])
+        handle = None
+
+    # Indexes are looked up with the labels, which are read before connecting.
+    if len(globalvars.labels) > 0 and handle != None:
+        globalvars.dbHandle = handle
+        ensureIndexes(dbConfig.get('ensureindexes', True))
 
     dbParamsDict = dict()
     dbParamsDict["handle"] = handle
@@ -91,6 +116,360 @@ def init_db():
 
     return dbParamsDict
 
+def getReadCollection(collectionName):
+    """getReadCollection
+
+    Arguments:
+        collectionName: name of the collection to be read.
+
+    This function returns the collection, with the read preference of the
+    "readpreference" setting of the DB configuration file (e.g., "secondaryPreferred"),
+    for the read-heavy lookups that can be served by secondaries, and tolerate data
+    up to "maxstalenessseconds" old. Writes, and reads followed by writes based on
+    them, use globalvars.dbHandle directly, which reads from the primary.
+
+    """
+
+    collection = globalvars.dbHandle[collectionName]
+
+    if globalvars.dbReadPreference != None:
+        return collection.with_options(read_preference=globalvars.dbReadPreference)
+
+    return collection
+
+def getIndexDeclarations():
+    """getIndexDeclarations
+
+    Arguments:
+        none
+
+    This function returns the indexes the workflows need, as a list of (collection,
+    name, keys, multikey) tuples, where collection is globalvars.dbCollection or
+    globalvars.dbSummaryCollection, keys is a list of (field, direction) pairs, and
+    multikey is True for the indexes on the fields in arrays, e.g., the events
+    kept in the records (these are not indexed by the SQLite backend). The indexes
+    on the events are on the events collection, if used.
+
+    """
+
+    ASCENDING = globalvars.dbBackend.ASCENDING
+
+    arrangementField = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name])
+    objectField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.obj_entity.name])
+    if globalvars.dbEventsCollection == None:
+        eventCollection = globalvars.dbCollection
+        eventField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name, globalvars.labels.evt_entity.name])
+    else:
+        eventCollection = globalvars.dbEventsCollection  # See getEventOps().
+        eventField = globalvars.labels.evt_entity.name
+    eventExtField = ".".join([eventField, globalvars.labels.evt_detail_parent.name, globalvars.labels.evt_detail_info.name, globalvars.labels.evt_detail_ext.name])
+    dueDateField = ".".join([globalvars.labels.com_entity.name, globalvars.labels.com_disposition.name, globalvars.labels.com_disp_due.name])
+    seriesField = ".".join([arrangementField, globalvars.ARRANGEMENT_LEVELS[0] + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX])
+
+    return [
+        # Series, sub-series, etc. lookups (admin.py, compliance.py, technical.py).
+        # Queries on the first levels use the prefix of the index.
+        (globalvars.dbCollection, "arrangement",
+         [(".".join([arrangementField, level + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX]), ASCENDING) for level in globalvars.ARRANGEMENT_LEVELS], False),
+        # Serial numbers of the files from a source directory (accession.py).
+        (globalvars.dbCollection, "originalName",
+         [(".".join([objectField, globalvars.labels.obj_orig_name.name]), ASCENDING)], False),
+        # Duplicate and fixity lookups by checksum.
+        (globalvars.dbCollection, "checksum",
+         [(".".join([objectField, globalvars.labels.obj_chars.name, globalvars.labels.obj_fixity.name, globalvars.labels.obj_msgdgst.name]), ASCENDING)], False),
+        # Records by archived (or copied to) file path.
+        (eventCollection, "archivalPath",
+         [(".".join([eventExtField, globalvars.labels.evt_detail_dst.name]), ASCENDING)], True),
+        # Events by type and date, e.g., all the migrations of a month.
+        (eventCollection, "eventTypeDate",
+         [(".".join([eventField, globalvars.labels.evt_typ.name]), ASCENDING),
+          (".".join([eventField, globalvars.labels.evt_dttime.name]), ASCENDING)], eventCollection == globalvars.dbCollection),
+        # Records due for disposition, across all series, and in a series (compliance.py, disposition.py).
+        (globalvars.dbCollection, "dispositionDue",
+         [(dueDateField, ASCENDING)], False),
+        (globalvars.dbCollection, "seriesDispositionDue",
+         [(seriesField, ASCENDING), (dueDateField, ASCENDING)], False),
+        # Children of the arrangement summary nodes.
+        (globalvars.dbSummaryCollection, "parent",
+         [("parent", ASCENDING)], False),
+    ] + ([
+        # Events of the records, in the order they were written (see assembleEvents()).
+        (globalvars.dbEventsCollection, "objectEvents",
+         [("objectId", ASCENDING), ("seq", ASCENDING)], False),
+    ] if globalvars.dbEventsCollection != None else [])
+
+def getIndexKeyPattern(indexKeys):
+    # The server may report the directions of the keys as floats, e.g., 1.0.
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in indexKeys]
+
+def ensureIndexes(create=True):
+    """ensureIndexes
+
+    Arguments:
+        create: if True, the missing indexes are created, otherwise they are only reported.
+
+    This function compares the indexes declared by getIndexDeclarations() with those
+    of the collections, by keys (an index created under another name counts), and
+    returns the list of names of the declared indexes that are missing.
+
+    """
+
+    missingIndexes = []
+    existingKeys = {}
+
+    for collectionName, indexName, indexKeys, multikey in getIndexDeclarations():
+        try:
+            if collectionName not in existingKeys:
+                indexInfo = globalvars.dbHandle[collectionName].index_information()
+                existingKeys[collectionName] = [getIndexKeyPattern(info['key']) for info in indexInfo.values()]
+
+            if getIndexKeyPattern(indexKeys) in existingKeys[collectionName]:
+                continue
+
+            if create == True:
+                print_info("Creating the index '{}' of the collection '{}'".format(indexName, collectionName))
+                globalvars.dbBackend.createIndex(globalvars.dbHandle[collectionName], indexKeys, indexName, multikey)
+                existingKeys[collectionName].append(getIndexKeyPattern(indexKeys))
+            else:
+                print_error("The index '{}' of the collection '{}' is missing.".format(indexName, collectionName))
+                missingIndexes.append(indexName)
+        except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+            print_error(ExceptionDatabase)
+            print_error("Cannot create the index '{}' of the collection '{}'.".format(indexName, collectionName))
+            missingIndexes.append(indexName)
+
+    return missingIndexes
+
+def getQueryPlanStages(plan):
+    # Stages of a query plan, from the top down, e.g., ["FETCH", "IXSCAN"].
+    stages = []
+    while plan != None:
+        stages.append(plan.get('stage'))
+        if 'inputStages' in plan:
+            for inputStage in plan['inputStages']:
+                stages.extend(getQueryPlanStages(inputStage))
+            break
+        plan = plan.get('inputStage', plan.get('queryPlan'))
+
+    return stages
+
+def checkQueryPlan(collectionName, query, description):
+    """checkQueryPlan
+
+    Arguments:
+        collectionName: the collection queried.
+        query: the query to be checked.
+        description: what the query is for, used in the warning.
+
+    This function asks the database for the plan of the query, and warns if the
+    query would scan the whole collection, instead of using an index. Returns True
+    if the query uses an index.
+
+    """
+
+    try:
+        explanation = globalvars.dbHandle[collectionName].find(query).explain()
+    except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+        print_error(ExceptionDatabase)
+        return False
+
+    stages = getQueryPlanStages(explanation.get('queryPlanner', {}).get('winningPlan'))
+    if 'COLLSCAN' in stages:
+        print_error("Warning: the {} query scans the whole collection '{}': {}".format(description, collectionName, query))
+        return False
+
+    print_info("The {} query uses an index: {}".format(description, " <- ".join(stages)))
+    return True
+
+def getWorkflowQueries():
+    """getWorkflowQueries
+
+    Arguments:
+        none
+
+    This function returns samples of the queries the workflows run, as a list of
+    (collection, query, description) tuples, for checkQueryPlan().
+
+    """
+
+    arrangementField = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name])
+    seriesField = ".".join([arrangementField, globalvars.ARRANGEMENT_LEVELS[0] + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX])
+    subSeriesField = ".".join([arrangementField, globalvars.ARRANGEMENT_LEVELS[1] + globalvars.ARRANGEMENT_INFO_LABEL_SUFFIX])
+    origNameField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.obj_entity.name, globalvars.labels.obj_orig_name.name])
+    dueDateField = ".".join([globalvars.labels.com_entity.name, globalvars.labels.com_disposition.name, globalvars.labels.com_disp_due.name])
+    eventTypeField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name, globalvars.labels.evt_entity.name, globalvars.labels.evt_typ.name])
+    eventCollection = globalvars.dbCollection
+    if globalvars.dbEventsCollection != None:
+        eventCollection = globalvars.dbEventsCollection
+        eventTypeField = ".".join([globalvars.labels.evt_entity.name, globalvars.labels.evt_typ.name])
+
+    return [
+        (globalvars.dbCollection, {'$and' : [{seriesField : "1"}, {subSeriesField : "1"}]}, "series/sub-series"),
+        (globalvars.dbCollection, {origNameField : {'$regex' : getDirectoryRegex(os.path.abspath("source"))}}, "serial number"),
+        (globalvars.dbCollection, {dueDateField : {'$lt' : datetime.now()}, seriesField : "1"}, "disposition due"),
+        (eventCollection, {eventTypeField : globalvars.vocab.evtTyp.migration if len(globalvars.vocab) > 0 else "migration"}, "events by type"),
+        (globalvars.dbSummaryCollection, {'parent' : "[]"}, "arrangement summary"),
+        (globalvars.dbCollection, getDerivativeSourceQuery(["0" * 32], "tif", ""), "derivative sources"),
+    ]
+
+def getDirectoryRegex(dirName):
+    # Matches the paths of the files directly in dirName. The regex is anchored on
+    # a literal prefix, so that it is looked up in an index, instead of scanned for.
+    return "^" + re.escape(os.path.join(dirName, "")) + "[^" + re.escape(os.sep) + "]*$"
+
+def getDerivativeSourceQuery(paramHashList, sourceFileType, lastId):
+    """getDerivativeSourceQuery
+
+    Arguments:
+        paramHashList: parameter hashes of the requested derivatives.
+        sourceFileType: extension of the source files, e.g., "tif".
+        lastId: _id of the last record of the previous page, or "" for the first page.
+
+    This function returns the query of a page of the records selected by
+    derivatives.py -d: the records after lastId, in _id order, with a technical
+    image profile. When the events are kept in the records, only those archived
+    with the sourceFileType extension, and lacking a migration event for at least
+    one of the parameter hashes, are selected (otherwise, these are checked once
+    the events are reassembled). The _id range is looked up in the _id index, so
+    that each page is read without scanning the whole collection.
+
+    """
+
+    techField = ".".join([globalvars.labels.tech_entity.name, globalvars.labels.img_entity.name])
+    eventExtField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name, globalvars.labels.evt_entity.name,
+                              globalvars.labels.evt_detail_parent.name, globalvars.labels.evt_detail_info.name, globalvars.labels.evt_detail_ext.name])
+
+    query = {'_id': {'$gt': lastId}, techField: {'$exists': True}}
+    if globalvars.dbEventsCollection == None:
+        paramHashField = ".".join([eventExtField, globalvars.labels.evt_detail_paramHash.name])
+        dstField = ".".join([eventExtField, globalvars.labels.evt_detail_dst.name])
+        query[dstField] = {'$regex': re.escape("." + sourceFileType) + "$", '$options': "i"}
+        query['$or'] = [{paramHashField: {'$ne': paramHash}} for paramHash in paramHashList]
+
+    return query
+
+def getEventListField():
+    return ".".join([globalvars.labels.pres_entity.name, globalvars.labels.evt_parent_entity.name])
+
+def getEventSeq():
+    # Strictly increasing, so that the events of a record are reassembled in the
+    # order they were written, even those written in the same second.
+    globalvars.eventSeq = max(globalvars.eventSeq + 1, time_ns())
+    return globalvars.eventSeq
+
+def getEventOps(id, eventList, upsert=False):
+    """getEventOps
+
+    Arguments:
+        id: id of the metadata record the events are about
+        eventList: list of PREMIS event records
+        upsert: if True, the events are upserted, so that writing them again is harmless.
+
+    This function returns the bulk write operations inserting the events in the
+    events collection, as documents of their own:
+
+        {"_id": "<record id>/<event identifier>", "objectId": <record id>, "seq": <write order>, "event": {...}}
+
+    where the record id is part of the _id, since the same event may be recorded
+    for many records (see updateRecordsInDB()).
+
+    """
+
+    eventOps = []
+    for eventRecord in eventList:
+        eventDocument = dict(eventRecord)
+        eventDocument['objectId'] = id
+        eventDocument['seq'] = getEventSeq()
+        eventId = eventRecord.get(globalvars.labels.evt_entity.name, {}).get(globalvars.labels.evt_id.name, {}).get(globalvars.labels.evt_id_val.name)
+        if eventId == None:
+            eventId = getUniqueID()
+        eventId = "/".join([str(id), eventId])
+
+        if upsert == True:
+            eventOps.append(globalvars.dbBackend.UpdateOne({'_id': eventId}, {'$setOnInsert': eventDocument}, upsert=True))
+        else:
+            eventDocument['_id'] = eventId
+            eventOps.append(globalvars.dbBackend.InsertOne(eventDocument))
+
+    return eventOps
+
+def splitEvents(metadataRecord):
+    """splitEvents
+
+    Arguments:
+        metadataRecord: a metadata record, with its event list.
+
+    This function returns the record to be written to the records collection, and
+    the events to be written to the events collection. If the events are kept in
+    the records (no "dbeventscollection" setting), these are the record and an
+    empty list; otherwise, a copy of the record without its event list, and the list.
+
+    """
+
+    if globalvars.dbEventsCollection == None:
+        return metadataRecord, []
+
+    premisEntity = dict(metadataRecord[globalvars.labels.pres_entity.name])
+    eventList = premisEntity.pop(globalvars.labels.evt_parent_entity.name, [])
+    record = dict(metadataRecord)
+    record[globalvars.labels.pres_entity.name] = premisEntity
+
+    return record, eventList
+
+def getRecordUpdate(metadataRecord, eventList):
+    # The update setting the metadata fields of a record, and appending the events
+    # to its event list, unless the events are kept in the events collection.
+    update = {}
+    if len(metadataRecord) > 0:
+        update['$set'] = metadataRecord
+    if len(eventList) > 0 and globalvars.dbEventsCollection == None:
+        update['$push'] = {getEventListField(): {'$each': eventList}}
+    return update
+
+def writeEvents(eventOps):
+    # Writes the events in unordered bulk writes of globalvars.DB_BULK_BATCH_SIZE events.
+    for start in range(0, len(eventOps), globalvars.DB_BULK_BATCH_SIZE):
+        globalvars.dbHandle[globalvars.dbEventsCollection].bulk_write(eventOps[start:start + globalvars.DB_BULK_BATCH_SIZE], ordered=False)
+
+def assembleEvents(records):
+    """assembleEvents
+
+    Arguments:
+        records: an iterable of metadata records, e.g., the cursor of a query.
+
+    This function yields the records, with their event lists, as if the events were
+    kept in the records. When they are kept in the events collection, the events
+    of globalvars.DB_QUERY_CHUNK_SIZE records at a time are looked up with a single
+    query, and appended to the records in the order they were written.
+
+    """
+
+    if globalvars.dbEventsCollection == None:
+        yield from records
+        return
+
+    recordChunk = []
+    for record in records:
+        recordChunk.append(record)
+        if len(recordChunk) >= globalvars.DB_QUERY_CHUNK_SIZE:
+            yield from attachEvents(recordChunk)
+            recordChunk = []
+
+    yield from attachEvents(recordChunk)
+
+def attachEvents(recordChunk):
+    if len(recordChunk) == 0:
+        return []
+
+    eventLists = {record['_id']: [] for record in recordChunk}
+    eventDocuments = getReadCollection(globalvars.dbEventsCollection).find({'objectId': {'$in': list(eventLists.keys())}})
+    for eventDocument in sorted(eventDocuments, key=lambda eventDocument: eventDocument['seq']):
+        eventLists[eventDocument['objectId']].append({globalvars.labels.evt_entity.name: eventDocument[globalvars.labels.evt_entity.name]})
+
+    for record in recordChunk:
+        record.setdefault(globalvars.labels.pres_entity.name, {})[globalvars.labels.evt_parent_entity.name] = eventLists[record['_id']]
+
+    return recordChunk
 
 def insertRecordInDB(metadataRecord):
     """insertRecordInDB
@@ -99,13 +478,18 @@ def insertRecordInDB(metadataRecord):
         metadataRecord: the metadata record to be inserted
 
     This function creates a database entry pertaining to the file being transferred.
+    If the events are kept in the events collection, they are inserted there, after
+    the record.
 
     """
 
+    record, eventList = splitEvents(metadataRecord)
+
     try:
-        dbInsertResult = globalvars.dbHandle[globalvars.dbCollection].insert_one(metadataRecord)
-    except pymongo.errors.PyMongoError as ExceptionPyMongoError:
-        print_error(ExceptionPyMongoError)
+        dbInsertResult = globalvars.dbHandle[globalvars.dbCollection].insert_one(record)
+        writeEvents(getEventOps(record["_id"], eventList))
+    except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+        print_error(ExceptionDatabase)
         print_error(errorcodes.ERROR_CANNOT_INSERT_INTO_DB["message"])
         return(errorcodes.ERROR_CANNOT_INSERT_INTO_DB["code"])
 
@@ -124,13 +508,203 @@ def updateRecordInDB(id, metadataRecord):
 
     try:
         dbUpdateResult = globalvars.dbHandle[globalvars.dbCollection].update_one({'_id' : id}, {'$set' : metadataRecord})
-    except pymongo.errors.PyMongoError as ExceptionPyMongoError:
-        print_error(ExceptionPyMongoError)
+    except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+        print_error(ExceptionDatabase)
         print_error(errorcodes.ERROR_CANNOT_UPDATE_DB["message"])
         return(errorcodes.ERROR_CANNOT_UPDATE_DB["code"])
 
     return(str(dbUpdateResult.upserted_id))
 
+def updateRecordsInDB(query, metadataRecord, eventList):
+    """updateRecordsInDB
+
+    Arguments:
+        query: the query selecting the metadata records to be updated
+        metadataRecord: the metadata fields to be set on the selected records
+        eventList: list of PREMIS event records to be appended to the records' event lists
+
+    This function sets the metadata fields and appends the events to all the records
+    selected by the query, with a single update on the database server, and returns
+    the result of the update, with the number of records matched and modified.
+
+    If the events are kept in the events collection, the records are updated in
+    chunks of globalvars.DB_QUERY_CHUNK_SIZE instead, each update stamping the records
+    it modified with a token of its own. The events are then inserted only for the
+    records carrying the token, i.e., those that did receive the update, even if other
+    records (or the same ones) were modified in the meantime.
+
+    """
+
+    update = getRecordUpdate(metadataRecord, eventList)
+    collection = globalvars.dbHandle[globalvars.dbCollection]
+
+    try:
+        if globalvars.dbEventsCollection == None or len(eventList) == 0:
+            return collection.update_many(query, update)
+
+        recordIds = [record['_id'] for record in collection.find(query, {'_id' : 1})]
+        matchedCount = 0
+        modifiedCount = 0
+        for chunkStart in range(0, len(recordIds), globalvars.DB_QUERY_CHUNK_SIZE):
+            chunkIds = recordIds[chunkStart:chunkStart + globalvars.DB_QUERY_CHUNK_SIZE]
+            updateToken = getUniqueID()
+            chunkUpdate = dict(update)
+            chunkUpdate['$set'] = dict(update.get('$set', {}))
+            chunkUpdate['$set'][globalvars.DB_UPDATE_TOKEN_FIELD] = updateToken
+
+            # The query is applied again, since the records may have changed since they were read.
+            dbUpdateResult = collection.update_many({'$and' : [query, {'_id' : {'$in' : chunkIds}}]}, chunkUpdate)
+            matchedCount += dbUpdateResult.matched_count
+            modifiedCount += dbUpdateResult.modified_count
+            if dbUpdateResult.modified_count == 0:
+                continue
+
+            tokenQuery = {'_id' : {'$in' : chunkIds}, globalvars.DB_UPDATE_TOKEN_FIELD : updateToken}
+            updatedIds = [record['_id'] for record in collection.find(tokenQuery, {'_id' : 1})]
+            writeEvents([eventOp for id in updatedIds for eventOp in getEventOps(id, eventList)])
+            collection.update_many(tokenQuery, {'$unset' : {globalvars.DB_UPDATE_TOKEN_FIELD : ""}})
+    except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+        print_error(ExceptionDatabase)
+        print_error(errorcodes.ERROR_CANNOT_UPDATE_DB["message"])
+        return(errorcodes.ERROR_CANNOT_UPDATE_DB["code"])
+
+    return UpdateResult(matchedCount, modifiedCount)
+
+def queueRecordUpdate(id, metadataRecord, eventList):
+    """queueRecordUpdate
+
+    Arguments:
+        id: id of the metadata record to be updated
+        metadataRecord: the metadata fields to be set on the existing record
+        eventList: list of PREMIS event records to be appended to the record's event list
+
+    This function queues a single update operation that sets the metadata fields and
+    appends the events to the record in one go (or, if the events are kept in the
+    events collection, their inserts there). The queued operations are sent to the
+    database with flushRecordUpdates(), which is called automatically once
+    globalvars.DB_BULK_BATCH_SIZE operations are pending.
+
+    """
+
+    update = getRecordUpdate(metadataRecord, eventList)
+    if len(update) > 0:
+        globalvars.dbBulkOps.append(globalvars.dbBackend.UpdateOne({'_id': id}, update))
+        globalvars.dbBulkOpIds.append(id)
+
+    if globalvars.dbEventsCollection != None:
+        eventOps = getEventOps(id, eventList)
+        globalvars.dbEventBulkOps.extend(eventOps)
+        globalvars.dbEventBulkOpIds.extend([id] * len(eventOps))
+
+    if len(globalvars.dbBulkOps) + len(globalvars.dbEventBulkOps) >= globalvars.DB_BULK_BATCH_SIZE:
+        return flushRecordUpdates()
+
+    return 0
+
+def queueRecordDelete(id):
+    """queueRecordDelete
+
+    Arguments:
+        id: id of the metadata record to be deleted
+
+    This function queues the deletion of a record, to be sent to the database in
+    the same bulk writes as the operations queued by queueRecordUpdate(). The events
+    collection is append-only: the events of the record, if kept there, are left as
+    a trail of the record.
+
+    """
+
+    globalvars.dbBulkOps.append(globalvars.dbBackend.DeleteOne({'_id': id}))
+    globalvars.dbBulkOpIds.append(id)
+
+    if len(globalvars.dbBulkOps) + len(globalvars.dbEventBulkOps) >= globalvars.DB_BULK_BATCH_SIZE:
+        return flushRecordUpdates()
+
+    return 0
+
+def getFailedOpIndexes(ExceptionDatabase, numOps):
+    # Indexes of the operations of an unordered bulk write that failed: those reported
+    # by the database, or all of them if it does not say which (e.g., on a lost
+    # connection, or a write concern error).
+    details = getattr(ExceptionDatabase, 'details', None) or {}
+    if len(details.get('writeErrors', [])) == 0 or len(details.get('writeConcernErrors', [])) > 0:
+        return range(numOps)
+    return [writeError['index'] for writeError in details['writeErrors']]
+
+def flushRecordUpdates():
+    """flushRecordUpdates
+
+    Arguments:
+        none
+
+    This function sends all the operations queued by queueRecordUpdate() and
+    queueRecordDelete() to the database in a single unordered bulk write (plus one
+    for the events collection, if used), and returns the number of records modified
+    or deleted, and of events inserted. The ids of the records whose operations
+    failed are added to globalvars.dbFailedRecordIds, so that the callers can tell
+    which records were written; if the events cannot be written, the records are
+    not written either.
+
+    """
+
+    if len(globalvars.dbBulkOps) == 0 and len(globalvars.dbEventBulkOps) == 0:
+        return 0
+
+    bulkOps = globalvars.dbBulkOps
+    bulkOpIds = globalvars.dbBulkOpIds
+    globalvars.dbBulkOps = []
+    globalvars.dbBulkOpIds = []
+    eventBulkOps = globalvars.dbEventBulkOps
+    eventBulkOpIds = globalvars.dbEventBulkOpIds
+    globalvars.dbEventBulkOps = []
+    globalvars.dbEventBulkOpIds = []
+
+    numWritten = 0
+    try:
+        if len(eventBulkOps) > 0:
+            try:
+                numWritten += globalvars.dbHandle[globalvars.dbEventsCollection].bulk_write(eventBulkOps, ordered=False).inserted_count
+            except globalvars.dbBackend.DatabaseError:
+                globalvars.dbFailedRecordIds.update(eventBulkOpIds + bulkOpIds)
+                raise
+        if len(bulkOps) > 0:
+            try:
+                dbBulkResult = globalvars.dbHandle[globalvars.dbCollection].bulk_write(bulkOps, ordered=False)
+            except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+                globalvars.dbFailedRecordIds.update(bulkOpIds[index] for index in getFailedOpIndexes(ExceptionDatabase, len(bulkOps)))
+                raise
+            numWritten += dbBulkResult.modified_count + dbBulkResult.deleted_count
+    except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+        print_error(ExceptionDatabase)
+        print_error(errorcodes.ERROR_CANNOT_UPDATE_DB["message"])
+        return(errorcodes.ERROR_CANNOT_UPDATE_DB["code"])
+
+    return numWritten
+
+def findRecordsById(idList, fieldList=None):
+    """findRecordsById
+
+    Arguments:
+        idList: ids of the metadata records to be looked up
+        fieldList: (dotted) names of the fields to be returned for each record. If
+                   None, the whole records are returned.
+
+    This function looks up a list of records with a single query, and returns a
+    dictionary of the records found, by id. Ids that are not found are left out.
+    The whole event lists are returned if any of the fields is in the events.
+
+    """
+
+    projection = None
+    if fieldList != None:
+        projection = {field: 1 for field in fieldList}
+
+    records = getReadCollection(globalvars.dbCollection).find({'_id': {'$in': list(idList)}}, projection)
+    if fieldList == None or any(field.startswith(getEventListField()) for field in fieldList):
+        records = assembleEvents(records)
+
+    return {record['_id']: record for record in records}
+
 def deleteRecordFromDB(id):
     """deleteRecordFromDB
 
@@ -155,13 +729,14 @@ def getHighestSerialNo(dirName):
         dirName: the directory/path that needs to be looked up in the database.
 
     This function finds the highest serial number corresponding to the specified dirName.
-    dirName is expected to match one of the fields called "originalName" in the PREMIS entity.
+    dirName is expected to be the directory of the files in the fields called "originalName"
+    in the PREMIS entity.
 
     """
 
     queryField = ".".join([globalvars.labels.pres_entity.name, globalvars.labels.obj_entity.name, globalvars.labels.obj_orig_name.name])
     serialNoLabel = ".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name, globalvars.labels.serial_nbr.name])
-    records = globalvars.dbHandle[globalvars.dbCollection].find({queryField: {"$regex": dirName}}, {"_id": 0, serialNoLabel: 1})
+    records = globalvars.dbHandle[globalvars.dbCollection].find({queryField: {"$regex": getDirectoryRegex(dirName)}}, {"_id": 0, serialNoLabel: 1})
     records = [record for record in records]
 
     if len(records) == 0:
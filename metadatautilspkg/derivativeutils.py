@@ -0,0 +1,857 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from time import monotonic
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow, derivatives are generated with ImageMagick's convert.
+    Image = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import metadatautilspkg.globalvars as globalvars
+from metadatautilspkg.cmdrunner import runCmdMap
+
+renderPool = None  # Pool of worker processes rendering the derivatives, created on first use.
+renderPoolLock = threading.Lock()  # Guards the creation of the pool and its render slots, for multi-threaded callers.
+renderSlots = None  # Shared array of the pid of the worker running each submitted render (0 until it starts).
+renderStartTimes = None  # Shared array of the monotonic() time each submitted render started at.
+freeRenderSlots = []  # Indexes of the render slots not in use.
+renderWorkers = {}  # Worker processes of the pool seen so far, by pid, for the exit codes of crashed ones.
+workerRenderSlots = None  # In a worker process, the render slots of its pool.
+workerRenderStartTimes = None  # In a worker process, the start times of the renders of its pool.
+
+RENDER_SLOTS = 4096  # Max. no. of renders submitted to the pool at a time.
+renderSlotSemaphore = threading.BoundedSemaphore(RENDER_SLOTS)  # Held for each render slot in use.
+RENDER_POLL_INTERVAL = 1  # Seconds between checks for crashed workers, while waiting for a render.
+
+# Image modes that are converted before resizing, since they cannot be resampled
+# smoothly (bilevel, palette and 16/32-bit images).
+RESIZE_MODES = {"1": "L", "P": "RGBA", "I;16": "L", "I;16B": "L", "I": "L", "F": "L"}
+
+# 16-bit image modes, scaled down to 8 bits by dropping the low byte.
+SIXTEEN_BIT_MODES = ("I;16", "I;16L", "I;16B", "I;16N")
+# 32-bit integer and float image modes, whose range is stretched to 8 bits.
+WIDE_MODES = ("I", "F")
+
+# Image modes that can be decoded band by band and reduced with Image.reduce().
+BAND_MODES = ("L", "LA", "RGB", "RGBA", "CMYK")
+
+# The image is decoded at a reduced resolution of at least this many times the size
+# of the largest derivative, and then resampled. Matches the reducing_gap of resize().
+SHRINK_ON_LOAD_GAP = 3.0
+
+BAND_MIN_ROWS = 256  # Min. no. of rows of a full-resolution band decoded at a time.
+
+# Private attributes of Pillow's TIFF images, set to decode a band of a page as an image
+# of its own (see iterBands()). Pages are decoded whole with the Pillow versions without them.
+BAND_DECODE_ATTRIBUTES = ("_size", "_tile_size")
+
+JP2_CODESTREAM_MARKER = b"\xff\x4f\xff\x51"  # SOC followed by SIZ.
+JP2_COD_MARKER = b"\xff\x52"
+JP2_HEADER_SIZE = 65536  # No. of bytes searched for the COD marker segment.
+
+TIFF_NEW_SUBFILE_TYPE_TAG = 254
+TIFF_REDUCED_RESOLUTION = 1  # Bit of the NewSubfileType tag set on reduced-resolution pages.
+
+DZI_FILETYPE = "dzi"  # Destination filetype of tiled deep zoom (DZI) pyramids.
+DZI_FORMAT = "DZI"  # Output "format" of DZI pyramids, which are not written by a single Pillow plugin.
+DZI_XML = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{}" Overlap="0" TileSize="{}">\n'
+           '    <Size Width="{}" Height="{}"/>\n'
+           '</Image>\n')
+
+# Image modes each output format can store. Others are converted to the first mode listed.
+SAVE_MODES = {"JPEG": ("RGB", "L", "CMYK"), "JPEG2000": ("RGB", "RGBA", "L"), "GIF": ("P", "L"), "BMP": ("RGB", "L")}
+
+
+def isPillowAvailable():
+    return Image != None
+
+
+def getOutputFormat(fileType):
+    """getOutputFormat(): Returns the Pillow format name (e.g., "JPEG") for a file
+    type given as an extension (e.g., "jpg"), or None if Pillow is not installed or
+    cannot write that file type. Returns DZI_FORMAT for deep zoom pyramids.
+    """
+    if isPillowAvailable() != True:
+        return None
+
+    if fileType.lower() == DZI_FILETYPE:
+        return DZI_FORMAT
+
+    formatName = Image.registered_extensions().get("." + fileType.lower())
+    if formatName not in Image.SAVE:
+        return None
+
+    return formatName
+
+
+def parseGeometry(geometry):
+    """parseGeometry(): Returns the (width, height) box of an ImageMagick style
+    geometry (e.g., "64x72" or "64x72.5"), or None if it is not valid. A missing
+    dimension (e.g., "x72") is returned as None, and leaves that side unconstrained.
+    """
+    try:
+        boxWidth, boxHeight = [max(1, round(float(dim))) if dim != "" else None for dim in geometry.split("x")]
+    except ValueError:
+        return None
+
+    return (boxWidth, boxHeight)
+
+
+def getDerivativeGeometry(xRes, yRes, resize):
+    """getDerivativeGeometry(): Returns the geometry (e.g., "64x72") of a derivative of
+    the given size, from the resolution recorded in the technical profile of its source.
+    """
+    if(xRes >= yRes):
+        return "x".join([resize, yRes])
+    else:
+        return "x".join([xRes, resize])
+
+
+def formatGeometry(boxWidth, boxHeight):
+    return "x".join([str(dim) if dim != None else "" for dim in (boxWidth, boxHeight)])
+
+
+def getParamHash(fileType, resize, quality, tiling=None):
+    """getParamHash(): Returns a hash of the parameters a derivative is requested with,
+    recorded in its migration event, to tell whether an existing derivative is up to
+    date with the parameters of the current run. It does not depend on the source
+    file, so that the records lacking a derivative can be queried by hash.
+    """
+    params = {"fileType": fileType.lower(), "resize": resize, "quality": quality}
+    if tiling != None:
+        params["tiling"] = tiling
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def getFitSize(srcWidth, srcHeight, boxWidth, boxHeight):
+    """getFitSize(): Returns the largest size with the aspect ratio of the source image
+    that fits within the box, the same geometry as ImageMagick's "-resize WxH".
+    """
+    scales = [boxDim / srcDim for boxDim, srcDim in ((boxWidth, srcWidth), (boxHeight, srcHeight)) if boxDim != None]
+    scale = min(scales) if len(scales) > 0 else 1
+    return (max(1, round(srcWidth * scale)), max(1, round(srcHeight * scale)))
+
+
+def getJobResult(exitCode, message, numOutputs):
+    return {"exitCode": exitCode, "message": message,
+            "outputs": [{"exitCode": exitCode, "message": message, "width": "", "height": ""}] * numOutputs}
+
+
+def getJp2DecompositionLevels(filePath):
+    """getJp2DecompositionLevels(): Returns the no. of wavelet decomposition levels
+    of a JPEG 2000 file, i.e., the no. of reduced resolutions it can be decoded at,
+    read from the COD marker segment of its codestream. Returns 0 if not found.
+    """
+    with open(filePath, "rb") as jp2FileHandle:
+        header = jp2FileHandle.read(JP2_HEADER_SIZE)
+
+    codestreamStart = header.find(JP2_CODESTREAM_MARKER)
+    if codestreamStart < 0:
+        return 0
+
+    # COD: marker (2 bytes), Lcod (2), Scod (1), SGcod (4), then the no. of levels (1).
+    codStart = header.find(JP2_COD_MARKER, codestreamStart)
+    if codStart < 0 or codStart + 9 >= len(header):
+        return 0
+
+    return header[codStart + 9]
+
+
+def getReducedResolutionPages(srcImage):
+    """getReducedResolutionPages(): Returns a list of (pageNum, width, height) of the
+    reduced-resolution pages of a pyramidal TIFF file (e.g., the overviews written
+    by scanning software), which can be decoded instead of the full-resolution page.
+    """
+    pages = []
+    for pageNum in range(1, getattr(srcImage, "n_frames", 1)):
+        srcImage.seek(pageNum)
+        if srcImage.tag_v2.get(TIFF_NEW_SUBFILE_TYPE_TAG, 0) & TIFF_REDUCED_RESOLUTION:
+            pages.append((pageNum, srcImage.width, srcImage.height))
+    srcImage.seek(0)
+
+    return pages
+
+
+def shiftTile(tile, yOffset):
+    extents = (tile[1][0], tile[1][1] + yOffset, tile[1][2], tile[1][3] + yOffset)
+    if hasattr(tile, "_replace"):  # Tiles are namedtuples since Pillow 11.
+        return tile._replace(extents=extents)
+    return (tile[0], extents, tile[2], tile[3])
+
+
+def getRawTileRowBytes(tile, mode):
+    """getRawTileRowBytes(): Returns the no. of bytes of each row of an uncompressed
+    strip (or tile), stored from the top down, or None if it is compressed, or its
+    rows cannot be told apart.
+    """
+    if tile[0] != "raw" or not isinstance(tile[3], tuple) or len(tile[3]) != 3:
+        return None
+    rawMode, stride, yStep = tile[3]
+    if yStep != 1:
+        return None
+    if stride > 0:
+        return stride
+
+    try:
+        return len(Image.new(mode, (tile[1][2] - tile[1][0], 1)).tobytes("raw", rawMode))
+    except Exception:  # A raw mode Pillow cannot pack.
+        return None
+
+
+def splitRawTile(tile, rowBytes):
+    # Splits an uncompressed strip into strips of BAND_MIN_ROWS rows, decoded on their own.
+    x0, y0, x1, y1 = tile[1]
+    splitTiles = []
+    for rowTop in range(y0, y1, BAND_MIN_ROWS):
+        extents = (x0, rowTop, x1, min(y1, rowTop + BAND_MIN_ROWS))
+        offset = tile[2] + (rowTop - y0) * rowBytes
+        if hasattr(tile, "_replace"):  # Tiles are namedtuples since Pillow 11.
+            splitTiles.append(tile._replace(extents=extents, offset=offset))
+        else:
+            splitTiles.append((tile[0], extents, offset, tile[3]))
+    return splitTiles
+
+
+def getBandTiles(srcImage):
+    # The strips (or tiles) of the current page, with the uncompressed strips taller than
+    # BAND_MIN_ROWS split, e.g., the single strip of the files written by Pillow.
+    bandTiles = []
+    for tile in srcImage.tile:
+        rowBytes = getRawTileRowBytes(tile, srcImage.mode) if tile[1][3] - tile[1][1] > BAND_MIN_ROWS else None
+        bandTiles.extend(splitRawTile(tile, rowBytes) if rowBytes != None else [tile])
+    return bandTiles
+
+
+def isBandStreamable(srcImage):
+    """isBandStreamable(): Returns True if the current page of an image file can be
+    decoded a band at a time (see iterBands()).
+    """
+    return (srcImage.format == "TIFF" and srcImage.use_load_libtiff != True and srcImage.mode in BAND_MODES
+            and all(hasattr(srcImage, attribute) for attribute in BAND_DECODE_ATTRIBUTES)
+            and len(getBandTiles(srcImage)) > 1)
+
+
+def getResizableImage(image):
+    """getResizableImage(): Returns the image converted to a mode that can be resampled
+    (see RESIZE_MODES), or the image itself if it can be resampled as it is.
+
+    Pillow clips high-bit-depth values to 255 when converting to 8 bits, so 16-bit
+    images are scaled by 1/256 first, and 32-bit integer and float images are
+    stretched from their (min, max) range to 0-255.
+    """
+    if image.mode in SIXTEEN_BIT_MODES:
+        image = image.convert("I").point(lambda value: value / 256)
+    elif image.mode in WIDE_MODES:
+        low, high = image.getextrema()
+        scale = 255 / (high - low) if high > low else 1
+        image = image.point(lambda value: value * scale - low * scale)
+
+    if image.mode in RESIZE_MODES:
+        image = image.convert(RESIZE_MODES[image.mode])
+
+    return image
+
+
+def iterBands(filePath, pageNum, multiple):
+    """iterBands(): Decodes a page of a TIFF file a band of strips (or tiles) at a time.
+
+    Only the pages that isBandStreamable() accepts are streamed: pages of L, LA, RGB,
+    RGBA or CMYK images that Pillow decodes itself, rather than with libtiff (which
+    decodes the compressed pages as a whole), and that have more than one strip (or
+    tile) once the uncompressed strips are split into strips of BAND_MIN_ROWS rows.
+    So uncompressed pages are streamed, whether stored in one strip or many, while
+    compressed pages, and pages of other modes (e.g., 16-bit), are decoded whole.
+    Bands are decoded by narrowing a TIFF image to them, through the private
+    attributes of Pillow's TIFF plugin listed in BAND_DECODE_ATTRIBUTES; with the
+    Pillow versions without them, the pages are not streamed.
+
+    Arguments:
+        [1] filePath: path to the TIFF file.
+        [2] pageNum: page of the TIFF file to decode.
+        [3] multiple: the height of every band but the last is a multiple of this.
+
+    Yields:
+        (bandTop, bandImage) for each band, from the top of the page to the bottom.
+    """
+    with Image.open(filePath) as srcImage:
+        srcImage.seek(pageNum)
+        width, height = srcImage.size
+        tileList = getBandTiles(srcImage)
+
+    # Group the strips into bands of at least BAND_MIN_ROWS rows.
+    rowExtents = sorted(set((tile[1][1], tile[1][3]) for tile in tileList))
+    bands = []
+    bandTop = 0
+    for rowTop, rowBottom in rowExtents:
+        bandHeight = rowBottom - bandTop
+        if (bandHeight % multiple == 0 and bandHeight >= BAND_MIN_ROWS) or rowBottom == height:
+            bands.append((bandTop, rowBottom))
+            bandTop = rowBottom
+
+    for bandTop, bandBottom in bands:
+        with Image.open(filePath) as bandImage:
+            bandImage.seek(pageNum)
+            bandImage._size = (width, bandBottom - bandTop)
+            bandImage._tile_size = bandImage._size  # Size of the image memory the TIFF plugin allocates.
+            bandImage.tile = [shiftTile(tile, -bandTop) for tile in tileList if tile[1][1] >= bandTop and tile[1][3] <= bandBottom]
+            bandImage.load()
+            yield bandTop, bandImage.copy()
+
+
+def loadReducedByBands(filePath, pageNum, factor):
+    """loadReducedByBands(): Decodes a page of a TIFF file a band at a time, and reduces
+    each band by the given integer factor as soon as it is decoded. Only the reduced
+    image and one full-resolution band are held in memory.
+
+    Arguments:
+        [1] filePath: path to the TIFF file.
+        [2] pageNum: page of the TIFF file to decode.
+        [3] factor: integer factor by which the page is reduced.
+
+    Returns:
+        The reduced image.
+    """
+    with Image.open(filePath) as srcImage:
+        srcImage.seek(pageNum)
+        width, height = srcImage.size
+        mode = srcImage.mode
+
+    reducedImage = Image.new(mode, (math.ceil(width / factor), math.ceil(height / factor)))
+
+    # The bands are a multiple of the factor high, so that the reduced bands line up exactly.
+    for bandTop, bandImage in iterBands(filePath, pageNum, factor):
+        reducedImage.paste(bandImage.reduce(factor), (0, bandTop // factor))
+
+    return reducedImage
+
+
+def openReducedImage(filePath, reqSize):
+    """openReducedImage(): Decodes an image at the lowest resolution that is still at
+    least reqSize, so that the memory used is proportional to the size of the
+    derivatives rather than to the size of the source image.
+
+    Arguments:
+        [1] filePath: path to the source image.
+        [2] reqSize: (width, height) the decoded image must be at least as large as.
+
+    Returns:
+        The decoded image, and the (width, height) of the full-resolution image.
+
+    JPEG files are decoded at 1/2, 1/4 or 1/8 scale by the JPEG decoder, JPEG 2000
+    files at one of their resolution levels, and pyramidal TIFF files from a reduced-
+    resolution page. Uncompressed TIFF files without reduced-resolution pages are
+    decoded in bands, each reduced as soon as it is decoded. Other files are decoded
+    at full resolution.
+    """
+    srcImage = Image.open(filePath)
+    fullSize = srcImage.size
+
+    try:
+        if reqSize[0] < fullSize[0] and reqSize[1] < fullSize[1]:
+            if srcImage.format == "JPEG":
+                srcImage.draft(srcImage.mode, reqSize)
+
+            elif srcImage.format == "JPEG2000":
+                level = 0
+                maxLevel = getJp2DecompositionLevels(filePath)
+                while (level < maxLevel and (fullSize[0] >> (level + 1)) >= reqSize[0]
+                       and (fullSize[1] >> (level + 1)) >= reqSize[1]):
+                    level += 1
+                srcImage.reduce = level
+
+            elif srcImage.format == "TIFF":
+                pageNum = 0
+                pageSize = fullSize
+                for reducedPageNum, pageWidth, pageHeight in getReducedResolutionPages(srcImage):
+                    if pageWidth >= reqSize[0] and pageHeight >= reqSize[1] and pageWidth < pageSize[0]:
+                        pageNum = reducedPageNum
+                        pageSize = (pageWidth, pageHeight)
+                srcImage.seek(pageNum)
+
+                factor = min(pageSize[0] // reqSize[0], pageSize[1] // reqSize[1])
+                if factor >= 2 and isBandStreamable(srcImage):
+                    srcImage.close()
+                    return loadReducedByBands(filePath, pageNum, factor), fullSize
+
+        srcImage.load()
+        if srcImage.format == "JPEG2000":
+            srcImage.reduce = 0  # Restores Image.reduce(), which the JPEG 2000 plugin shadows.
+    except Exception:
+        srcImage.close()
+        raise
+
+    return srcImage, fullSize
+
+
+def iterFullBands(filePath, bandRows):
+    """iterFullBands(): Yields (bandTop, bandImage) for bands of the full-resolution image
+    in a file, converted for resampling. Uncompressed TIFF files are decoded a band at
+    a time; other files are decoded whole, converted as a whole (so that the range of
+    32-bit images is stretched the same way in every band), and cut into bands of
+    bandRows rows.
+    """
+    srcImage = Image.open(filePath)
+    try:
+        if isBandStreamable(srcImage):  # BAND_MODES, which need no conversion.
+            srcImage.close()
+            yield from iterBands(filePath, 0, bandRows)
+            return
+
+        srcImage.load()
+        image = getResizableImage(srcImage)
+        for bandTop in range(0, image.height, bandRows):
+            yield bandTop, image.crop((0, bandTop, image.width, min(image.height, bandTop + bandRows)))
+    finally:
+        srcImage.close()
+
+
+def writeTilePyramid(filePath, dziFilePath, tileSize, tileFileType, quality):
+    """writeTilePyramid(): Writes a deep zoom (DZI) tile pyramid of an image: a .dzi file
+    describing the pyramid, and a "<name>_files" directory with a sub-directory of
+    tiles ("<column>_<row>.<tileFileType>") for each level, from level 0 (1x1 pixel)
+    to the full-resolution level.
+
+    Arguments:
+        [1] filePath: path to the source image.
+        [2] dziFilePath: path to the .dzi file to be written.
+        [3] tileSize: width and height of the tiles, in pixels.
+        [4] tileFileType: filetype of the tiles (e.g., "jpg").
+        [5] quality: quality of lossy tile formats.
+
+    Returns:
+        The (width, height) of the full-resolution level.
+
+    The source image is read a band of tiles at a time. Each band is cut into tiles
+    and halved for the next level as soon as it is complete, so for uncompressed TIFF
+    files, only about one row of tiles per level is held in memory.
+    """
+    with Image.open(filePath) as srcImage:
+        width, height = srcImage.size
+
+    tileFormat = getOutputFormat(tileFileType)
+    saveModes = SAVE_MODES.get(tileFormat)
+    tilesDir = os.path.splitext(dziFilePath)[0] + "_files"
+    maxLevel = max(0, math.ceil(math.log2(max(width, height))))
+
+    pendingBands = [[] for level in range(maxLevel + 1)]  # Bands of each level that are not cut into tiles yet.
+    tiledRows = [0] * (maxLevel + 1)  # No. of rows of each level that are already cut into tiles.
+
+    def addBand(level, bandImage, isLast):
+        pendingBands[level].append(bandImage)
+        pendingRows = sum(band.height for band in pendingBands[level])
+        if pendingRows < tileSize and isLast != True:
+            return
+
+        # Join the pending bands, and cut all the complete rows of tiles (or the remaining rows, at the end).
+        levelBand = pendingBands[level][0]
+        if len(pendingBands[level]) > 1:
+            levelBand = Image.new(levelBand.mode, (levelBand.width, pendingRows))
+            bandTop = 0
+            for band in pendingBands[level]:
+                levelBand.paste(band, (0, bandTop))
+                bandTop += band.height
+
+        tiledHeight = pendingRows if isLast == True else pendingRows - pendingRows % tileSize
+        pendingBands[level] = [levelBand.crop((0, tiledHeight, levelBand.width, pendingRows))] if tiledHeight < pendingRows else []
+        levelBand = levelBand.crop((0, 0, levelBand.width, tiledHeight))
+
+        levelDir = os.path.join(tilesDir, str(level))
+        os.makedirs(levelDir, exist_ok=True)
+        for tileTop in range(0, tiledHeight, tileSize):
+            for tileLeft in range(0, levelBand.width, tileSize):
+                tile = levelBand.crop((tileLeft, tileTop, min(levelBand.width, tileLeft + tileSize), min(tiledHeight, tileTop + tileSize)))
+                if saveModes != None and tile.mode not in saveModes:
+                    tile = tile.convert(saveModes[0])
+                tileFileName = "{}_{}.{}".format(tileLeft // tileSize, (tiledRows[level] + tileTop) // tileSize, tileFileType)
+                tile.save(os.path.join(levelDir, tileFileName), tileFormat, quality=quality)
+        tiledRows[level] += tiledHeight
+
+        # The rows tiled are an even no. of rows (except at the end), so they halve exactly for the next level.
+        if level > 0:
+            addBand(level - 1, levelBand.reduce(2), isLast)
+
+    bands = iterFullBands(filePath, tileSize)
+    nextBand = next(bands, None)
+    while nextBand != None:
+        bandTop, bandImage = nextBand
+        nextBand = next(bands, None)
+        addBand(maxLevel, bandImage, nextBand is None)
+
+    with open(dziFilePath, "w") as dziFileHandle:
+        dziFileHandle.write(DZI_XML.format(tileFileType, tileSize, width, height))
+
+    return (width, height)
+
+
+def initRenderWorker(maxMemory, slots, startTimes):
+    """initRenderWorker(): Sets up a worker process of the render pool. The image
+    plugins are loaded once here and reused for every file the worker renders.
+    """
+    global workerRenderSlots, workerRenderStartTimes
+    workerRenderSlots = slots
+    workerRenderStartTimes = startTimes
+
+    if resource != None and maxMemory > 0:
+        maxMemoryBytes = maxMemory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (maxMemoryBytes, maxMemoryBytes))
+    Image.init()
+
+
+def renderSlotDerivative(slot, job):
+    # Runs renderDerivative() in a worker, after recording the worker and the start time
+    # in the render slot, so that the parent can tell when the worker running it has
+    # crashed, and for how long it has been running. monotonic() is system-wide.
+    workerRenderStartTimes[slot] = monotonic()
+    workerRenderSlots[slot] = os.getpid()
+    return renderDerivative(job)
+
+
+def renderDerivative(job):
+    """renderDerivative(): Generates all the derivative images of a source file from
+    a single decode of it. Runs in a render pool worker.
+
+    Arguments:
+        [1] job: dictionary with the path of the source file ("fullPath"), and a list of
+                 "outputs", each a dictionary with the path of the derivative
+                 ("derivedFilePath"), the box it must fit in ("boxWidth", "boxHeight"),
+                 and its "format" and "quality".
+
+    Returns:
+        A dictionary with the "exitCode" (0 on success, as for runCmd()) and error
+        "message" of decoding the source file, and a list of "outputs" with the
+        "exitCode", "message", "width" and "height" of each derivative.
+
+    The source file is decoded at the lowest resolution that is large enough for
+    the largest derivative (see openReducedImage()). The derivatives are generated
+    from the largest to the smallest, each one downscaled from the previous one.
+    """
+    outputs = job["outputs"]
+    outputResults = [None] * len(outputs)
+
+    # Tile pyramids are written from the full-resolution image, a band at a time.
+    for outputNum, output in enumerate(outputs):
+        if output["format"] == DZI_FORMAT:
+            try:
+                dziSize = writeTilePyramid(job["fullPath"], output["derivedFilePath"], output["tileSize"], output["tileFileType"], output["quality"])
+            except Exception as tileException:
+                outputResults[outputNum] = {"exitCode": 1, "message": "{}: {}".format(type(tileException).__name__, tileException),
+                                            "width": "", "height": ""}
+                continue
+            outputResults[outputNum] = {"exitCode": 0, "message": "", "width": dziSize[0], "height": dziSize[1]}
+
+    outputNums = [outputNum for outputNum, output in enumerate(outputs) if output["format"] != DZI_FORMAT]
+    if len(outputNums) == 0:
+        return {"exitCode": 0, "message": "", "outputs": outputResults}
+
+    try:
+        with Image.open(job["fullPath"]) as srcImage:
+            fullSize = srcImage.size
+        fitSizes = {outputNum: getFitSize(fullSize[0], fullSize[1], outputs[outputNum]["boxWidth"], outputs[outputNum]["boxHeight"])
+                    for outputNum in outputNums}
+
+        # Decode at the lowest resolution that leaves room to resample the largest derivative.
+        reqSize = (math.ceil(max(fitSize[0] for fitSize in fitSizes.values()) * SHRINK_ON_LOAD_GAP),
+                   math.ceil(max(fitSize[1] for fitSize in fitSizes.values()) * SHRINK_ON_LOAD_GAP))
+        srcImage, fullSize = openReducedImage(job["fullPath"], reqSize)
+    except Exception as decodeException:  # Any decoding error fails just this file.
+        return getJobResult(1, "{}: {}".format(type(decodeException).__name__, decodeException), len(outputs))
+
+    try:
+        image = getResizableImage(srcImage)
+    except Exception as convertException:
+        srcImage.close()
+        return getJobResult(1, "{}: {}".format(type(convertException).__name__, convertException), len(outputs))
+
+    prevImage = image
+
+    for outputNum in sorted(outputNums, key=lambda num: fitSizes[num][0] * fitSizes[num][1], reverse=True):
+        output = outputs[outputNum]
+        fitSize = fitSizes[outputNum]
+
+        try:
+            if prevImage.width < fitSize[0] or prevImage.height < fitSize[1]:
+                prevImage = image  # Enlarged from the decoded image.
+            if prevImage.size != fitSize:
+                prevImage = prevImage.resize(fitSize, Image.LANCZOS, reducing_gap=3.0)
+
+            outImage = prevImage
+            saveModes = SAVE_MODES.get(output["format"])
+            if saveModes != None and outImage.mode not in saveModes:
+                outImage = outImage.convert(saveModes[0])
+
+            outImage.save(output["derivedFilePath"], output["format"], quality=output["quality"], optimize=True)
+        except Exception as renderException:  # Any resizing or encoding error fails just this derivative.
+            outputResults[outputNum] = {"exitCode": 1, "message": "{}: {}".format(type(renderException).__name__, renderException),
+                                        "width": "", "height": ""}
+            continue
+
+        outputResults[outputNum] = {"exitCode": 0, "message": "", "width": fitSize[0], "height": fitSize[1]}
+
+    srcImage.close()
+
+    return {"exitCode": 0, "message": "", "outputs": outputResults}
+
+
+def getConvertCmd(job):
+    """getConvertCmd(): Returns the ImageMagick convert command generating all the
+    derivatives of a job from one decode, from the largest to the smallest, e.g.,
+    "convert <src> -resize 1200x1200 -write <dst1> -resize 64x64 <dst2>".
+    """
+    outputs = sorted(job["outputs"], key=lambda output: (output["boxWidth"] or 0) * (output["boxHeight"] or 0), reverse=True)
+    cmd = ['convert', job["fullPath"]]
+    for outputNum, output in enumerate(outputs):
+        cmd += ['-resize', formatGeometry(output["boxWidth"], output["boxHeight"])]
+        if outputNum < len(outputs) - 1:
+            cmd += ['-write']
+        cmd += [output["derivedFilePath"]]
+
+    return cmd
+
+
+def getRenderPool():
+    global renderPool, renderSlots, renderStartTimes
+    with renderPoolLock:
+        if renderPool is None:
+            # The start method is the platform default, unless set (see globalvars.renderStartMethod).
+            renderContext = multiprocessing.get_context(globalvars.renderStartMethod)
+            renderSlots = renderContext.Array('i', RENDER_SLOTS, lock=False)
+            renderStartTimes = renderContext.Array('d', RENDER_SLOTS, lock=False)
+            freeRenderSlots[:] = range(RENDER_SLOTS)
+            renderPool = renderContext.Pool(processes=max(1, globalvars.numWorkers), initializer=initRenderWorker,
+                                            initargs=(globalvars.cmdMaxMemory, renderSlots, renderStartTimes))
+        return renderPool
+
+
+def detachRenderPool():
+    """detachRenderPool(): Takes the render pool out of use, so that the next render
+    starts a new one, and returns it (or None) to be stopped with stopRenderPool().
+    Detaching is quick, so it can be done while holding a lock, and the pool stopped
+    once the lock is released.
+    """
+    global renderPool
+    with renderPoolLock:
+        pool = renderPool
+        renderPool = None
+        if pool != None:
+            renderWorkers.clear()
+    return pool
+
+
+def stopRenderPool(pool, terminate=False):
+    # Stops a detached pool: lets its workers finish their renders, or kills them.
+    if pool != None:
+        if terminate == True:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+
+def closeRenderPool(terminate=False):
+    stopRenderPool(detachRenderPool(), terminate)
+
+
+def updateRenderWorkers():
+    # Records the live workers of the pool, whose exit codes are still known once they are gone.
+    for worker in multiprocessing.active_children():
+        renderWorkers[worker.pid] = worker
+
+
+def submitRender(job):
+    """submitRender(): Submits a job to the render pool.
+
+    Arguments:
+        [1] job: job dictionary, as described for renderDerivative().
+
+    Returns:
+        The render task, to be waited for with waitForRender().
+
+    If RENDER_SLOTS renders are in progress, waits for one of them to be released.
+    The free slots of a new pool are at least as many as the semaphore lets through,
+    since the slots of the renders of a previous pool are only released to it.
+    """
+    pool = getRenderPool()
+    updateRenderWorkers()
+    renderSlotSemaphore.acquire()
+    with renderPoolLock:
+        slots = renderSlots
+        slot = freeRenderSlots.pop()
+        slots[slot] = 0
+        asyncResult = pool.apply_async(renderSlotDerivative, (slot, job))
+    return {"job": job, "slots": slots, "startTimes": renderStartTimes, "slot": slot, "result": asyncResult,
+            "submitted": monotonic(), "released": False}
+
+
+def releaseRenderSlot(renderTask):
+    # Releases the render slot of a task, once, when its result is no longer waited for.
+    with renderPoolLock:
+        if renderTask["released"] == True:
+            return
+        renderTask["released"] = True
+        if renderTask["slots"] is renderSlots:  # The pool has not been restarted since.
+            freeRenderSlots.append(renderTask["slot"])
+    renderSlotSemaphore.release()
+
+
+def getRenderDeadline(renderTask, timeout, fromSubmission):
+    # The monotonic() time a render times out at, or None if it does not (yet).
+    if timeout is None:
+        return None
+    if fromSubmission == True:
+        return renderTask["submitted"] + timeout
+    if renderTask["slots"][renderTask["slot"]] == 0:
+        return None  # Not started yet.
+    return renderTask["startTimes"][renderTask["slot"]] + timeout
+
+
+def getCrashedWorkerExitCode(renderTask):
+    """getCrashedWorkerExitCode(): Returns the exit code of the worker that was running
+    a render, if the worker is no longer alive, e.g., killed for running out of memory,
+    or crashed in a decoder, and None otherwise.
+    """
+    updateRenderWorkers()
+
+    workerPid = renderTask["slots"][renderTask["slot"]]
+    if workerPid == 0:
+        return None  # Not started yet.
+
+    worker = renderWorkers.get(workerPid)
+    if worker != None and worker.exitcode is None:
+        return None
+
+    # A worker replaced and gone between two checks has an unknown exit code, and is
+    # reported as killed, like the workers killed by a signal.
+    if worker is None or worker.exitcode is None or worker.exitcode == 0:
+        return -signal.SIGKILL
+    return worker.exitcode
+
+
+def waitForRender(renderTask, timeout, fromSubmission=False):
+    """waitForRender(): Waits for the result of a render task.
+
+    Arguments:
+        [1] renderTask: the task, as returned by submitRender().
+        [2] timeout: max. no. of seconds the render may take, or None to wait until it ends.
+        [3] fromSubmission: if True, the timeout counts from the submission of the task,
+                            including the time it waits for a worker (e.g., for a client
+                            waiting on it); otherwise, from the start of the render in a
+                            worker, so that the renders queued behind others are not cut
+                            short.
+
+    Returns:
+        The result of renderDerivative(). If the worker running the render crashes,
+        the pool replaces it, but never delivers the result, so the result is then
+        that of a failed command, with the exit code of the worker (e.g., -9 when
+        killed for running out of memory). Raises multiprocessing.TimeoutError on
+        timeout, which is measured from the task, not from the call, so a render
+        that timed out while other tasks were waited for times out at once.
+    """
+    try:
+        while True:
+            deadline = getRenderDeadline(renderTask, timeout, fromSubmission)
+            pollTimeout = RENDER_POLL_INTERVAL if deadline is None else min(RENDER_POLL_INTERVAL, max(0, deadline - monotonic()))
+            try:
+                return renderTask["result"].get(pollTimeout)
+            except multiprocessing.TimeoutError:
+                if deadline != None and monotonic() >= deadline:
+                    raise
+
+            exitCode = getCrashedWorkerExitCode(renderTask)
+            if exitCode != None:
+                return getJobResult(exitCode, "The render worker exited with code {}.".format(exitCode), len(renderTask["job"]["outputs"]))
+    finally:
+        releaseRenderSlot(renderTask)
+
+
+def renderDerivatives(jobList):
+    """renderDerivatives(): Generates the derivative images for a list of jobs.
+
+    Arguments:
+        [1] jobList: list of job dictionaries, as described for renderDerivative().
+
+    Returns:
+        The list of results of renderDerivative(), in the same order as the jobs.
+
+    The images are rendered in-process with Pillow by a pool of globalvars.numWorkers
+    worker processes. If a file takes longer than globalvars.cmdTimeout seconds, the
+    pool is restarted and the file gets the exit code globalvars.CMD_TIMEOUT_EXIT_CODE.
+    If a file crashes its worker, it gets the exit code of the worker (see waitForRender()). Jobs with an output "format" of None (no
+    Pillow, or a file type Pillow cannot write) are run with ImageMagick's convert.
+    """
+    results = [None] * len(jobList)
+    isCmdJob = [any(output["format"] is None for output in job["outputs"]) for job in jobList]
+
+    cmdJobs = [jobNum for jobNum in range(len(jobList)) if isCmdJob[jobNum] == True]
+    cmdResults = runCmdMap([getConvertCmd(jobList[jobNum]) for jobNum in cmdJobs])
+    for jobNum, (output, error, exitcode) in zip(cmdJobs, cmdResults):
+        results[jobNum] = getJobResult(exitcode, error.decode('utf-8', errors='replace').strip(), len(jobList[jobNum]["outputs"]))
+
+    timeout = globalvars.cmdTimeout if globalvars.cmdTimeout > 0 else None
+    pendingJobs = [jobNum for jobNum in range(len(jobList)) if isCmdJob[jobNum] != True]
+
+    while len(pendingJobs) > 0:
+        renderTasks = [(jobNum, submitRender(jobList[jobNum])) for jobNum in pendingJobs]
+        pendingJobs = []
+
+        for taskNum, (jobNum, renderTask) in enumerate(renderTasks):
+            try:
+                results[jobNum] = waitForRender(renderTask, timeout)
+            except multiprocessing.TimeoutError:
+                results[jobNum] = getJobResult(globalvars.CMD_TIMEOUT_EXIT_CODE, "", len(jobList[jobNum]["outputs"]))
+
+                # Stop the stuck worker along with the pool, keep the results that are
+                # already in, and submit the remaining jobs to a new pool.
+                for otherJobNum, otherTask in renderTasks[taskNum + 1:]:
+                    if otherTask["result"].ready():
+                        results[otherJobNum] = otherTask["result"].get()
+                    else:
+                        pendingJobs.append(otherJobNum)
+                    releaseRenderSlot(otherTask)
+                closeRenderPool(terminate=True)
+                break
+
+    return results
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+import pickle
+
+import metadatautilspkg.globalvars as globalvars
+from metadatautilspkg.cmdrunner import findExecutable, runCmd
+
+envCache = None  # Contents of the environment cache file, read on first use.
+envCacheChanged = False
+
+
+def getFileStamp(filePath):
+    """getFileStamp(): Returns the (mtime, size) pair used to tell whether a file has
+    changed since it was cached, or None if the file does not exist.
+    """
+    try:
+        fileStat = os.stat(filePath)
+    except OSError:
+        return None
+    return (fileStat.st_mtime_ns, fileStat.st_size)
+
+
+def loadEnvCache():
+    global envCache
+    if envCache is None:
+        try:
+            with open(globalvars.envCacheFileName, "rb") as envCacheFileHandle:
+                envCache = pickle.load(envCacheFileHandle)
+        except Exception:  # A missing or unreadable cache is simply rebuilt.
+            envCache = {"tools": {}, "configs": {}}
+    return envCache
+
+
+def saveEnvCache():
+    """saveEnvCache(): Writes the environment cache back to its file, if it changed.
+    The cache is only an optimization, so failing to write it is not an error.
+    """
+    global envCacheChanged
+    if envCacheChanged != True:
+        return
+
+    tempFileName = globalvars.envCacheFileName + ".tmp"
+    try:
+        with open(tempFileName, "wb") as envCacheFileHandle:
+            pickle.dump(envCache, envCacheFileHandle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tempFileName, globalvars.envCacheFileName)
+        envCacheChanged = False
+    except OSError:
+        pass
+
+
+def getCachedConfig(fileName, parseFn):
+    """getCachedConfig(): Returns the parsed contents of a configuration file.
+
+    Arguments:
+        [1] fileName: path to the configuration file.
+        [2] parseFn: function that reads and parses the file.
+
+    The parsed contents are kept in the environment cache until the file's
+    modification time or size changes.
+    """
+    global envCacheChanged
+    cache = loadEnvCache()
+    fileStamp = getFileStamp(fileName)
+
+    cachedConfig = cache["configs"].get(fileName)
+    if fileStamp != None and cachedConfig != None and cachedConfig["stamp"] == fileStamp:
+        return cachedConfig["data"]
+
+    data = parseFn(fileName)
+    if fileStamp != None:
+        cache["configs"][fileName] = {"stamp": fileStamp, "data": data}
+        envCacheChanged = True
+        saveEnvCache()
+
+    return data
+
+
+def getImageMagickVersion():
+    """getImageMagickVersion(): Returns the version string of the installed ImageMagick
+    (e.g., "ImageMagick 6.9.10-23 Q16 x86_64 20190101 https://imagemagick.org"), or
+    None if ImageMagick is not installed.
+
+    The output of "identify -version" is kept in the environment cache until the
+    identify binary's modification time or size changes, so that the command is not
+    run on every start.
+    """
+    global envCacheChanged
+    cache = loadEnvCache()
+    toolPath = findExecutable("identify")
+    toolStamp = getFileStamp(toolPath)
+
+    cachedTool = cache["tools"].get(toolPath)
+    if toolStamp != None and cachedTool != None and cachedTool["stamp"] == toolStamp:
+        return cachedTool["version"]
+
+    output, error, exitcode = runCmd(['identify', '-version'])
+    imgversion = output.decode('utf-8').split('\n')
+
+    # remove null values from the list
+    while '' in imgversion:
+        imgversion.remove('')
+
+    version = {}
+    for item in imgversion:
+        if ': ' not in item:
+            return None
+        key, value = item.split(": ", 1)
+        version[key.strip(" ")] = value.strip(" ")
+
+    if 'Version' not in version or 'ImageMagick' not in version['Version']:
+        return None
+
+    if toolStamp != None:
+        cache["tools"][toolPath] = {"stamp": toolStamp, "version": version['Version']}
+        envCacheChanged = True
+        saveEnvCache()
+
+    return version['Version']
@@ -67,3 +67,21 @@ ERROR_SOURCETYPE = {"code": "e26", "message": "Required argument '-s' not passed
 ERROR_DESTTYPE_RESIZE = {"code": "e27", "message": "Required argument '-c' or '-r' not passed in the command line."}
 ERROR_FILE_EXISTS = {"code": "e28", "message": "File '{}' already exists."}
 ERROR_MIGRATED = {"code": "e29", "message": "File '{}' with user input already exists."}
+ERROR_CANNOT_READ_SIGNATURES_FILE = {"code": "e30", "message": "Cannot read the file format signatures file '{}'.".format(globalvars.signaturesFileName)}
+ERROR_INVALID_JSON_IN_SIGNATURES_FILE = {"code": "e31", "message": "The file '{}' is not a valid JSON file. Please check the file for formatting errors.".format(globalvars.signaturesFileName)}
+ERROR_CMD_TIMEOUT = {"code": "e32", "message": "Command timed out after {} seconds on the file '{}'."}
+ERROR_CMD_KILLED = {"code": "e33", "message": "Command was killed by signal {} on the file '{}'."}
+ERROR_CMD_FAILED = {"code": "e34", "message": "Command failed with exit code {} on the file '{}'."}
+ERROR_FILE_QUARANTINED = {"code": "e35", "message": "File '{}' is in quarantine and has been skipped."}
+ERROR_CANNOT_READ_QUARANTINE_FILE = {"code": "e36", "message": "Cannot read the quarantine file '{}'."}
+ERROR_CANNOT_WRITE_QUARANTINE_FILE = {"code": "e37", "message": "Cannot write to the quarantine file '{}'."}
+ERROR_INVALID_GEOMETRY = {"code": "e38", "message": "Invalid derivative dimensions '{}' for the file '{}'."}
+ERROR_CANNOT_WRITE_DERIVATIVE = {"code": "e39", "message": "Cannot write the derivative '{}': {}"}
+ERROR_CANNOT_FIND_FILE = {"code": "e40", "message": "Cannot find the file '{}'."}
+ERROR_CANNOT_WRITE_TILES = {"code": "e41", "message": "Deep zoom pyramids need Pillow, with support for writing '{}' tiles."}
+ERROR_INSTALL_PILLOW = {"code": "e42", "message": "Pillow is not installed."}
+ERROR_INVALID_DATE = {"code": "e43", "message": "Invalid date '{}'."}
+ERROR_MISSING_INDEXES = {"code": "e44", "message": "Some of the database indexes are missing."}
+ERROR_INVALID_DBCONF = {"code": "e45", "message": "Invalid setting in the DB configuration file: {}"}
+ERROR_SUMMARY_NOT_UPDATED = {"code": "e46", "message": "The arrangement summary has not been updated, since some records could not be written. Rebuild it with admin.py --rebuildsummary."}
+ERROR_DERIVATIVE_EVICTED = {"code": "e47", "message": "The derivative '{}' was evicted from the cache before it could be sent. Try again later."}
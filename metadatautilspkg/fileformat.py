@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import os
+
+import metadatautilspkg.globalvars as globalvars
+
+SIGNATURE_LIST_KEY = "signatures"  # Key (in the trie nodes) of the list of signatures that end at that node.
+
+
+def compileSignatures(signatureList):
+    """compileSignatures(): Compiles the file format signatures into a byte-prefix trie.
+
+    Arguments:
+        [1] signatureList: list of signature dictionaries, as read from the signatures file.
+
+    Returns:
+        The root node of the trie. Each node is a dictionary keyed by byte value, and
+        the signatures whose magic number ends at a node are listed under the key
+        SIGNATURE_LIST_KEY, the ones with the most additional checks first.
+    """
+    trie = {}
+    for signature in signatureList:
+        compiledSignature = {}
+        compiledSignature["formatName"] = signature["formatName"]
+        compiledSignature["formatVersion"] = signature.get("formatVersion", "")
+        compiledSignature["match"] = [(match["offset"], bytes.fromhex(match["hex"])) for match in signature.get("match", [])]
+        compiledSignature["matchTail"] = [bytes.fromhex(match["hex"]) for match in signature.get("matchTail", [])]
+        compiledSignature["versionAt"] = signature.get("versionAt", None)
+
+        node = trie
+        for byte in bytes.fromhex(signature["magic"]):
+            node = node.setdefault(byte, {})
+        node.setdefault(SIGNATURE_LIST_KEY, []).append(compiledSignature)
+
+    sortSignatures(trie)
+    return trie
+
+
+def sortSignatures(node):
+    for key, value in node.items():
+        if key == SIGNATURE_LIST_KEY:
+            value.sort(key=lambda signature: len(signature["match"]) + len(signature["matchTail"]), reverse=True)
+        else:
+            sortSignatures(value)
+
+
+def readFileTail(fileHandle, fileSize):
+    """readFileTail(): Reads the last globalvars.FORMAT_ID_TAIL_SIZE bytes of a file,
+    leaving out the part already read as the head of the file.
+    """
+    tailStart = max(globalvars.FORMAT_ID_HEAD_SIZE, fileSize - globalvars.FORMAT_ID_TAIL_SIZE)
+    if tailStart >= fileSize:
+        return b""
+    fileHandle.seek(tailStart)
+    return fileHandle.read(fileSize - tailStart)
+
+
+def decodeFormatVersion(head, versionAt):
+    """decodeFormatVersion(): Reads the format version stored in the header of a file.
+
+    Arguments:
+        [1] head: the first bytes of the file.
+        [2] versionAt: dictionary with the offset and length of the version field,
+                       and its encoding: "ascii" for text versions (e.g., "1.4" in PDF),
+                       "dotted" for a major byte followed by minor bytes printed with two
+                       digits (e.g., "1.02" in JFIF), and "decimal" for bytes joined
+                       with dots (e.g., "3.0" in ID3).
+    """
+    field = head[versionAt["offset"]:versionAt["offset"] + versionAt["length"]]
+    if len(field) != versionAt["length"]:
+        return ""
+
+    if versionAt["encoding"] == "ascii":
+        return field.decode("ascii", errors="replace").strip()
+    elif versionAt["encoding"] == "dotted":
+        return ".".join([str(field[0])] + ["{:02d}".format(byte) for byte in field[1:]])
+    else:
+        return ".".join([str(byte) for byte in field])
+
+
+def identifyFormat(trie, filePath):
+    """identifyFormat(): Identifies the format of a file from its magic number.
+
+    Arguments:
+        [1] trie: the signature trie built by compileSignatures().
+        [2] filePath: path to the file to be identified.
+
+    Returns:
+        A (formatName, formatVersion) tuple, or None if the file matches no signature.
+
+    Only the first globalvars.FORMAT_ID_HEAD_SIZE bytes of the file are read, and the
+    last globalvars.FORMAT_ID_TAIL_SIZE bytes only when a candidate signature needs them.
+    """
+    with open(filePath, "rb") as fileHandle:
+        head = fileHandle.read(globalvars.FORMAT_ID_HEAD_SIZE)
+
+        # Walk down the trie along the head of the file, collecting the signatures
+        # found on the way. The longest magic number is tried first.
+        candidates = []
+        node = trie
+        for byte in head:
+            node = node.get(byte)
+            if node is None:
+                break
+            if SIGNATURE_LIST_KEY in node:
+                candidates.append(node[SIGNATURE_LIST_KEY])
+
+        tail = None
+        for signatureList in reversed(candidates):
+            for signature in signatureList:
+                if not all(head[offset:offset + len(value)] == value for offset, value in signature["match"]):
+                    continue
+
+                if len(signature["matchTail"]) > 0:
+                    if tail is None:
+                        tail = readFileTail(fileHandle, os.fstat(fileHandle.fileno()).st_size)
+                    # Small files are read whole as the head.
+                    window = tail if len(tail) > 0 else head
+                    if not all(value in window for value in signature["matchTail"]):
+                        continue
+
+                formatVersion = signature["formatVersion"]
+                if signature["versionAt"] is not None:
+                    formatVersion = decodeFormatVersion(head, signature["versionAt"])
+
+                return (signature["formatName"], formatVersion)
+
+    return None
@@ -50,6 +50,14 @@ help = False
 sourcefiletype = ""  # Source filetype (derivatives.py)
 destfiletype = ""  # Destination filetype (derivatives.py)
 resize = ""  # resize dimensions (derivatives.py)
+destfiletypeList = []  # Destination filetypes, when a comma-separated list is given with -c (derivatives.py)
+resizeList = []  # Resize dimensions, when a comma-separated list is given with -r (derivatives.py)
+outputFormats = {}  # Pillow format name of each destination filetype, None if Pillow cannot write it (derivatives.py)
+catalogMode = False  # Select the files to process from the database, instead of walking directories (derivatives.py)
+incrementalMode = False  # Skip derivatives that are up to date, instead of stopping (derivatives.py)
+tileSize = 256  # Width and height of the tiles of deep zoom pyramids (derivatives.py)
+tileFileType = "jpg"  # Filetype of the tiles of deep zoom pyramids (derivatives.py)
+quality = 85  # Quality of lossy derivative formats, e.g., JPEG and WebP (derivatives.py)
 
 transferList = []  # List of source-dest pairs to be processed. Each pair would
                    # itself be a two-element list, with the SOURCE at index 0,
@@ -65,19 +73,68 @@ complianceList= [] #List of series and sub-series that need their compliance inf
                         #updated. Each pair would be a two-element list, with series at index 0.
                         #and sub-series at index 1.
 complianceErrorList = [] #List of series, sub-series for which errors occured - subset of complianceList
+reportMode = False # Report the records due for disposition (compliance.py)
+backfillMode = False # Compute the disposition due dates of records that do not have one (compliance.py)
+dueFrom = None # Start of the disposition due date range, None for no start (compliance.py, disposition.py)
+dueTo = None # End (inclusive) of the disposition due date range (compliance.py, disposition.py)
+dueSeries = None # Series the report is restricted to, None for all series (compliance.py, disposition.py)
+dryRun = False # Only report what would be disposed of (disposition.py)
+purgeMode = False # Remove the records of the disposed files, instead of marking them as disposed (disposition.py)
+dispositionDir = "" # Directory the disposed files are moved to. Files are deleted if empty (disposition.py)
+numDeviceWorkers = 2 # Max. no. of files disposed of in parallel on the same device (disposition.py)
+dispositionList = [] # Rows of the disposition report: record id, file path, action, destination and status (disposition.py)
 
 technicalList = [] # List of filepaths to be processed.
 technicalErrorList = [] # Consists list of errors encountered during the extraction of technical properties.
 
 adminList = [] # Contains label and label name list.
 adminerrorList = [] # Consists list of errors encountered during the extraction of admin properties.
+summaryPath = None # Arrangement whose summary is printed, e.g., "3/12" (admin.py)
+rebuildSummaryMode = False # Rebuild the arrangement summary from all the records (admin.py)
 
 derivativeList = [] # Contains filepath lists from input csv.
 derivativeErrorList = [] # Consists list of errors encountered during the generation of derivative.
 
+# DERIVATIVE SERVICE (derivserver.py)
+serverHost = "127.0.0.1" # Address the service listens on.
+serverPort = 8080 # Port the service listens on.
+cacheDir = "derivative_cache" # Directory the derivatives are cached in.
+cacheMaxSize = 1024 # Max. size of the cache, in MB.
+renderStartMethod = None # Start method of the render pool workers, None for the platform default. The service
+                         # uses "forkserver", since forking a multi-threaded process can deadlock the child.
+
+# EXTERNAL COMMAND LIMITS (technical.py, derivatives.py)
+cmdTimeout = 600 # Seconds after which a command (e.g., identify, convert) is killed. 0 disables the timeout.
+cmdMaxMemory = 0 # Address space limit for a command, in MB. 0 means no limit.
+cmdMaxCpuTime = 0 # CPU time limit for a command, in seconds. 0 means no limit.
+numWorkers = os.cpu_count() or 1 # Max. no. of commands run in parallel.
+
+quarantineFileName = "quarantine.csv" # CSV file recording the files that made a command time out or crash.
+quarantineSet = set() # Absolute paths of the quarantined files, skipped during processing.
+
 # DATABASE VARIABLES
 dbHandle = None # Stores the handle to access the database. Initialized to None.
+dbBackend = None # Module of the storage backend, e.g., metadatautilspkg.sqlitebackend, set by init_db().
 dbCollection = None
+dbBulkOps = [] # Update operations queued for the next bulk write to the database.
+dbBulkOpIds = [] # Ids of the records of the operations in dbBulkOps, in the same order.
+dbFailedRecordIds = set() # Ids of the records whose queued operations could not be written.
+dbReadPreference = None # Read preference of the read-heavy lookups, None to read from the primary.
+dbSummaryCollection = None # Collection summarizing the records by arrangement (series, sub-series, etc.)
+summaryDeltas = {} # Updates of the arrangement summary nodes, by node id, queued for the next bulk write.
+dbEventsCollection = None # Collection the PREMIS events are kept in, None to keep them in the records.
+dbEventBulkOps = [] # Inserts of events queued for the next bulk write to the events collection.
+dbEventBulkOpIds = [] # Ids of the records of the events in dbEventBulkOps, in the same order.
+eventSeq = 0 # Write order of the last event written to the events collection.
+createIndexes = False # Create the missing indexes, instead of only reporting them (dbmaintenance.py)
+explainQueries = False # Check the query plans of the workflow queries (dbmaintenance.py)
+syncMode = False # Send the records of the outbox to the catalog (dbmaintenance.py)
+
+# OUTBOX OF THE RECORDS, WHILE THE CATALOG IS DOWN OR SLOW (accession.py, dbmaintenance.py)
+outboxFileName = "outbox.db" # SQLite file of the records waiting to be sent to the catalog.
+outboxHandle = None # Connection to the outbox, opened on first use.
+dbCircuitOpenUntil = 0 # Time until which the records go to the outbox, without trying the catalog.
+dbSlowWrites = 0 # No. of slow writes to the catalog in a row.
 
 configDir = "config"
 
@@ -89,6 +146,16 @@ labels = {}
 vocabFileName = os.path.join(configDir, "vocab.json")
 vocab = {}
 
+# CACHE OF THE TOOLCHAIN PROBE AND PARSED CONFIGURATION FILES
+envCacheFileName = os.path.join(configDir, ".envcache")
+
+# FILE FORMAT SIGNATURES
+signaturesFileName = os.path.join(configDir, "signatures.json")
+signatureTrie = None # Compiled from the signatures file on first use.
+
+# PREMIS RECORD AND EVENT TEMPLATES
+premisTemplates = None # Factories of the records and events, compiled from the label dictionary on first use.
+
 # CSV FILE RELATED CONSTANTS
 CSV_COL_1_NAME = "source"
 CSV_COL_2_NAME = "destination"
@@ -106,6 +173,23 @@ MD_INIT_STRING = ""
 CHECKSUM_ALGO = "MD5"
 CHECKSUM_METHOD = "hashlib.md5()"
 
+CMD_TIMEOUT_EXIT_CODE = 124 # Exit code reported for commands killed on timeout.
+CMD_NOT_FOUND_EXIT_CODE = 127 # Exit code reported for commands that could not be started.
+CMD_KILL_WAIT = 5 # Seconds to wait for the output of a command, after killing it on timeout.
+CMD_BATCH_SIZE = 256 # No. of files whose commands are run together with runCmdMap().
+
+FORMAT_ID_HEAD_SIZE = 4096 # No. of bytes read from the start of a file to identify its format.
+FORMAT_ID_TAIL_SIZE = 1024 # No. of bytes read from the end of a file, when a signature needs them.
+
+DB_BULK_BATCH_SIZE = 1000 # No. of queued update operations sent to the database in one bulk write.
+DB_QUERY_CHUNK_SIZE = 5000 # No. of record ids looked up with a single query.
+DB_UPDATE_TOKEN_FIELD = "updateToken" # Field marking the records modified by an update, until its events are written.
+DB_SLOW_WRITE_SECONDS = 2.0 # Writes to the catalog slower than this are slow.
+DB_SLOW_WRITE_LIMIT = 3 # No. of slow writes in a row after which the records go to the outbox.
+DB_BREAKER_COOLDOWN = 60 # Seconds during which the records go to the outbox, before the catalog is tried again.
+DB_BACKENDS = {"mongodb": "metadatautilspkg.mongobackend", # Storage backends, by the "dbbackend" setting
+               "sqlite": "metadatautilspkg.sqlitebackend"} # of the DB configuration file.
+
 
 UNIQUE_ID_ALGO = "UUID v4"
 UNIQUE_ID_METHOD = "uuid.uuid4()"
@@ -113,6 +197,8 @@ UNIQUE_ID_METHOD = "uuid.uuid4()"
 ARRANGEMENT_INFO_MARKER = "arrange:"
 ARRANGEMENT_INFO_LABEL = "arrangementInfo"
 ARRANGEMENT_INFO_LABEL_SUFFIX = "Label"
+ARRANGEMENT_LEVELS = ["series", "sub-series", "item group", "item subgroup"] # Levels of the arrangement, from the top down.
 
 COMPLIANCE_INFO_MARKER = "compliance:"
 COMPLIANCE_INFO_LABEL_SUFFIX = "Label"
+COMPLIANCE_DATE_FORMATS = ["%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d"] # Formats of the dates in compliance profiles, and on the command-line.
@@ -45,18 +45,155 @@ from uuid import uuid4
 
 import metadatautilspkg.globalvars as globalvars
 import metadatautilspkg.errorcodes as errorcodes
+import metadatautilspkg.fileformat as fileformat
+from metadatautilspkg.envcache import getCachedConfig
+
+namedTupleClasses = {}  # namedtuple classes created for the label and vocab entries, by type name and fields.
+timestampCache = {"last": (None, None)}  # Second of the last timestamp returned, and the timestamp.
 
 def getCurrentEDTFTimestamp():
-    timeStamp = datetime.now().isoformat(sep='T').split('.')[0]
-    timeZone = strftime('%z', localtime())
-    timeZone = timeZone[:3] + ":" + timeZone[3:]
-    return timeStamp + timeZone
+    """getCurrentEDTFTimestamp()
+
+    Arguments:
+        None
+
+    This function returns the current local time as an EDTF timestamp, e.g.,
+    2017-03-01T10:15:30-06:00. Since records and events are created by the
+    thousand within a second, the timestamp is formatted at most once a second.
+    The local time and its UTC offset come from the same localtime() call, so
+    they always agree, including around DST changes.
+    """
+
+    second = int(time())
+    lastSecond, timeStamp = timestampCache["last"]
+    if second == lastSecond:
+        return timeStamp
+
+    localTime = localtime(second)
+    offsetMinutes = abs(localTime.tm_gmtoff) // 60
+    timeZone = "{}{:02d}:{:02d}".format("-" if localTime.tm_gmtoff < 0 else "+", offsetMinutes // 60, offsetMinutes % 60)
+
+    timeStamp = strftime('%Y-%m-%dT%H:%M:%S', localTime) + timeZone
+    timestampCache["last"] = (second, timeStamp)
+    return timeStamp
 
 
 def getFileChecksum(filePath):
     return hashlib.md5(open(filePath, 'rb').read()).hexdigest()
 
 
+def getContentHash(value):
+    """getContentHash()
+
+    Arguments:
+        value: the metadata (e.g., a profile) to be hashed.
+
+    This function returns the MD5 digest of the canonical JSON form of value, i.e.,
+    with sorted keys and no whitespace, so that equal metadata always has the same
+    hash. Values that are not JSON types, e.g., dates, are hashed as strings.
+    """
+
+    canonicalJson = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.md5(canonicalJson.encode('utf-8')).hexdigest()
+
+
+def getJsonPointer(keys):
+    return "".join("/" + str(key).replace("~", "~0").replace("/", "~1") for key in keys)
+
+
+def getDeltaOperation(op, keys, value):
+    """getDeltaOperation()
+
+    Arguments:
+        op: "add" or "replace".
+        keys: keys of the modified field, from the top of the record down.
+        value: the new value of the field.
+
+    This function returns a JSON Patch operation setting the field to value. Scalar
+    values are copied into the operation, while objects and lists are referenced
+    by their content hash (valueHash) instead, since the record itself holds them
+    after the modification.
+    """
+
+    operation = {"op": op, "path": getJsonPointer(keys)}
+    if isinstance(value, (dict, list, tuple)):
+        operation["valueHash"] = getContentHash(value)
+    else:
+        operation["value"] = value
+    return operation
+
+
+def getFieldKeys(keys, key):
+    # Only the top-level keys are dotted paths, e.g., the fields of a $set.
+    return keys + ((key,) if keys else tuple(key.split('.')))
+
+
+def getMetadataDelta(before, after, keys=()):
+    """getMetadataDelta()
+
+    Arguments:
+        before: the metadata before the modification, e.g., {} for a new profile.
+        after: the metadata after the modification. Dotted keys (as in a $set) are
+            taken as paths.
+        keys: keys of the compared fields, from the top of the record down.
+
+    This function returns the list of JSON Patch (RFC 6902) operations that turn
+    before into after, i.e., only the fields that were added, replaced or removed.
+    The objects are compared field by field, in a single pass over both, so the
+    delta of a small change to a large profile stays small.
+    """
+
+    if not isinstance(before, dict) or not isinstance(after, dict):
+        if before == after:
+            return []
+        return [getDeltaOperation("replace", keys, after)]
+
+    delta = []
+    for key in before:
+        if key not in after:
+            delta.append({"op": "remove", "path": getJsonPointer(getFieldKeys(keys, key))})
+
+    for key, value in after.items():
+        fieldKeys = getFieldKeys(keys, key)
+        if key not in before:
+            delta.append(getDeltaOperation("add", fieldKeys, value))
+        elif before[key] != value:
+            delta.extend(getMetadataDelta(before[key], value, fieldKeys))
+
+    return delta
+
+
+def readJsonFile(fileName):
+    with open(fileName, "r") as jsonFileHandle:
+        return json.load(jsonFileHandle)
+
+
+def toNamedTuple(typeName, value):
+    """toNamedTuple()
+
+    Arguments:
+        typeName: name of the namedtuple types to be created.
+        value: the parsed JSON value to be converted.
+
+    This function converts every JSON object in value into a namedtuple, so that
+    entries can be accessed as attributes (e.g., globalvars.labels.obj_id.name).
+    The namedtuple classes are created once per set of fields and reused, since
+    most label entries share the same fields.
+    """
+
+    if isinstance(value, dict):
+        fields = tuple(value.keys())
+        namedTupleClass = namedTupleClasses.get((typeName, fields))
+        if namedTupleClass is None:
+            namedTupleClass = namedtuple(typeName, fields)
+            namedTupleClasses[(typeName, fields)] = namedTupleClass
+        return namedTupleClass(*[toNamedTuple(typeName, item) for item in value.values()])
+    elif isinstance(value, list):
+        return [toNamedTuple(typeName, item) for item in value]
+    else:
+        return value
+
+
 def readLabelDictionary():
     """readLabelDictionary()
 
@@ -69,52 +206,100 @@ def readLabelDictionary():
     """
 
     try:
-        jsonObject = open(globalvars.labelsFileName, "r").read()
+        jsonLabels = getCachedConfig(globalvars.labelsFileName, readJsonFile)
     except IOError as jsonReadException:
         print_error(jsonReadException)
         print_error(errorcodes.ERROR_CANNOT_READ_LABELS_FILE["message"])
         quit(errorcodes.ERROR_CANNOT_READ_LABELS_FILE["code"])
-
-    try:
-        labels = json.loads(jsonObject, object_hook= lambda d: namedtuple('Labels', d.keys())(*d.values()))
     except json.JSONDecodeError as jsonDecodeError:
         print_error(jsonDecodeError)
         print_error(errorcodes.ERROR_INVALID_JSON_IN_LABELS_FILE["message"])
         exit(errorcodes.ERROR_INVALID_JSON_IN_LABELS_FILE["code"])
 
-    return labels
+    return toNamedTuple('Labels', jsonLabels)
 
 
 def readControlledVocabulary():
     try:
-        jsonObject = open(globalvars.vocabFileName, "r").read()
+        jsonVocab = getCachedConfig(globalvars.vocabFileName, readJsonFile)
     except IOError as jsonReadException:
         print_error(jsonReadException)
         print_error(errorcodes.ERROR_CANNOT_READ_VOCAB_FILE["message"])
         quit(errorcodes.ERROR_CANNOT_READ_VOCAB_FILE["code"])
-
-    try:
-        jsonVocab = json.loads(jsonObject, object_hook= lambda d: namedtuple('Vocab', d.keys())(*d.values()))
     except json.JSONDecodeError as jsonDecodeError:
         print_error(jsonDecodeError)
         print_error(errorcodes.ERROR_INVALID_JSON_IN_VOCAB_FILE["message"])
         exit(errorcodes.ERROR_INVALID_JSON_IN_VOCAB_FILE["code"])
 
-    return jsonVocab
+    return toNamedTuple('Vocab', jsonVocab)
 
 
 def getUniqueID():
     return str(uuid4())
 
 
+def readSignatureFile():
+    """readSignatureFile()
+
+    Arguments:
+        None
+
+    This function reads the JSON file containing the file format signatures (magic
+    numbers) that are used to identify the format of the files being transferred.
+    """
+
+    try:
+        jsonObject = open(globalvars.signaturesFileName, "r").read()
+    except IOError as jsonReadException:
+        print_error(jsonReadException)
+        print_error(errorcodes.ERROR_CANNOT_READ_SIGNATURES_FILE["message"])
+        quit(errorcodes.ERROR_CANNOT_READ_SIGNATURES_FILE["code"])
+
+    try:
+        signatures = json.loads(jsonObject)
+    except json.JSONDecodeError as jsonDecodeError:
+        print_error(jsonDecodeError)
+        print_error(errorcodes.ERROR_INVALID_JSON_IN_SIGNATURES_FILE["message"])
+        exit(errorcodes.ERROR_INVALID_JSON_IN_SIGNATURES_FILE["code"])
+
+    return signatures[fileformat.SIGNATURE_LIST_KEY]
+
+
+def identifyFileFormat(filePath):
+    """identifyFileFormat()
+
+    Arguments:
+        filePath: path to the file whose format needs to be identified.
+
+    This function identifies the format name and version of a file from its magic
+    number, and returns them as a (formatName, formatVersion) tuple. If the file
+    cannot be read, or matches none of the known signatures, the upper-cased
+    extension of the file is used as the format name, with an empty version.
+    """
+
+    if globalvars.signatureTrie is None:
+        globalvars.signatureTrie = getCachedConfig(globalvars.signaturesFileName,
+                                                   lambda fileName: fileformat.compileSignatures(readSignatureFile()))
+
+    try:
+        fileFormat = fileformat.identifyFormat(globalvars.signatureTrie, filePath)
+    except IOError as formatReadException:
+        print_error(formatReadException)
+        fileFormat = None
+
+    if fileFormat is None:
+        extension = filePath.split('.')[-1]
+        fileFormat = (extension.upper(), "")
+
+    return fileFormat
+
+
 def getFileFormatName(fileName):
-    extension = fileName.split('.')[-1]
-    return extension.upper()
+    return identifyFileFormat(fileName)[0]
 
 
 def getFileFormatVersion(fileName):
-    extension = fileName.split('.')[-1]
-    return ""  # TODO: This is just a STAND-IN for testing. NEEDS to be changed.
+    return identifyFileFormat(fileName)[1]
 
 
 def isHeaderValid(hdr):
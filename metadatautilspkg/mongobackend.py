@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# MongoDB storage backend.
+#
+# A storage backend is a module of dbfunctions.py's globalvars.dbBackend, chosen
+# with the "dbbackend" setting of the DB configuration file (see DB_BACKENDS in
+# globalvars.py), which has:
+#
+#   connect(dbConfig): returns a handle to the database, whose collections are
+#       handle[collectionName], with the pymongo Collection methods the workflows
+#       use (find, find_one, aggregate, insert_one, update_one, update_many,
+#       delete_one, delete_many, bulk_write, create_index and index_information).
+#   createIndex(collection, indexKeys, indexName, multikey): creates an index.
+#   InsertOne, UpdateOne, DeleteOne: the operations of bulk_write().
+#   ASCENDING, DESCENDING: the directions of the index keys.
+#   DatabaseError: base class of the errors of the backend, with the subclasses
+#       AuthenticationError and ConfigurationError raised by connect().
+
+import os
+import sys
+
+import pymongo
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne, DeleteOne
+from pymongo.errors import PyMongoError as DatabaseError
+from pymongo.errors import OperationFailure as AuthenticationError
+from pymongo.errors import ConfigurationError
+from pymongo.write_concern import WriteConcern
+
+import metadatautilspkg.globalvars as globalvars
+
+
+def connect(dbConfig):
+    """connect
+
+    Arguments:
+        dbConfig: the parsed DB configuration file.
+
+    This function connects to the MongoDB server of the "dbaddress" setting, and
+    returns a handle to the "dbname" database. Besides the address and credentials,
+    the configuration file may set the connection options (see getClientOptions()),
+    the write concern of each workflow (see getWriteConcern()), and the read
+    preference of the read-heavy lookups (see getReadCollection() in dbfunctions.py).
+
+    """
+
+    dbName = dbConfig['dbname']
+    clientOptions = getClientOptions(dbConfig)
+    writeConcern = getWriteConcern(dbConfig)
+    if 'readpreference' in dbConfig:
+        readPrefMode = pymongo.read_preferences.read_pref_mode_from_name(dbConfig['readpreference'])
+        globalvars.dbReadPreference = pymongo.read_preferences.make_read_preference(readPrefMode, None,
+                                                                                    dbConfig.get('maxstalenessseconds', -1))
+
+    client = pymongo.MongoClient(dbConfig['dbaddress'], username=dbConfig['dbuser'], password=dbConfig['dbpassword'],
+                                 authSource=dbConfig.get('dbauthsource', dbName), **clientOptions)
+    client.admin.command('ping')  # The client connects lazily. Connect, and authenticate, now.
+
+    return client.get_database(dbName, write_concern=writeConcern)
+
+def createIndex(collection, indexKeys, indexName, multikey):
+    # MongoDB finds out by itself which indexes are multikey.
+    collection.create_index(indexKeys, name=indexName)
+
+def getClientOptions(dbConfig):
+    """getClientOptions
+
+    Arguments:
+        dbConfig: the parsed DB configuration file.
+
+    This function returns the MongoClient options set in the DB configuration file:
+    "compressors" (e.g., "zstd,snappy,zlib", the first one the server supports is
+    used; those whose Python module is not installed are skipped, with a warning),
+    "maxpoolsize" (raised to the no. of workers if lower), "minpoolsize",
+    "maxidletimems", "connecttimeoutms", "serverselectiontimeoutms" and
+    "retrywrites".
+
+    """
+
+    clientOptions = {}
+
+    if 'compressors' in dbConfig:
+        clientOptions['compressors'] = dbConfig['compressors']
+    if 'zlibcompressionlevel' in dbConfig:
+        clientOptions['zlibCompressionLevel'] = int(dbConfig['zlibcompressionlevel'])
+
+    # Each worker thread may hold a connection of its own.
+    clientOptions['maxPoolSize'] = max(int(dbConfig.get('maxpoolsize', 100)), globalvars.numWorkers)
+
+    for configKey, optionName in [('minpoolsize', 'minPoolSize'), ('maxidletimems', 'maxIdleTimeMS'),
+                                  ('connecttimeoutms', 'connectTimeoutMS'), ('serverselectiontimeoutms', 'serverSelectionTimeoutMS')]:
+        if configKey in dbConfig:
+            clientOptions[optionName] = int(dbConfig[configKey])
+
+    clientOptions['retryWrites'] = bool(dbConfig.get('retrywrites', True))
+    clientOptions['retryReads'] = bool(dbConfig.get('retryreads', True))
+
+    return clientOptions
+
+def getWriteConcern(dbConfig):
+    """getWriteConcern
+
+    Arguments:
+        dbConfig: the parsed DB configuration file.
+
+    This function returns the write concern of the running workflow, from the
+    "writeconcern" object of the DB configuration file, e.g.,
+
+        "writeconcern": {"default": {"w": 1, "j": true},
+                         "accession": {"w": "majority", "j": true},
+                         "derivatives": {"w": 1, "j": false}}
+
+    where the workflows are named after their scripts. Returns None, i.e., the
+    server default, if neither the workflow nor "default" is set.
+
+    """
+
+    workflowName = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    writeConcerns = dbConfig.get('writeconcern', {})
+    writeConcern = writeConcerns.get(workflowName, writeConcerns.get('default'))
+
+    if writeConcern == None:
+        return None
+
+    return WriteConcern(w=writeConcern.get('w'), j=writeConcern.get('j'), wtimeout=writeConcern.get('wtimeout'))
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Store-and-forward of the records of accession.py. When the catalog is down, or
+# too slow, the records are written to the outbox, a local SQLite file, instead,
+# so that the transfers go on, and every transferred file has a record. The
+# records are later sent to the catalog by "dbmaintenance.py --sync".
+#
+# The catalog is guarded by a circuit breaker: after a failed write, or a few
+# slow ones in a row, the circuit "opens", and the records go straight to the
+# outbox, without waiting for the catalog, until the circuit is tried again
+# DB_BREAKER_COOLDOWN seconds later.
+
+import os
+import sqlite3
+from time import time
+
+import metadatautilspkg.globalvars as globalvars
+import metadatautilspkg.errorcodes as errorcodes
+from metadatautilspkg.metadatautils import *
+from metadatautilspkg.dbfunctions import insertRecordInDB, getHighestSerialNo, splitEvents, getEventOps, writeEvents
+from metadatautilspkg.sqlitebackend import encodeDocument, decodeDocument
+from metadatautilspkg.arrangementsummary import addSummaryDelta, flushSummaryDeltas
+
+
+def openOutbox(create=True):
+    """openOutbox
+
+    Arguments:
+        create: if False, and the outbox file does not exist, it is not created.
+
+    This function opens the outbox file globalvars.outboxFileName, and returns
+    the connection to it, or None if it does not exist, and is not to be created.
+    The outbox is written with synchronous=FULL, since it is the only copy of its
+    records.
+
+    """
+
+    if globalvars.outboxHandle == None:
+        if create == False and not os.path.isfile(globalvars.outboxFileName):
+            return None
+
+        globalvars.outboxHandle = sqlite3.connect(globalvars.outboxFileName, isolation_level=None)
+        globalvars.outboxHandle.execute("PRAGMA journal_mode=WAL")
+        globalvars.outboxHandle.execute("PRAGMA synchronous=FULL")
+        globalvars.outboxHandle.execute("CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                        "id TEXT NOT NULL UNIQUE, srcDir TEXT NOT NULL, serialNo INTEGER NOT NULL, "
+                                        "record TEXT NOT NULL, queued TEXT NOT NULL)")
+        globalvars.outboxHandle.execute("CREATE INDEX IF NOT EXISTS outbox_srcDir ON outbox (srcDir, serialNo)")
+        globalvars.outboxHandle.execute("CREATE TABLE IF NOT EXISTS summaryDeltas (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                        "deltas TEXT NOT NULL, queued TEXT NOT NULL)")
+
+    return globalvars.outboxHandle
+
+def getRecordSource(metadataRecord):
+    # (source directory, serial number) of a record, by which accession.py numbers the files.
+    originalName = metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_orig_name.name]
+    serialNo = metadataRecord[globalvars.labels.admn_entity.name][globalvars.labels.arrangement.name][globalvars.labels.serial_nbr.name]
+    return os.path.dirname(originalName), int(serialNo)
+
+def queueOutboxRecord(metadataRecord):
+    """queueOutboxRecord
+
+    Arguments:
+        metadataRecord: the metadata record to be inserted in the catalog.
+
+    This function writes the record to the outbox, and returns its id.
+
+    """
+
+    srcDir, serialNo = getRecordSource(metadataRecord)
+    openOutbox().execute("INSERT OR REPLACE INTO outbox (id, srcDir, serialNo, record, queued) VALUES (?, ?, ?, ?, ?)",
+                         (metadataRecord["_id"], srcDir, serialNo, encodeDocument(metadataRecord), getCurrentEDTFTimestamp()))
+
+    return metadataRecord["_id"]
+
+def getOutboxHighestSerialNo(dirName):
+    """getOutboxHighestSerialNo
+
+    Arguments:
+        dirName: the source directory of the files.
+
+    This function returns the highest serial number of the records of the files
+    of dirName in the outbox, or 0 if there are none.
+
+    """
+
+    outboxHandle = openOutbox(create=False)
+    if outboxHandle == None:
+        return 0
+
+    serialNo, = outboxHandle.execute("SELECT MAX(serialNo) FROM outbox WHERE srcDir = ?", (dirName,)).fetchone()
+    return serialNo or 0
+
+def queueOutboxSummaryDeltas():
+    """queueOutboxSummaryDeltas
+
+    Arguments:
+        none
+
+    This function moves the pending changes of the arrangement summary (see
+    addSummaryDelta()) to the outbox, e.g., when they cannot be written to the
+    catalog before accession.py exits. They are applied by syncOutbox().
+
+    """
+
+    if len(globalvars.summaryDeltas) == 0:
+        return
+
+    openOutbox().execute("INSERT INTO summaryDeltas (deltas, queued) VALUES (?, ?)",
+                         (encodeDocument(globalvars.summaryDeltas), getCurrentEDTFTimestamp()))
+    globalvars.summaryDeltas = {}
+
+def syncOutboxSummaryDeltas():
+    # Applies the changes of the arrangement summary kept in the outbox, and removes them once written.
+    outboxHandle = openOutbox(create=False)
+    rows = outboxHandle.execute("SELECT seq, deltas FROM summaryDeltas ORDER BY seq").fetchall()
+
+    for seq, deltas in rows:
+        globalvars.summaryDeltas = decodeDocument(deltas)
+        if flushSummaryDeltas() == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+            globalvars.summaryDeltas = {}  # Still in the outbox.
+            return errorcodes.ERROR_CANNOT_UPDATE_DB["code"]
+        outboxHandle.execute("DELETE FROM summaryDeltas WHERE seq = ?", (seq,))
+
+    return len(rows)
+
+def countOutboxRecords():
+    outboxHandle = openOutbox(create=False)
+    if outboxHandle == None:
+        return 0
+    return outboxHandle.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+def isCatalogAvailable():
+    """isCatalogAvailable
+
+    Arguments:
+        none
+
+    This function returns False while the circuit of the catalog is open, i.e.,
+    the records are to be written to the outbox. Once the cooldown is over, it
+    returns True, and the next write decides whether the circuit closes again.
+
+    """
+
+    if globalvars.dbHandle == None:
+        return False  # Not connected, e.g., the server was down when accession.py started.
+
+    return time() >= globalvars.dbCircuitOpenUntil
+
+def recordCatalogAccess(succeeded, elapsedTime):
+    # Updates the circuit breaker with the outcome of an access to the catalog.
+    if succeeded == True and elapsedTime < globalvars.DB_SLOW_WRITE_SECONDS:
+        globalvars.dbSlowWrites = 0
+        return
+
+    if succeeded == True:
+        globalvars.dbSlowWrites += 1
+        if globalvars.dbSlowWrites < globalvars.DB_SLOW_WRITE_LIMIT:
+            return
+
+    globalvars.dbSlowWrites = 0
+    globalvars.dbCircuitOpenUntil = time() + globalvars.DB_BREAKER_COOLDOWN
+    print_error("The catalog is {}. The records will be written to the outbox '{}' for the next {} seconds.".format(
+        "slow" if succeeded == True else "unavailable", globalvars.outboxFileName, globalvars.DB_BREAKER_COOLDOWN))
+
+def getStoredHighestSerialNo(dirName):
+    """getStoredHighestSerialNo
+
+    Arguments:
+        dirName: the source directory of the files.
+
+    This function returns the highest serial number of the files of dirName, in
+    the catalog and in the outbox. If the catalog is unavailable, the records in
+    the outbox, which are the latest ones, are enough; otherwise None is returned,
+    since the serial number is unknown.
+
+    """
+
+    outboxSerialNo = getOutboxHighestSerialNo(dirName)
+
+    if isCatalogAvailable():
+        try:
+            return max(getHighestSerialNo(dirName), outboxSerialNo)
+        except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+            print_error(ExceptionDatabase)
+            recordCatalogAccess(False, 0)
+
+    if outboxSerialNo > 0:
+        return outboxSerialNo
+
+    return None
+
+def storeRecord(metadataRecord):
+    """storeRecord
+
+    Arguments:
+        metadataRecord: the metadata record to be inserted in the catalog.
+
+    This function inserts the record in the catalog, or, if the catalog is down
+    or slow, writes it to the outbox. Returns True if the record was inserted in
+    the catalog, False if it was written to the outbox.
+
+    """
+
+    if isCatalogAvailable():
+        startTime = time()
+        dbRetValue = insertRecordInDB(metadataRecord)
+        recordCatalogAccess(dbRetValue == metadataRecord["_id"], time() - startTime)
+        if dbRetValue == metadataRecord["_id"]:
+            return True
+
+    queueOutboxRecord(metadataRecord)
+    return False
+
+def addRecordSummaryDelta(metadataRecord):
+    objectChars = metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name]
+    fmtName = objectChars[globalvars.labels.obj_fmt.name][globalvars.labels.obj_fmt_dsgn.name][globalvars.labels.obj_fmt_name.name]
+    addSummaryDelta(metadataRecord[globalvars.labels.admn_entity.name][globalvars.labels.arrangement.name],
+                    objectChars[globalvars.labels.obj_size.name], fmtName)
+
+def syncOutbox():
+    """syncOutbox
+
+    Arguments:
+        none
+
+    This function sends the records of the outbox to the catalog, in unordered
+    bulk writes of globalvars.DB_BULK_BATCH_SIZE records, and removes them from
+    the outbox once written. The records are upserted with $setOnInsert, so that
+    a record already in the catalog (e.g., from an interrupted sync) is left as
+    it is, and syncing again is harmless. The changes of the arrangement summary
+    kept in the outbox are applied first. Returns the number of records sent, or
+    an error code.
+
+    """
+
+    outboxHandle = openOutbox(create=False)
+    if outboxHandle == None:
+        return 0
+
+    if syncOutboxSummaryDeltas() == errorcodes.ERROR_CANNOT_UPDATE_DB["code"]:
+        return errorcodes.ERROR_CANNOT_UPDATE_DB["code"]
+
+    numSynced = 0
+    lastSeq = 0
+    while True:
+        rows = outboxHandle.execute("SELECT seq, id, record FROM outbox WHERE seq > ? ORDER BY seq LIMIT ?",
+                                    (lastSeq, globalvars.DB_BULK_BATCH_SIZE)).fetchall()
+        if len(rows) == 0:
+            break
+        lastSeq = rows[-1][0]
+
+        records = [decodeDocument(record) for seq, id, record in rows]
+        bulkOps = []
+        eventOps = []
+        for record in records:
+            record, eventList = splitEvents(record)
+            bulkOps.append(globalvars.dbBackend.UpdateOne({'_id': record['_id']}, {'$setOnInsert': {key: value for key, value in record.items() if key != '_id'}}, upsert=True))
+            eventOps.extend(getEventOps(record['_id'], eventList, upsert=True))
+
+        try:
+            dbBulkResult = globalvars.dbHandle[globalvars.dbCollection].bulk_write(bulkOps, ordered=False)
+            writeEvents(eventOps)
+        except globalvars.dbBackend.DatabaseError as ExceptionDatabase:
+            print_error(ExceptionDatabase)
+            print_error(errorcodes.ERROR_CANNOT_INSERT_INTO_DB["message"])
+            return(errorcodes.ERROR_CANNOT_INSERT_INTO_DB["code"])
+
+        # Only the records new to the catalog are counted in the summary. If the
+        # summary cannot be written, its changes stay in the outbox, along with the
+        # records leaving it, since syncing the records again would not count them.
+        for index in dbBulkResult.upserted_ids:
+            addRecordSummaryDelta(records[index])
+        flushSummaryDeltas()
+
+        outboxHandle.execute("BEGIN")
+        queueOutboxSummaryDeltas()
+        outboxHandle.executemany("DELETE FROM outbox WHERE seq = ?", [(seq,) for seq, id, record in rows])
+        outboxHandle.execute("COMMIT")
+        numSynced += len(rows)
+        print_info("{} records synced, {} of them new to the catalog".format(len(rows), len(dbBulkResult.upserted_ids)))
+
+    return numSynced
@@ -60,6 +60,184 @@ def getLinkingAgentRole():
     return ""  # TODO: temporary, needs more work!!
 
 
+def compileEventFactory(labels, evtTyp, detailFields=None, staticDetail=(), optionalFields=()):
+    """compileEventFactory()
+
+    Arguments:
+        labels: the label dictionary.
+        evtTyp: type of the events created (from the controlled vocabulary).
+        detailFields: label entries of the event detail fields, whose values are
+                      given when an event is created, in this order. None for
+                      events without event detail information.
+        staticDetail: (label entry, value) pairs of the event detail fields that
+                      have the same value in all the events of this type.
+        optionalFields: label entries of the detailFields left out of the event
+                        when their value is None.
+
+    This function returns a function creating PREMIS events of the given type,
+    from the values of detailFields. The labels are looked up once, here, and the
+    parts of the event that are the same in all events (outcome, linking agent,
+    static details) are built once and only shallow-copied for each event.
+    """
+
+    evtEntity = labels.evt_entity.name
+    evtId = labels.evt_id.name
+    evtIdTyp = labels.evt_id_typ.name
+    evtIdVal = labels.evt_id_val.name
+    evtTypKey = labels.evt_typ.name
+    evtDtTime = labels.evt_dttime.name
+    evtDetailParent = labels.evt_detail_parent.name
+    evtDetailInfo = labels.evt_detail_info.name
+    evtDetailExt = labels.evt_detail_ext.name
+    evtOutcmInfo = labels.evt_outcm_info.name
+    evtLnkAgntId = labels.evt_lnk_agnt_id.name
+
+    outcomeTemplate = {labels.evt_outcm.name: globalvars.vocab.evtOutcm.success}
+    agentTemplate = {labels.evt_lnk_agnt_id_typ.name: globalvars.LNK_AGNT_ID_TYPE,
+                     labels.evt_lnk_agnt_id_val.name: globalvars.LNK_AGNT_ID_VAL}
+    detailTemplate = {field.name: value for field, value in staticDetail}
+    detailKeys = None if detailFields is None else [field.name for field in detailFields]
+    optionalKeys = {field.name for field in optionalFields}
+    idType = globalvars.EVT_ID_TYP
+
+    def createEvent(*detailValues):
+        eventRecord = {evtId: {evtIdTyp: idType, evtIdVal: getUniqueID()},
+                       evtTypKey: evtTyp,
+                       evtDtTime: getCurrentEDTFTimestamp()}
+
+        if detailKeys is not None:
+            eventDetail = detailTemplate.copy()
+            for key, value in zip(detailKeys, detailValues):
+                if value is not None or key not in optionalKeys:
+                    eventDetail[key] = value
+            # A single record for event detail information
+            eventRecord[evtDetailParent] = [{evtDetailInfo: {evtDetailExt: eventDetail}}]
+
+        eventRecord[evtOutcmInfo] = outcomeTemplate.copy()
+        eventRecord[evtLnkAgntId] = agentTemplate.copy()
+
+        return {evtEntity: eventRecord}
+
+    return createEvent
+
+
+def compileRecordFactory(labels):
+    """compileRecordFactory()
+
+    Arguments:
+        labels: the label dictionary.
+
+    This function returns a function creating the skeletal metadata record of a
+    file, from its unique id, admin entity, size, format name, format version and
+    original name. As for events, the labels are looked up once, here.
+    """
+
+    admnEntity = labels.admn_entity.name
+    presEntity = labels.pres_entity.name
+    objEntity = labels.obj_entity.name
+    objId = labels.obj_id.name
+    objIdTyp = labels.obj_id_typ.name
+    objIdVal = labels.obj_id_val.name
+    objCat = labels.obj_cat.name
+    objChars = labels.obj_chars.name
+    objFixity = labels.obj_fixity.name
+    objMsgDgstAlgo = labels.obj_msgdgst_algo.name
+    objMsgDgst = labels.obj_msgdgst.name
+    objSize = labels.obj_size.name
+    objFmt = labels.obj_fmt.name
+    objFmtDsgn = labels.obj_fmt_dsgn.name
+    objFmtName = labels.obj_fmt_name.name
+    objFmtVer = labels.obj_fmt_ver.name
+    objOrigName = labels.obj_orig_name.name
+    evtParentEntity = labels.evt_parent_entity.name
+
+    fixityTemplate = {objMsgDgstAlgo: globalvars.MD_INIT_STRING, objMsgDgst: globalvars.MD_INIT_STRING}
+    objectCategory = globalvars.vocab.objCat
+    idType = globalvars.OBJ_ID_TYPE
+
+    def createRecord(uniqueId, adminEntity, fileSize, fmtName, fmtVer, fileName):
+        formatDesignation = {objFmtName: fmtName}
+        if fmtVer != "":
+            formatDesignation[objFmtVer] = fmtVer
+
+        objectEntity = {objId: {objIdTyp: idType, objIdVal: uniqueId},
+                        objCat: objectCategory,
+                        objChars: {objFixity: fixityTemplate.copy(),
+                                   objSize: fileSize,
+                                   objFmt: {objFmtDsgn: formatDesignation}},
+                        objOrigName: fileName}
+
+        # The parent entity (list) of all PREMIS 'event' entities is empty to begin with.
+        return {"_id": uniqueId,
+                admnEntity: adminEntity,
+                presEntity: {objEntity: objectEntity, evtParentEntity: []}}
+
+    return createRecord
+
+
+def compilePremisTemplates(labels, vocab):
+    """compilePremisTemplates()
+
+    Arguments:
+        labels: the label dictionary.
+        vocab: the controlled vocabulary.
+
+    This function compiles the label dictionary and controlled vocabulary into
+    the factories of the metadata records and of each type of PREMIS event.
+    """
+
+    return {
+        "labels": labels,
+        "vocab": vocab,
+        "record": compileRecordFactory(labels),
+        "idAssignment": compileEventFactory(labels, vocab.evtTyp.idAssgn,
+                                            [labels.evt_detail_idAssgn],
+                                            [(labels.evt_detail_algo, globalvars.UNIQUE_ID_ALGO),
+                                             (labels.evt_detail_proglang, globalvars.PYTHON_VER_STR),
+                                             (labels.evt_detail_mthd, globalvars.UNIQUE_ID_METHOD)]),
+        "msgDigestCalc": compileEventFactory(labels, vocab.evtTyp.msgDgstCalc,
+                                             [labels.evt_detail_msgDgst],
+                                             [(labels.evt_detail_algo, globalvars.CHECKSUM_ALGO),
+                                              (labels.evt_detail_proglang, globalvars.PYTHON_VER_STR),
+                                              (labels.evt_detail_mthd, globalvars.CHECKSUM_METHOD)]),
+        "fileCopy": compileEventFactory(labels, vocab.evtTyp.replication,
+                                        [labels.evt_detail_src, labels.evt_detail_dst]),
+        "filenameChange": compileEventFactory(labels, vocab.evtTyp.filenameChg,
+                                              [labels.evt_detail_src, labels.evt_detail_dst]),
+        "fixityCheck": compileEventFactory(labels, vocab.evtTyp.fixityChk),
+        "accession": compileEventFactory(labels, vocab.evtTyp.accession),
+        "metadataExtraction": compileEventFactory(labels, vocab.evtTyp.metadataExt,
+                                                  [labels.evt_detail_mthd, labels.evt_detail_contentHash,
+                                                   labels.evt_detail_delta]),
+        "metadataModification": compileEventFactory(labels, vocab.evtTyp.metadataMod,
+                                                    [labels.evt_detail_delta]),
+        "migration": compileEventFactory(labels, vocab.evtTyp.migration,
+                                         [labels.evt_detail_fileType, labels.evt_detail_fileSize,
+                                          labels.evt_detail_imgWidth, labels.evt_detail_imgHeight,
+                                          labels.evt_detail_fileName, labels.evt_detail_paramHash],
+                                         optionalFields=[labels.evt_detail_paramHash]),
+        "deletion": compileEventFactory(labels, vocab.evtTyp.deletion,
+                                        [labels.evt_detail_src, labels.evt_detail_dst]),
+    }
+
+
+def getPremisTemplates():
+    """getPremisTemplates()
+
+    Arguments:
+        None
+
+    This function returns the record and event factories, compiled on first use
+    and again only if the label dictionary or controlled vocabulary are reloaded.
+    """
+
+    templates = globalvars.premisTemplates
+    if templates is None or templates["labels"] is not globalvars.labels or templates["vocab"] is not globalvars.vocab:
+        templates = compilePremisTemplates(globalvars.labels, globalvars.vocab)
+        globalvars.premisTemplates = templates
+    return templates
+
+
 def initMetadataRecord(initParams):
     """initMetadataRecord
 
@@ -72,269 +250,74 @@ def initMetadataRecord(initParams):
 
     """
 
-    metadataRecord = {}
     uniqueId = getUniqueID()
-    metadataRecord["_id"] = uniqueId
 
     # Create the ADMIN entity here:
     arrangementInfo = initParams[globalvars.ARRANGEMENT_INFO_LABEL]
     adminEntity = initAdminMetadataEntity(arrangementInfo)
 
-    metadataRecord[globalvars.labels.admn_entity.name] = adminEntity
-
     # Create the PREMIS (or preservation) entity here:
-    metadataRecord[globalvars.labels.pres_entity.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_id.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_id.name][globalvars.labels.obj_id_typ.name] = globalvars.OBJ_ID_TYPE
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_id.name][globalvars.labels.obj_id_val.name] = uniqueId
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_cat.name] = globalvars.vocab.objCat
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fixity.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fixity.name][globalvars.labels.obj_msgdgst_algo.name] = globalvars.MD_INIT_STRING
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fixity.name][globalvars.labels.obj_msgdgst.name] = globalvars.MD_INIT_STRING
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_size.name] = initParams["fileSize"]
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fmt.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fmt.name][globalvars.labels.obj_fmt_dsgn.name] = {}
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fmt.name][globalvars.labels.obj_fmt_dsgn.name][globalvars.labels.obj_fmt_name.name] = initParams["fmtName"]
-    #metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_chars.name][globalvars.labels.obj_fmt.name][globalvars.labels.obj_fmt_dsgn.name][globalvars.labels.obj_fmt_ver.name] = initParams["fmtVer"]
-
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.obj_entity.name][globalvars.labels.obj_orig_name.name] = initParams["fileName"]
-
-    # Create a parent entity (list) of all PREMIS 'event' entities.
-    metadataRecord[globalvars.labels.pres_entity.name][globalvars.labels.evt_parent_entity.name] = []
-    print_info("The following record has been initialized: {}".format(metadataRecord))
+    metadataRecord = getPremisTemplates()["record"](uniqueId, adminEntity, initParams["fileSize"],
+                                                    initParams["fmtName"], initParams["fmtVer"], initParams["fileName"])
+
+    if globalvars.quietMode == False:
+        print_info("The following record has been initialized: {}".format(metadataRecord))
 
     return metadataRecord
 
 
 def createIDAssignmentEvent(uniqueId):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.idAssgn
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
-
-    # Create a parent entity (list) for all PREMIS 'eventDetailInformation' entities
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_algo.name] = globalvars.UNIQUE_ID_ALGO
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_proglang.name] = globalvars.PYTHON_VER_STR
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_mthd.name] = globalvars.UNIQUE_ID_METHOD
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_idAssgn.name] = uniqueId
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
-
-    return eventRecord
+    return getPremisTemplates()["idAssignment"](uniqueId)
 
 
 def createMsgDigestCalcEvent(chksm, chksmAlgo):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.msgDgstCalc
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_algo.name] = globalvars.CHECKSUM_ALGO
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_proglang.name] = globalvars.PYTHON_VER_STR
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_mthd.name] = globalvars.CHECKSUM_METHOD
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_msgDgst.name] = chksm
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
-
-    return eventRecord
-
-def createFileCopyEvent(evtTyp, srcFilePath, dstFilePath):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.replication
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_src.name] = srcFilePath
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_dst.name] = dstFilePath
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
+    return getPremisTemplates()["msgDigestCalc"](chksm)
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
 
-    return eventRecord
+def createFileCopyEvent(evtTyp, srcFilePath, dstFilePath):
+    return getPremisTemplates()["fileCopy"](srcFilePath, dstFilePath)
 
 
 def createFilenameChangeEvent(dstFilePrelimPath, dstFileUniquePath):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.filenameChg
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
+    return getPremisTemplates()["filenameChange"](dstFilePrelimPath, dstFileUniquePath)
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_src.name] = dstFilePrelimPath
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_dst.name] = dstFileUniquePath
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
+def createFixityCheckEvent(status, calcChecksum):
+    return getPremisTemplates()["fixityCheck"]()
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
 
-    return eventRecord
+def createAccessionEvent():
+    return getPremisTemplates()["accession"]()
 
 
-def createFixityCheckEvent(status, calcChecksum):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.fixityChk
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
+def createMetadataExtractionEvent(extdMethd, extdmeta):
+    # The extracted metadata is in the record itself, the event only references it by its hash.
+    return getPremisTemplates()["metadataExtraction"](extdMethd, getContentHash(extdmeta), getMetadataDelta({}, extdmeta))
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
+def createMetadataModificationEvent(before, after):
+    # Only the changes are recorded (as a JSON Patch), instead of the whole metadata before and after.
+    return getPremisTemplates()["metadataModification"](getMetadataDelta(before or {}, after))
 
-    return eventRecord
 
+def createMigrationEvent(fileType, fileSize, imgWidth, imgHeight, fileName, paramHash=None):
+    return getPremisTemplates()["migration"](fileType, fileSize, imgWidth, imgHeight, fileName, paramHash)
 
-def createAccessionEvent():
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.accession
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
+def createDeletionEvent(filePath, dstFilePath):
+    return getPremisTemplates()["deletion"](filePath, dstFilePath)
 
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
 
-    return eventRecord
+def getArchivedFilePath(document):
+    """getArchivedFilePath(): Returns the path the file of a record was archived at, i.e.,
+    the destination of its filenameChange event, or None if it has none.
+    """
+    events = document.get(globalvars.labels.pres_entity.name, {}).get(globalvars.labels.evt_parent_entity.name, [])
 
-def createMetadataExtractionEvent(extdMethd, extdmeta):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.metadataExt
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_mthd.name] = extdMethd
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_metadataExtraction.name] = extdmeta
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
-
-    return eventRecord
+    for event in events:
+        event = event.get(globalvars.labels.evt_entity.name, {})
+        if event.get(globalvars.labels.evt_typ.name) == globalvars.vocab.evtTyp.filenameChg:
+            eventDetail = event[globalvars.labels.evt_detail_parent.name][0]
+            return eventDetail[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_dst.name]
 
-def createMetadataModificationEvent(before, after):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.metadataMod
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_before.name] = before
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_after.name] = after
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
-
-    return eventRecord
-
-def createMigrationEvent(fileType, fileSize, imgWidth, imgHeight, fileName):
-    eventRecord = {}
-    eventRecord[globalvars.labels.evt_entity.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_typ.name] = globalvars.EVT_ID_TYP
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_id.name][globalvars.labels.evt_id_val.name] = getUniqueID()
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_typ.name] = globalvars.vocab.evtTyp.migration
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_dttime.name] = getCurrentEDTFTimestamp()
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name] = []
-    eventDetailRecord = {}  # Create a single record for event detail information
-    eventDetailRecord[globalvars.labels.evt_detail_info.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name] = {}
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_fileType.name] = fileType
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_fileSize.name] = fileSize
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_imgWidth.name] = imgWidth
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_imgHeight.name] = imgHeight
-    eventDetailRecord[globalvars.labels.evt_detail_info.name][globalvars.labels.evt_detail_ext.name][globalvars.labels.evt_detail_fileName.name] = fileName
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_detail_parent.name].append(eventDetailRecord)
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_outcm_info.name][globalvars.labels.evt_outcm.name] = globalvars.vocab.evtOutcm.success
-
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name] = {}
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_typ.name] = globalvars.LNK_AGNT_ID_TYPE
-    eventRecord[globalvars.labels.evt_entity.name][globalvars.labels.evt_lnk_agnt_id.name][globalvars.labels.evt_lnk_agnt_id_val.name] = globalvars.LNK_AGNT_ID_VAL
-
-    return eventRecord
+    return None
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import csv
+import os
+from time import localtime, time, strftime
+
+import metadatautilspkg.globalvars as globalvars
+import metadatautilspkg.errorcodes as errorcodes
+from metadatautilspkg.metadatautils import *
+
+QUARANTINE_CSV_HEADER = ["filepath", "reason", "quarantined"]
+
+
+def readQuarantineList():
+    """readQuarantineList(): Reads the list of quarantined files.
+
+    Arguments:
+        None
+
+    Files that made a command time out or crash in an earlier run are recorded in
+    the quarantine file (globalvars.quarantineFileName). This function loads their
+    paths into globalvars.quarantineSet so that they can be skipped.
+    """
+    if os.path.isfile(globalvars.quarantineFileName) != True:
+        return
+
+    try:
+        with open(globalvars.quarantineFileName, "r") as quarantineFileHandle:
+            csvReader = csv.reader(quarantineFileHandle)
+            next(csvReader, None)  # Skip the header row
+            for row in csvReader:
+                if len(row) > 0:
+                    globalvars.quarantineSet.add(row[0])
+    except IOError as ioErrorCsvRead:
+        print_error(ioErrorCsvRead)
+        print_error(errorcodes.ERROR_CANNOT_READ_QUARANTINE_FILE["message"].format(globalvars.quarantineFileName))
+
+    print_info("Number of files in quarantine: {}".format(len(globalvars.quarantineSet)))
+
+
+def isQuarantined(filePath):
+    return os.path.abspath(filePath) in globalvars.quarantineSet
+
+
+def quarantineFile(filePath, reason):
+    """quarantineFile(): Adds a file to the quarantine list.
+
+    Arguments:
+        [1] filePath: path to the offending file.
+        [2] reason: why the file was quarantined.
+
+    The file is recorded in the quarantine file right away, so that it is skipped in
+    later runs even if the current run does not complete.
+    """
+    filePath = os.path.abspath(filePath)
+    globalvars.quarantineSet.add(filePath)
+
+    writeHeader = os.path.isfile(globalvars.quarantineFileName) != True
+    try:
+        with open(globalvars.quarantineFileName, "a") as quarantineFileHandle:
+            csvWriter = csv.writer(quarantineFileHandle, delimiter=',', quotechar='"', lineterminator='\n')
+            if writeHeader == True:
+                csvWriter.writerow(QUARANTINE_CSV_HEADER)
+            csvWriter.writerow([filePath, reason, strftime("%Y-%m-%d_%H%M%S", localtime(time()))])
+    except IOError as ioErrorCsvWrite:
+        print_error(ioErrorCsvWrite)
+        print_error(errorcodes.ERROR_CANNOT_WRITE_QUARANTINE_FILE["message"].format(globalvars.quarantineFileName))
+
+    print_error("The file '{}' has been quarantined: {}".format(filePath, reason))
+
+
+def checkCmdExitCode(exitCode, filePath):
+    """checkCmdExitCode(): Checks the exit code of a command run on a file.
+
+    Arguments:
+        [1] exitCode: exit code returned by cmdrunner.runCmd().
+        [2] filePath: path to the file the command was run on.
+
+    Returns:
+        None if the command was successful, or the error message otherwise. Files on
+        which the command timed out, or was killed by a signal, are quarantined.
+    """
+    if exitCode == 0:
+        return None
+
+    if exitCode == globalvars.CMD_TIMEOUT_EXIT_CODE:
+        message = errorcodes.ERROR_CMD_TIMEOUT["message"].format(globalvars.cmdTimeout, filePath)
+        quarantineFile(filePath, message)
+    elif exitCode < 0:
+        message = errorcodes.ERROR_CMD_KILLED["message"].format(-exitCode, filePath)
+        quarantineFile(filePath, message)
+    else:
+        message = errorcodes.ERROR_CMD_FAILED["message"].format(exitCode, filePath)
+        print_error(message)
+
+    return message
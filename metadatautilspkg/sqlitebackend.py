@@ -0,0 +1,912 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2017, ColoredInsaneAsylums
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# Embedded storage backend, keeping the collections in a single SQLite file, so
+# that the workflows run without a database server (e.g., at small sites, and
+# for benchmarks). See mongobackend.py for the interface of the backends.
+#
+# Each collection is a table of JSON documents,
+#
+#   CREATE TABLE "records" (_id PRIMARY KEY, doc TEXT NOT NULL)
+#
+# and the collections have the subset of the pymongo Collection methods, query
+# operators and update operators that the workflows use. The indexes are
+# expression indexes on the json_extract() of the indexed fields. Queries are
+# evaluated in two steps: the conditions on _id and on the indexed fields are
+# translated into SQL, looked up in the indexes, and the whole query is then
+# checked on the documents they select. Fields of the documents in arrays, e.g.,
+# the events, cannot be indexed this way, and are "multikey" indexes, which
+# are declared, but whose queries scan the table.
+#
+# Dates are stored as {"$date": "<ISO 8601 date, in UTC>"}, whose JSON text
+# sorts as the dates do.
+
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import cmp_to_key
+from uuid import uuid4
+
+ASCENDING = 1
+DESCENDING = -1
+
+FETCH_SIZE = 500  # No. of rows fetched from SQLite at a time while iterating over a query.
+
+
+class DatabaseError(Exception):
+    pass
+
+class AuthenticationError(DatabaseError):
+    pass
+
+class ConfigurationError(DatabaseError):
+    pass
+
+class DuplicateKeyError(DatabaseError):
+    pass
+
+class BulkWriteError(DatabaseError):
+    """Failed operations of a bulk write, in details['writeErrors'] as with pymongo."""
+
+    def __init__(self, message, details):
+        super().__init__(message)
+        self.details = details
+
+
+class InsertOne:
+    def __init__(self, document):
+        self.document = document
+
+class UpdateOne:
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+
+class DeleteOne:
+    def __init__(self, filter):
+        self.filter = filter
+
+
+class WriteResult:
+    """Counts of a write, with the attribute names of the pymongo results."""
+
+    def __init__(self):
+        self.inserted_id = None
+        self.upserted_id = None
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+        self.deleted_count = 0
+        self.upserted_ids = {}  # Ids of the documents inserted by a bulk write, by index of the operation.
+
+
+def connect(dbConfig):
+    """connect
+
+    Arguments:
+        dbConfig: the parsed DB configuration file.
+
+    This function opens (creating it if needed) the SQLite file of the "dbpath"
+    setting, and returns a handle to it. "synchronous" ("OFF", "NORMAL", the default,
+    or "FULL") trades the durability of the last writes, on a power failure, for
+    speed, as the write concern does with MongoDB.
+
+    """
+
+    synchronous = str(dbConfig.get('synchronous', "NORMAL")).upper()
+    if synchronous not in ["OFF", "NORMAL", "FULL"]:
+        raise ConfigurationError("synchronous: {}".format(synchronous))
+
+    try:
+        connection = sqlite3.connect(dbConfig['dbpath'], timeout=float(dbConfig.get('busytimeout', 30)),
+                                     isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")  # Readers (e.g., derivserver.py) do not block the writer.
+        connection.execute("PRAGMA synchronous=" + synchronous)
+        connection.execute("CREATE TABLE IF NOT EXISTS _indexes (collection TEXT, name TEXT, keys TEXT NOT NULL, "
+                           "multikey INTEGER NOT NULL, PRIMARY KEY (collection, name))")
+    except sqlite3.Error as ExceptionSqlite:
+        raise DatabaseError("{}: {}".format(dbConfig['dbpath'], ExceptionSqlite))
+
+    return Database(connection)
+
+def createIndex(collection, indexKeys, indexName, multikey):
+    collection.create_index(indexKeys, name=indexName, multikey=multikey)
+
+
+def encodeDefault(value):
+    if isinstance(value, datetime):
+        if value.tzinfo != None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        # A fixed width, so that the dates sort as text.
+        return {"$date": value.isoformat(timespec='microseconds')}
+    raise TypeError("Cannot store a value of type {} in the database.".format(type(value).__name__))
+
+def decodeObject(value):
+    if len(value) == 1 and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+def encodeDocument(document):
+    return json.dumps(document, default=encodeDefault, separators=(',', ':'), ensure_ascii=False)
+
+def decodeDocument(text):
+    return json.loads(text, object_hook=decodeObject)
+
+def getSqlValue(value):
+    # The value as returned by json_extract(), for comparisons in SQL.
+    if isinstance(value, datetime):
+        return encodeDocument(value)
+    return value
+
+def isSqlValue(value):
+    return isinstance(value, (str, int, float, datetime)) and not isinstance(value, bool)
+
+def getFieldExpression(field):
+    """getFieldExpression
+
+    Arguments:
+        field: (dotted) name of a field of the documents.
+
+    This function returns the SQL expression of the value of the field. The
+    expression is the same in the indexes and in the queries, so that SQLite
+    uses the indexes for the queries.
+
+    """
+
+    if field == '_id':
+        return "_id"
+
+    if '"' in field:
+        raise DatabaseError("Invalid field name '{}'.".format(field))
+
+    jsonPath = "$" + "".join(['."' + key + '"' for key in field.split('.')])
+    return "json_extract(doc, '" + jsonPath.replace("'", "''") + "')"
+
+def getRegexPrefix(pattern):
+    # Literal prefix of an anchored regex, e.g., "/data/src/" for "^/data/src/[^/]*$",
+    # which the matching strings start with. Empty if there is none.
+    if not pattern.startswith("^") or "|" in pattern:
+        return ""
+
+    prefix = ""
+    position = 1
+    while position < len(pattern):
+        char = pattern[position]
+        if char == "\\" and position + 1 < len(pattern) and not pattern[position + 1].isalnum():
+            literal = pattern[position + 1]
+            position += 2
+        elif char not in ".^$*+?{}[]()\\":
+            literal = char
+            position += 1
+        else:
+            break
+        if position < len(pattern) and pattern[position] in "*?{":
+            break  # The literal is optional.
+        prefix += literal
+
+    return prefix
+
+
+# MATCHING THE QUERIES
+#
+# The values at a field path are looked up as MongoDB does, descending into the
+# arrays along the path, e.g., "premis.eventList.event.eventType" returns the
+# types of all the events.
+
+def getFieldValues(document, field):
+    values = [document]
+    for key in field.split('.'):
+        nextValues = []
+        for value in values:
+            if isinstance(value, dict):
+                if key in value:
+                    nextValues.append(value[key])
+            elif isinstance(value, list):
+                if key.isdigit() and int(key) < len(value):
+                    nextValues.append(value[int(key)])
+                nextValues.extend([item[key] for item in value if isinstance(item, dict) and key in item])
+        values = nextValues
+
+    return values
+
+def getCandidateValues(values):
+    # The values, and the items of the values that are arrays.
+    candidates = list(values)
+    for value in values:
+        if isinstance(value, list):
+            candidates.extend(value)
+    return candidates
+
+def isEqual(value, target):
+    if isinstance(value, bool) != isinstance(target, bool):
+        return False
+    return value == target
+
+def getTypeOrder(value):
+    # Order of the types in comparisons and sorts, as in MongoDB.
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 7
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, datetime):
+        return 8
+    return 9
+
+def compareValues(value, target):
+    valueOrder = getTypeOrder(value)
+    targetOrder = getTypeOrder(target)
+    if valueOrder != targetOrder:
+        return valueOrder - targetOrder
+    if valueOrder in [3, 4]:
+        value = encodeDocument(value)
+        target = encodeDocument(target)
+    return (value > target) - (value < target)
+
+def matchEqual(values, target):
+    if target is None:
+        return len(values) == 0 or any(value is None for value in getCandidateValues(values))
+    return any(isEqual(value, target) for value in getCandidateValues(values))
+
+def matchOperator(values, operator, argument, condition):
+    if operator == '$eq':
+        return matchEqual(values, argument)
+    elif operator == '$ne':
+        return not matchEqual(values, argument)
+    elif operator == '$in':
+        return any(matchEqual(values, target) for target in argument)
+    elif operator == '$nin':
+        return not any(matchEqual(values, target) for target in argument)
+    elif operator == '$exists':
+        return (len(values) > 0) == bool(argument)
+    elif operator in ['$lt', '$lte', '$gt', '$gte']:
+        for value in getCandidateValues(values):
+            if getTypeOrder(value) != getTypeOrder(argument):
+                continue  # Only values of the same type are compared, as in MongoDB.
+            comparison = compareValues(value, argument)
+            if {'$lt': comparison < 0, '$lte': comparison <= 0, '$gt': comparison > 0, '$gte': comparison >= 0}[operator]:
+                return True
+        return False
+    elif operator == '$regex':
+        flags = 0
+        for option in condition.get('$options', ""):
+            flags |= {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}.get(option, 0)
+        regex = argument if isinstance(argument, re.Pattern) else re.compile(argument, flags)
+        return any(isinstance(value, str) and regex.search(value) != None for value in getCandidateValues(values))
+    elif operator == '$options':
+        return True
+    elif operator == '$not':
+        return not matchCondition(values, argument)
+    else:
+        raise DatabaseError("Unsupported query operator '{}'.".format(operator))
+
+def isOperatorCondition(condition):
+    return isinstance(condition, dict) and len(condition) > 0 and all(key.startswith('$') for key in condition)
+
+def matchCondition(values, condition):
+    if isOperatorCondition(condition):
+        return all(matchOperator(values, operator, argument, condition) for operator, argument in condition.items())
+    if isinstance(condition, re.Pattern):
+        return matchOperator(values, '$regex', condition, {})
+    return matchEqual(values, condition)
+
+def matchDocument(document, query):
+    """matchDocument
+
+    Arguments:
+        document: the document to be checked.
+        query: a MongoDB query.
+
+    This function returns True if the document matches the query.
+
+    """
+
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(matchDocument(document, subQuery) for subQuery in condition):
+                return False
+        elif key == '$or':
+            if not any(matchDocument(document, subQuery) for subQuery in condition):
+                return False
+        elif key == '$nor':
+            if any(matchDocument(document, subQuery) for subQuery in condition):
+                return False
+        elif key.startswith('$'):
+            raise DatabaseError("Unsupported query operator '{}'.".format(key))
+        elif not matchCondition(getFieldValues(document, key), condition):
+            return False
+
+    return True
+
+def getConjuncts(query):
+    # The (field, condition) pairs that all the matching documents satisfy.
+    for key, condition in query.items():
+        if key == '$and':
+            for subQuery in condition:
+                yield from getConjuncts(subQuery)
+        elif not key.startswith('$'):
+            yield key, condition
+
+
+# PROJECTIONS, UPDATES AND AGGREGATIONS
+
+def copyField(source, destination, keys):
+    if keys[0] not in source:
+        return
+
+    value = source[keys[0]]
+    if len(keys) == 1:
+        destination[keys[0]] = value
+    elif isinstance(value, dict):
+        copyField(value, destination.setdefault(keys[0], {}), keys[1:])
+    elif isinstance(value, list):
+        items = [item for item in value if isinstance(item, dict)]
+        destinationItems = destination.setdefault(keys[0], [{} for item in items])
+        for item, destinationItem in zip(items, destinationItems):
+            copyField(item, destinationItem, keys[1:])
+
+def projectDocument(document, projection):
+    if projection is None:
+        return document
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    includedFields = [field for field, include in projection.items() if include and field != '_id']
+    if len(includedFields) > 0:
+        result = {}
+        for field in includedFields:
+            copyField(document, result, field.split('.'))
+    else:
+        result = document
+        for field, include in projection.items():
+            if not include and field != '_id':
+                unsetField(result, field)
+
+    if projection.get('_id', 1) and '_id' in document:
+        result['_id'] = document['_id']
+    else:
+        result.pop('_id', None)
+
+    return result
+
+def getParent(document, field, create):
+    keys = field.split('.')
+    parent = document
+    for key in keys[:-1]:
+        if isinstance(parent, list) and key.isdigit():
+            parent = parent[int(key)]
+        elif create == True:
+            parent = parent.setdefault(key, {})
+        elif isinstance(parent, dict) and key in parent:
+            parent = parent[key]
+        else:
+            return None, keys[-1]
+    return parent, keys[-1]
+
+def setField(document, field, value):
+    parent, key = getParent(document, field, True)
+    if isinstance(parent, list):
+        parent[int(key)] = value
+    else:
+        parent[key] = value
+
+def unsetField(document, field):
+    parent, key = getParent(document, field, False)
+    if isinstance(parent, dict):
+        parent.pop(key, None)
+
+def getField(document, field, default=None):
+    parent, key = getParent(document, field, False)
+    if isinstance(parent, dict):
+        return parent.get(key, default)
+    return default
+
+def applyUpdate(document, update, isInsert=False):
+    for operator, fields in update.items():
+        if operator == '$set':
+            for field, value in fields.items():
+                setField(document, field, value)
+        elif operator == '$setOnInsert':
+            if isInsert == True:
+                for field, value in fields.items():
+                    setField(document, field, value)
+        elif operator == '$unset':
+            for field in fields:
+                unsetField(document, field)
+        elif operator == '$inc':
+            for field, amount in fields.items():
+                value = getField(document, field, 0)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise DatabaseError("The field '{}' is not a number.".format(field))
+                setField(document, field, value + amount)
+        elif operator == '$push':
+            for field, value in fields.items():
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                valueList = getField(document, field)
+                if valueList is None:
+                    valueList = []
+                    setField(document, field, valueList)
+                elif not isinstance(valueList, list):
+                    raise DatabaseError("The field '{}' is not an array.".format(field))
+                valueList.extend(items)
+        else:
+            raise DatabaseError("Unsupported update operator '{}'.".format(operator))
+
+def getUpsertDocument(query, update):
+    # The document inserted by an upsert: the equality conditions of the query, then the update.
+    document = {}
+    for field, condition in getConjuncts(query):
+        if not isOperatorCondition(condition):
+            setField(document, field, condition)
+    applyUpdate(document, update, isInsert=True)
+    if '_id' not in document:
+        document['_id'] = str(uuid4())
+    return document
+
+def getExpressionValue(document, expression):
+    # Value of an aggregation expression, e.g., "$premis.object.size", or a
+    # document of such expressions. Missing fields are left out.
+    if isinstance(expression, str) and expression.startswith('$'):
+        values = getFieldValues(document, expression[1:])
+        if len(values) == 0:
+            return None
+        return values[0] if len(values) == 1 else values
+    if isinstance(expression, dict):
+        result = {}
+        for key, subExpression in expression.items():
+            value = getExpressionValue(document, subExpression)
+            if value != None:
+                result[key] = value
+        return result
+    return expression
+
+def groupDocuments(documents, group):
+    groups = {}
+    for document in documents:
+        groupId = getExpressionValue(document, group['_id'])
+        groupKey = encodeDocument(groupId)
+        if groupKey not in groups:
+            groups[groupKey] = {'_id': groupId}
+        result = groups[groupKey]
+
+        for field, accumulator in group.items():
+            if field == '_id':
+                continue
+            (operator, expression), = accumulator.items()
+            value = getExpressionValue(document, expression)
+            if operator == '$sum':
+                amount = value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+                result[field] = result.get(field, 0) + amount
+            elif operator == '$first':
+                result.setdefault(field, value)
+            elif operator == '$last':
+                result[field] = value
+            elif operator == '$push':
+                result.setdefault(field, []).append(value)
+            else:
+                raise DatabaseError("Unsupported accumulator '{}'.".format(operator))
+
+    return list(groups.values())
+
+def sortDocuments(documents, sortKeys):
+    def compareDocuments(document, otherDocument):
+        for field, direction in sortKeys:
+            values = getFieldValues(document, field)
+            otherValues = getFieldValues(otherDocument, field)
+            comparison = compareValues(values[0] if len(values) > 0 else None, otherValues[0] if len(otherValues) > 0 else None)
+            if comparison != 0:
+                return comparison * direction
+        return 0
+
+    return sorted(documents, key=cmp_to_key(compareDocuments))
+
+def getSortKeys(keyOrList, direction=ASCENDING):
+    if isinstance(keyOrList, str):
+        return [(keyOrList, direction)]
+    return [(key, keyDirection) for key, keyDirection in keyOrList]
+
+
+class Cursor:
+    """Results of Collection.find(), looked up when iterated over."""
+
+    def __init__(self, collection, query, projection, sort=None, limit=0):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.sortKeys = getSortKeys(sort) if sort != None else []
+        self.limitCount = limit
+
+    def sort(self, keyOrList, direction=ASCENDING):
+        self.sortKeys = getSortKeys(keyOrList, direction)
+        return self
+
+    def limit(self, limit):
+        self.limitCount = limit
+        return self
+
+    def batch_size(self, batchSize):
+        return self
+
+    def explain(self):
+        return self.collection.explainQuery(self.query)
+
+    def __iter__(self):
+        # Documents sorted on _id alone are read in the order of the primary key, so
+        # that a limited page of them is found without sorting all the others.
+        orderById = self.sortKeys == [('_id', ASCENDING)]
+        documents = self.collection.iterDocuments(self.query, orderById)
+        if len(self.sortKeys) > 0 and not orderById:
+            documents = iter(sortDocuments(list(documents), self.sortKeys))
+
+        for count, document in enumerate(documents):
+            if self.limitCount > 0 and count >= self.limitCount:
+                break
+            yield projectDocument(document, self.projection)
+
+
+class Collection:
+    """A collection of JSON documents, in a table of the SQLite file."""
+
+    def __init__(self, database, name):
+        if '"' in name:
+            raise DatabaseError("Invalid collection name '{}'.".format(name))
+
+        self.database = database
+        self.name = name
+        self.tableName = '"' + name + '"'
+        self.indexedFields = set()  # Fields that have an expression index, and are looked up in SQL.
+
+        with self.database.lock:
+            self.database.connection.execute("CREATE TABLE IF NOT EXISTS {} (_id PRIMARY KEY, doc TEXT NOT NULL)".format(self.tableName))
+            for keys, multikey in self.database.connection.execute("SELECT keys, multikey FROM _indexes WHERE collection = ?", (name,)):
+                if not multikey:
+                    self.indexedFields.update([field for field, direction in json.loads(keys)])
+
+    def with_options(self, **kwargs):
+        # Read preferences and write concerns do not apply to a local file.
+        return self
+
+    def getSqlFilter(self, query):
+        """getSqlFilter
+
+        Arguments:
+            query: a MongoDB query.
+
+        This function returns the SQL condition, and its parameters, of the
+        conditions of the query on _id and on the indexed fields, that the
+        indexes can look up. The condition selects all the documents that match
+        the query (and maybe some more), and the query is then checked on them.
+
+        """
+
+        sqlConditions = []
+        sqlParams = []
+
+        for field, condition in getConjuncts(query):
+            if field != '_id' and field not in self.indexedFields:
+                continue
+
+            expression = getFieldExpression(field)
+            if not isOperatorCondition(condition):
+                condition = {'$eq': condition}
+
+            for operator, argument in condition.items():
+                if operator == '$eq' and isSqlValue(argument):
+                    sqlConditions.append(expression + " = ?")
+                    sqlParams.append(getSqlValue(argument))
+                elif operator == '$in' and len(argument) > 0 and all(isSqlValue(value) for value in argument):
+                    sqlConditions.append(expression + " IN (" + ", ".join(["?"] * len(argument)) + ")")
+                    sqlParams.extend([getSqlValue(value) for value in argument])
+                elif operator in ['$lt', '$lte', '$gt', '$gte'] and isSqlValue(argument):
+                    sqlConditions.append(expression + {'$lt': " < ?", '$lte': " <= ?", '$gt': " > ?", '$gte': " >= ?"}[operator])
+                    sqlParams.append(getSqlValue(argument))
+                elif operator == '$regex' and isinstance(argument, str) and "i" not in condition.get('$options', ""):
+                    prefix = getRegexPrefix(argument)
+                    if len(prefix) > 0:
+                        sqlConditions.append(expression + " >= ? AND " + expression + " < ?")
+                        sqlParams.extend([prefix, prefix + chr(0x10FFFF)])
+
+        return " AND ".join(sqlConditions), sqlParams
+
+    def getSelectStatement(self, query, columns="_id, doc"):
+        sqlFilter, sqlParams = self.getSqlFilter(query)
+        statement = "SELECT {} FROM {}".format(columns, self.tableName)
+        if len(sqlFilter) > 0:
+            statement += " WHERE " + sqlFilter
+        return statement, sqlParams
+
+    def iterDocuments(self, query, orderById=False):
+        # The documents matching the query, fetched a few at a time.
+        statement, sqlParams = self.getSelectStatement(query or {})
+        if orderById:
+            statement += " ORDER BY _id"
+        try:
+            with self.database.lock:
+                cursor = self.database.connection.execute(statement, sqlParams)
+        except sqlite3.Error as ExceptionSqlite:
+            raise DatabaseError(ExceptionSqlite)
+
+        while True:
+            try:
+                with self.database.lock:
+                    rows = cursor.fetchmany(FETCH_SIZE)
+            except sqlite3.Error as ExceptionSqlite:
+                raise DatabaseError(ExceptionSqlite)
+            if len(rows) == 0:
+                break
+            for documentId, text in rows:
+                document = decodeDocument(text)
+                if matchDocument(document, query or {}):
+                    yield document
+
+    def explainQuery(self, query):
+        # The query plan, in the form of the MongoDB explain() output.
+        statement, sqlParams = self.getSelectStatement(query or {})
+        with self.database.lock:
+            details = [row[-1] for row in self.database.connection.execute("EXPLAIN QUERY PLAN " + statement, sqlParams)]
+
+        indexDetails = [detail for detail in details if detail.startswith("SEARCH")]
+        if len(indexDetails) == 0:
+            winningPlan = {'stage': 'COLLSCAN'}
+        else:
+            winningPlan = {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': indexDetails[0]}}
+
+        return {'queryPlanner': {'winningPlan': winningPlan, 'sqlitePlan': details}}
+
+    def find(self, filter=None, projection=None, sort=None, limit=0, **kwargs):
+        return Cursor(self, filter or {}, projection, sort, limit)
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        for document in self.find(filter, projection, limit=1):
+            return document
+        return None
+
+    def count_documents(self, filter, **kwargs):
+        return sum(1 for document in self.iterDocuments(filter))
+
+    def aggregate(self, pipeline, **kwargs):
+        documents = None
+        for stage in pipeline:
+            (operator, argument), = stage.items()
+            if operator == '$match':
+                if documents is None:
+                    documents = self.iterDocuments(argument)
+                else:
+                    documents = [document for document in documents if matchDocument(document, argument)]
+            elif documents is None:
+                documents = self.iterDocuments({})
+
+            if operator == '$group':
+                documents = groupDocuments(documents, argument)
+            elif operator == '$sort':
+                documents = sortDocuments(list(documents), list(argument.items()))
+            elif operator == '$limit':
+                documents = list(documents)[:argument]
+            elif operator != '$match':
+                raise DatabaseError("Unsupported aggregation stage '{}'.".format(operator))
+
+        return iter(documents if documents != None else self.iterDocuments({}))
+
+    def insertDocument(self, document, result):
+        if '_id' not in document:
+            document['_id'] = str(uuid4())
+        try:
+            self.database.connection.execute("INSERT INTO {} (_id, doc) VALUES (?, ?)".format(self.tableName),
+                                             (document['_id'], encodeDocument(document)))
+        except sqlite3.IntegrityError:
+            raise DuplicateKeyError("Duplicate _id '{}' in the collection '{}'.".format(document['_id'], self.name))
+        result.inserted_id = document['_id']
+        result.inserted_count += 1
+
+    def updateDocuments(self, query, update, upsert, multi, result):
+        matchedCount = 0
+        updatedRows = []
+        for document in self.iterDocuments(query):
+            matchedCount += 1
+            text = encodeDocument(document)
+            applyUpdate(document, update)
+            newText = encodeDocument(document)
+            if newText != text:
+                updatedRows.append((newText, document['_id']))
+            if multi == False:
+                break
+
+        if len(updatedRows) > 0:
+            self.database.connection.executemany("UPDATE {} SET doc = ? WHERE _id = ?".format(self.tableName), updatedRows)
+            result.modified_count += len(updatedRows)
+
+        # The result may hold the counts of the previous operations of a bulk write.
+        result.matched_count += matchedCount
+        if matchedCount == 0 and upsert == True:
+            document = getUpsertDocument(query, update)
+            self.insertDocument(document, WriteResult())
+            result.upserted_id = document['_id']
+            result.upserted_count += 1
+
+    def deleteDocuments(self, query, multi, result):
+        if len(query) == 0 and multi == True:
+            result.deleted_count += self.database.connection.execute("DELETE FROM {}".format(self.tableName)).rowcount
+            return
+
+        documentIds = []
+        for document in self.iterDocuments(query):
+            documentIds.append((document['_id'],))
+            if multi == False:
+                break
+
+        self.database.connection.executemany("DELETE FROM {} WHERE _id = ?".format(self.tableName), documentIds)
+        result.deleted_count += len(documentIds)
+
+    def insert_one(self, document, **kwargs):
+        result = WriteResult()
+        with self.database.transaction():
+            self.insertDocument(document, result)
+        return result
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        result = WriteResult()
+        with self.database.transaction():
+            self.updateDocuments(filter, update, upsert, False, result)
+        return result
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        result = WriteResult()
+        with self.database.transaction():
+            self.updateDocuments(filter, update, upsert, True, result)
+        return result
+
+    def delete_one(self, filter, **kwargs):
+        result = WriteResult()
+        with self.database.transaction():
+            self.deleteDocuments(filter, False, result)
+        return result
+
+    def delete_many(self, filter, **kwargs):
+        result = WriteResult()
+        with self.database.transaction():
+            self.deleteDocuments(filter, True, result)
+        return result
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        """bulk_write
+
+        Arguments:
+            requests: list of InsertOne, UpdateOne and DeleteOne operations.
+            ordered: if True, the operations after a failed one are not run.
+
+        This function runs the operations in a single transaction, and returns
+        their counts. The operations that failed are reported, once the others
+        are written, with a BulkWriteError listing them by index.
+
+        """
+
+        result = WriteResult()
+        errors = []
+
+        with self.database.transaction():
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self.insertDocument(request.document, result)
+                    elif isinstance(request, UpdateOne):
+                        upsertedCount = result.upserted_count
+                        self.updateDocuments(request.filter, request.update, request.upsert, False, result)
+                        if result.upserted_count > upsertedCount:
+                            result.upserted_ids[index] = result.upserted_id
+                    elif isinstance(request, DeleteOne):
+                        self.deleteDocuments(request.filter, False, result)
+                    else:
+                        raise DatabaseError("Unsupported bulk write operation {}.".format(type(request).__name__))
+                except DatabaseError as ExceptionDatabase:
+                    errors.append({'index': index, 'errmsg': str(ExceptionDatabase)})
+                    if ordered == True:
+                        break
+
+        if len(errors) > 0:
+            raise BulkWriteError("{} of the bulk write operations failed: {}".format(len(errors), "; ".join(error['errmsg'] for error in errors)),
+                                 {'writeErrors': errors, 'nInserted': result.inserted_count, 'nModified': result.modified_count,
+                                  'nRemoved': result.deleted_count})
+
+        return result
+
+    def create_index(self, keys, name=None, multikey=False, **kwargs):
+        keys = getSortKeys(keys)
+        if name is None:
+            name = "_".join([field + "_" + str(direction) for field, direction in keys])
+
+        with self.database.transaction():
+            if multikey == False:
+                columns = ", ".join([getFieldExpression(field) + (" DESC" if direction == DESCENDING else "") for field, direction in keys])
+                self.database.connection.execute('CREATE INDEX IF NOT EXISTS "{}.{}" ON {} ({})'.format(self.name, name, self.tableName, columns))
+                self.indexedFields.update([field for field, direction in keys])
+            self.database.connection.execute("INSERT OR REPLACE INTO _indexes (collection, name, keys, multikey) VALUES (?, ?, ?, ?)",
+                                             (self.name, name, json.dumps(keys), int(multikey)))
+        return name
+
+    def index_information(self):
+        indexInfo = {'_id_': {'key': [('_id', ASCENDING)]}}
+        with self.database.lock:
+            for name, keys in self.database.connection.execute("SELECT name, keys FROM _indexes WHERE collection = ?", (self.name,)):
+                indexInfo[name] = {'key': [tuple(key) for key in json.loads(keys)]}
+        return indexInfo
+
+
+class Database:
+    """The SQLite file, shared by the threads of the workflows, one statement at a time."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.RLock()
+        self.collections = {}
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = Collection(self, name)
+            return self.collections[name]
+
+    @contextmanager
+    def transaction(self):
+        # Writes of a call (e.g., a bulk write) are committed together, which is
+        # much faster than committing each statement.
+        with self.lock:
+            if self.connection.in_transaction:
+                yield
+                return
+
+            try:
+                self.connection.execute("BEGIN IMMEDIATE")
+            except sqlite3.Error as ExceptionSqlite:
+                raise DatabaseError(ExceptionSqlite)
+
+            try:
+                yield
+                self.connection.execute("COMMIT")
+            except sqlite3.Error as ExceptionSqlite:
+                self.connection.execute("ROLLBACK")
+                raise DatabaseError(ExceptionSqlite)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
@@ -44,7 +44,6 @@ import re
 
 from datetime import datetime
 from time import localtime, time, strftime
-from subprocess import PIPE, Popen
 
 from metadatautilspkg.globalvars import *
 from metadatautilspkg.errorcodes import *
@@ -52,51 +51,26 @@ from metadatautilspkg.technical import *
 from metadatautilspkg.dbfunctions import *
 from metadatautilspkg.premis import *
 from metadatautilspkg.metadatautils import *
+from metadatautilspkg.cmdrunner import *
+from metadatautilspkg.envcache import getImageMagickVersion
+from metadatautilspkg.quarantine import *
 
 def main():
 
-    # Verify whether ImageMagick is installed in the system or not. Throws error if ImageMagick is not installed.
-    output, error, exitcode = runCmd('identify -version')
-    imgversion = output.decode('utf-8').split('\n')
+    argParser = defineCommandLineOptions()
+    parseCommandLineArgs(argParser, sys.argv[1:])
 
-    # remove null values from the list
-    while '' in imgversion:
-        imgversion.remove('')
+    print_info("quiet mode: ", globalvars.quietMode)
 
-    imgver = []
-    for str in imgversion:
-            if ': ' in str:
-                imgver.append(str)
-            else:
-                globalvars.technicalErrorList.append([errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"]])
-                print_error(errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"])
-                errorCSV()
-                exit(errorcodes.ERROR_INSTALL_IMAGEMAGICK["code"])
-
-    version = {}
-    for item in imgver:
-        key, value = item.split(": ")
-        key = key.strip(" ")
-        value = value.strip(" ")
-        version[key] = value
-
-    if 'Version' in version:
-        ver = version['Version']
-        if 'ImageMagick' not in ver:
-            globalvars.technicalErrorList.append([errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"]])
-            print_error(errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"])
-            errorCSV()
-            exit(errorcodes.ERROR_INSTALL_IMAGEMAGICK["code"])
-    else:
+    # Verify whether ImageMagick is installed in the system or not. Throws error if ImageMagick is not installed.
+    ver = getImageMagickVersion()
+    if ver == None:
         globalvars.technicalErrorList.append([errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"]])
         print_error(errorcodes.ERROR_INSTALL_IMAGEMAGICK["message"])
         errorCSV()
         exit(errorcodes.ERROR_INSTALL_IMAGEMAGICK["code"])
 
-    argParser = defineCommandLineOptions()
-    parseCommandLineArgs(argParser, sys.argv[1:])
-
-    print_info("quiet mode: ", globalvars.quietMode)
+    readQuarantineList()
 
     if globalvars.batchMode == True:  # Batch mode. Read and validate CSV file.
     # Read CSV file contents into globalvars.technicalList.
@@ -177,6 +151,10 @@ def main():
         # function to extract technical properties of the files in technicalFileInfo.
         technicalStatus = technicalRecord(arrangementInfo, ver)
 
+    # WRITE ALL FILES THAT COULD NOT BE PROCESSED TO A CSV FILE
+    if len(globalvars.technicalErrorList) > 1:  # Because at least the header row will always be there!
+        errorCSV()
+
 def errorCSV():
     # WRITE ALL ROWS THAT COULD NOT BE PROCESSED TO A CSV FILE
     if len(globalvars.technicalErrorList) > 0:
@@ -203,6 +181,11 @@ def defineCommandLineOptions():
     argParser.add_argument('-e', '--extension', nargs=1, default='*', help='Specify file EXTENSION for files that need to be migrated.') # tif files supported
     argParser.add_argument('-f', '--file', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file to be used with the -f option.')
     argParser.add_argument('-q', '--quiet', action='store_true', help='Enable this option to suppress all logging, except critical error messages.')
+    argParser.add_argument('-t', '--timeout', nargs=1, type=int, default=False, metavar='SECONDS', help='Kill the external command run on a file after SECONDS seconds, and quarantine the file. 0 disables the timeout. Default: {}.'.format(globalvars.cmdTimeout))
+    argParser.add_argument('--maxmemory', nargs=1, type=int, default=False, metavar='MB', help='Limit the memory of the external command run on a file to MB megabytes.')
+    argParser.add_argument('--maxcputime', nargs=1, type=int, default=False, metavar='SECONDS', help='Limit the CPU time of the external command run on a file to SECONDS seconds.')
+    argParser.add_argument('-w', '--workers', nargs=1, type=int, default=False, metavar='NUMWORKERS', help='Run the external command on up to NUMWORKERS files in parallel. Default: no. of CPUs ({}).'.format(globalvars.numWorkers))
+    argParser.add_argument('--quarantinefile', nargs=1, default=False, metavar='CSVPATH', help='CSVPATH is the path to the CSV file listing quarantined files. Default: {}.'.format(globalvars.quarantineFileName))
     # argParser.add_argument('-h', '--showhelp', action='store_true', help='Gives the argument options')
     return argParser
 
@@ -223,6 +206,17 @@ def parseCommandLineArgs(argParser, args):
     globalvars.quietMode = parsedArgs.quiet
     # globalvars.help = parsedArgs.showhelp
 
+    if parsedArgs.timeout:
+        globalvars.cmdTimeout = parsedArgs.timeout[0]
+    if parsedArgs.maxmemory:
+        globalvars.cmdMaxMemory = parsedArgs.maxmemory[0]
+    if parsedArgs.maxcputime:
+        globalvars.cmdMaxCpuTime = parsedArgs.maxcputime[0]
+    if parsedArgs.workers:
+        globalvars.numWorkers = parsedArgs.workers[0]
+    if parsedArgs.quarantinefile:
+        globalvars.quarantineFileName = parsedArgs.quarantinefile[0]
+
     if parsedArgs.file:
         globalvars.batchMode = True
         globalvars.csvFile = parsedArgs.file[0]
@@ -232,19 +226,6 @@ def parseCommandLineArgs(argParser, args):
         errorCSV()
         exit(errorcodes.ERROR_FILE_ARGUMENT["code"])
 
-def runCmd(cmd):
-    """
-    This method runs a command and returns a list
-    with the contents of its stdout and stderr and
-    the exit code of the command.
-    """
-    shell_cmd = Popen(cmd, shell=True, stdin=PIPE, stdout=PIPE, stderr=PIPE, close_fds=True)
-    (handleChildStdin,handleChildStdout,handleChildStderr) = (shell_cmd.stdin, shell_cmd.stdout, shell_cmd.stderr)
-    childStdout = handleChildStdout.read()
-    childStderr = handleChildStderr.read()
-    shell_cmd.wait()
-    return [childStdout, childStderr, shell_cmd.returncode]
-
 def technicalRecord(arrangementInfo, ver):
     """technicalRecord(): Carries out the extraction of the properties of the files.
 
@@ -258,15 +239,16 @@ def technicalRecord(arrangementInfo, ver):
             query.append({".".join([globalvars.labels.admn_entity.name, globalvars.labels.arrangement.name, label]) : arrangementInfo[label]})
 
     records = globalvars.dbHandle[globalvars.dbCollection].find({'$and' : query})
-    records = [record for record in records]
+    records = [record for record in assembleEvents(records)]
 
     if(len(records) > 0):
+        fileList = []  # (document, archived file path) pairs of the files to be processed.
         for document in records:
+            # Files that cannot be processed are reported and skipped, and the others are
+            # processed in batches once the records have all been checked.
             if "technical" in document:
                 print_info("The technical properties for the file has been already updated.")
                 globalvars.technicalErrorList.append([errorcodes.ERROR_TECH_UPDATED["message"]])
-                errorCSV()
-                exit()
             else:
                 if(document['premis']['eventList'][3]['event']['eventType'] == 'filenameChange'):
                     fullPath = document['premis']['eventList'][3]['event']['eventDetailInformationList'][0]['eventDetailInformation']['eventDetailExtension']['destination']
@@ -274,260 +256,270 @@ def technicalRecord(arrangementInfo, ver):
                     if (fileExt != globalvars.ext):
                         print_info("Extension of the file is '{}' and command line input is '{}', are not the same.".format(fileExt, globalvars.ext))
                         globalvars.technicalErrorList.append([errorcodes.ERROR_TECH_UPDATED["message"]])
-                        errorCSV()
-                        exit()
+                    elif isQuarantined(fullPath):
+                        print_error(errorcodes.ERROR_FILE_QUARANTINED["message"].format(fullPath))
+                        globalvars.technicalErrorList.append([errorcodes.ERROR_FILE_QUARANTINED["message"].format(fullPath)])
+                    else:
+                        fileList.append((document, fullPath))
+
+        # execute the command "identify -verbose <filename>" to fetch image properties, for a
+        # batch of files at a time.
+        for batchStart in range(0, len(fileList), globalvars.CMD_BATCH_SIZE):
+            fileBatch = fileList[batchStart:batchStart + globalvars.CMD_BATCH_SIZE]
+            cmdResults = runCmdMap([['identify', '-verbose', fullPath] for document, fullPath in fileBatch])
+
+            for (document, fullPath), (output, error, exitcode) in zip(fileBatch, cmdResults):
+                cmdError = checkCmdExitCode(exitcode, fullPath)
+                if cmdError != None:
+                    globalvars.technicalErrorList.append([cmdError])
+                    continue
+
+                lines = output.decode('utf-8').split('\n')              # read the output from the command
+                                                                        # decode the output in the 'utf-8' format and remove line spoces.
+
+                data = []
+                for str in lines:
+                    if ': ' in str:
+                        data.append(str)
+
+                data = [word.replace(':  ',':') for word in data]
+
+                # method to convert the list into dictionary to have key-value pairs.
+                prop = {}
+                for item in data:
+                    key, value = item.split(": ")
+                    key = key.strip(" ")
+                    value = value.strip(" ")
+                    prop[key] = value
+
+                # read the required technical properties from the dictionary
+                if 'filename' in prop:
+                    technicalFile = re.split(r'[/]', prop['filename'])
+                    technicalFileNameExt = technicalFile[-1]
+                else:
+                    technicalFileNameExt = ''
+
+                if 'Geometry' in prop:
+                    imageGeometry = re.split(r'[x+]', prop['Geometry'])
+                    imageWidth = imageGeometry[0]
+                    imageLength = imageGeometry[1]
+                else:
+                    imageWidth = ''
+                    imageLength = ''
+
+                if 'Depth' in prop:
+                    depth = prop['Depth']
+                    if '8' in depth:
+                        bitsPerSample = 'GrayScale'
+                    elif '24' in depth:
+                        bitsPerSample = '24-bit color'
+                    else:
+                        bitsPerSample = ''
+                else:
+                    bitsPerSample = ''
+
+                if 'Compression' in prop:
+                    compression = prop['Compression']
+                    if 'None' not in compression:
+                        compression = 'CCITT group 4'
+                else:
+                    compression = ''
+
+                if 'tiff:photometric' in prop:
+                    photometricInterpretation = prop['tiff:photometric']
+                    if 'RGB' in photometricInterpretation:
+                        samplesPerPixel = '3'
+                    elif 'black' in photometricInterpretation:
+                        samplesPerPixel = '1'
+                    else:
+                        samplesPerPixel = '4'
+                    if (int(samplesPerPixel) > 3):
+                        extraSamples = samplesPerPixel - 3
+                        extraSamplesFlag = True
                     else:
-                        # execute the command "identify -verbose <filename>" to fetch image properties.
-                        output, error, exitcode = runCmd('identify -verbose ' + fullPath)
-
-                        lines = output.decode('utf-8').split('\n')              # read the output from the command
-                                                                                # decode the output in the 'utf-8' format and remove line spoces.
-
-                        data = []
-                        for str in lines:
-                            if ': ' in str:
-                                data.append(str)
-
-                        data = [word.replace(':  ',':') for word in data]
-
-                        # method to convert the list into dictionary to have key-value pairs.
-                        prop = {}
-                        for item in data:
-                            key, value = item.split(": ")
-                            key = key.strip(" ")
-                            value = value.strip(" ")
-                            prop[key] = value
-
-                        # read the required technical properties from the dictionary
-                        if 'filename' in prop:
-                            technicalFile = re.split(r'[/]', prop['filename'])
-                            technicalFileNameExt = technicalFile[-1]
-                            technicalFileName = technicalFileNameExt.split(".")[0]
-                        else:
-                            technicalFileNameExt = ''
-                            technicalFileName =  ''
-
-                        if 'Geometry' in prop:
-                            imageGeometry = re.split(r'[x+]', prop['Geometry'])
-                            imageWidth = imageGeometry[0]
-                            imageLength = imageGeometry[1]
-                        else:
-                            imageWidth = ''
-                            imageLength = ''
-
-                        if 'Depth' in prop:
-                            depth = prop['Depth']
-                            if '8' in depth:
-                                bitsPerSample = 'GrayScale'
-                            elif '24' in depth:
-                                bitsPerSample = '24-bit color'
-                            else:
-                                bitsPerSample = ''
-                        else:
-                            bitsPerSample = ''
-
-                        if 'Compression' in prop:
-                            compression = prop['Compression']
-                            if 'None' not in compression:
-                                compression = 'CCITT group 4'
-                        else:
-                            compression = ''
-
-                        if 'tiff:photometric' in prop:
-                            photometricInterpretation = prop['tiff:photometric']
-                            if 'RGB' in photometricInterpretation:
-                                samplesPerPixel = '3'
-                            elif 'black' in photometricInterpretation:
-                                samplesPerPixel = '1'
-                            else:
-                                samplesPerPixel = '4'
-                            if (int(samplesPerPixel) > 3):
-                                extraSamples = samplesPerPixel - 3
-                                extraSamplesFlag = True
-                            else:
-                                extraSamples = '0'
-                                extraSamplesFlag = True
-                        else:
-                            photometricInterpretation = ''
-                            samplesPerPixel = ''
-                            extraSamples = ''
-                            extraSamplesFlag = False
-
-                        if 'Resolution' in prop:
-                            resolution = re.split(r'[x]', prop['Resolution'])
-                            xResolution = resolution[0]
-                            yResolution = resolution[1]
-                        else:
-                            xResolution = ''
-                            yResolution = ''
-
-                        if 'Units' in prop:
-                            resolutionUnit = prop['Units']
-                        else:
-                            resolutionUnit = ''
-
-                        if 'Colorspace' in prop:
-                            colorSpace = prop['Colorspace']
-                        else:
-                            colorSpace = ''
-
-                        if 'Background color' in prop:
-                            backgroundColor = prop['Background color']
-                            backgroundColorFlag = True
-                        else:
-                            backgroundColorFlag = False
-                            backgroundColor = ''
-
-                        if 'Border color' in prop:
-                            borderColor = prop['Border color']
-                            borderColorFlag = True
-                        else:
-                            borderColor = ''
-                            borderColorFlag = False
-
-                        if 'Matte color' in prop:
-                            matteColor = prop['Matte color']
-                            matteColorFlag = True
-                        else:
-                            matteColor = ''
-                            matteColorFlag = False
-
-                        if 'Transparent color' in prop:
-                            transparentColor = prop['Transparent color']
-                            transparentColorFlag = True
-                        else:
-                            transparentColor = ''
-                            transparentColorFlag = False
-
-                        if 'tiff:rows-per-strip' in prop:
-                            rowsPerStrip = prop['tiff:rows-per-strip']
-                            rowsPerStripFlag = True
-                        else:
-                            rowsPerStrip = ''
-                            rowsPerStripFlag = False
-
-                        if 'tiff:endian' in prop:
-                            endian = prop['tiff:endian']
-                            endianFlag = True
-                        else:
-                            endian = ''
-                            endianFlag = False
-
-                        if 'Orientation' in prop:
-                            orientation = prop['Orientation']
-                            orientationFlag = True
-                        else:
-                            orientation = ''
-                            orientationFlag = False
-
-                        # convert the time to EDTF format
-                        if 'tiff:timestamp' in prop:
-                            scanDateTime = prop['tiff:timestamp']
-                            date_format = datetime.strptime(scanDateTime, '%Y:%m:%d %H:%M:%S')
-                            new_format = date_format.strftime("%Y-%m-%d %H:%M:%S")
-                            timeStamp = new_format.replace(' ', 'T')
-                            timeZone = strftime('%z', localtime())
-                            timeZone = timeZone[:3] + ":" + timeZone[3:]
-                            scanDateTime = timeStamp + timeZone
-                        else:
-                            scanDateTime = ''
-
-                        if 'tiff:make' in prop:
-                            make = prop['tiff:make']
-                            makeFlag = True
-                        else:
-                            make = ''
-                            makeFlag = False
-
-                        if 'icc:model' in prop:
-                            model = prop['icc:model']
-                            modelFlag = True
-                        else:
-                            model = ''
-                            modelFlag = False
-
-                        if 'tiff:software' in prop:
-                            software = prop['tiff:software']
-                            softwareFlag = True
-                        else:
-                            software = ''
-                            softwareFlag = False
-
-                        # create a dictionary to store the missing technical property valueself. Using the flag values, the metadata is formed.
-                        techDocument = {}
-                        techDocument['rpsFlag'] = rowsPerStripFlag
-                        techDocument['endFlag'] = endianFlag
-                        techDocument['oriFlag'] = orientationFlag
-                        techDocument['extFlag'] = extraSamplesFlag
-                        techDocument['bacFlag'] = backgroundColorFlag
-                        techDocument['borFlag'] = borderColorFlag
-                        techDocument['matFlag'] = matteColorFlag
-                        techDocument['traFlag'] = transparentColorFlag
-                        techDocument['mkeFlag'] = makeFlag
-                        techDocument['modFlag'] = modelFlag
-                        techDocument['sofFlag'] = softwareFlag
-
-                        # read the technical property metadata document schema and create the metadata record to update the database.
-                        metadataRecord = createtechnicalProfile(techDocument)
-
-                        if(imageWidth != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_width.name] = imageWidth
-                        if(imageLength != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_length.name] = imageLength
-                        if(bitsPerSample != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_bitsPerSample.name] = bitsPerSample
-                        if(compression != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_compression.name] = compression
-                        if(photometricInterpretation != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_photometricInterpretation.name] = photometricInterpretation
-                        if(samplesPerPixel != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_samplesPerPixel.name] = samplesPerPixel
-                        if(xResolution != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_xResolution.name] = xResolution
-                        if(yResolution != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_yResolution.name] = yResolution
-                        if(resolutionUnit != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_resolutionUnit.name] = resolutionUnit
-                        if(colorSpace != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_colorSpace.name] = colorSpace
-                        if(extraSamples != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_extraSamples.name] = extraSamples
-                        if(backgroundColor != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_backgroundColor.name] = backgroundColor
-                        if(borderColor != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_borderColor.name] = borderColor
-                        if(matteColor != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_matteColor.name] = matteColor
-                        if(transparentColor != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_transparentColor.name] = transparentColor
-
-                        if(scanDateTime != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_scanDateTime.name] = scanDateTime
-
-                        if(make != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.scan_entity.name][globalvars.labels.scan_make.name] = make
-                        if(model != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.scan_entity.name][globalvars.labels.scan_model.name] = model
-                        if(software != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.scan_entity.name][globalvars.labels.scan_software.name] = software
-
-                        if(rowsPerStrip != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_rowsPerStrip.name] = rowsPerStrip
-
-                        if(endian != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_endian.name] = endian
-
-                        if(orientation != ''):
-                            metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_orientation.name] = orientation
-
-                        print_info("The following record has been initialized for the file: '{}': {}".format(technicalFileNameExt, metadataRecord))
-
-                        # Update the database record matching the id and add the metadata technical profile.
-                        dbUpdateTechProfile = updateRecordInDB(technicalFileName, metadataRecord)
-
-                        metadataExtraction = createMetadataExtractionEvent(ver, metadataRecord)
-                        document['premis']['eventList'].append(metadataExtraction)
-                        dbUpdatePremisProfile = updateRecordInDB(technicalFileName, document)
+                        extraSamples = '0'
+                        extraSamplesFlag = True
+                else:
+                    photometricInterpretation = ''
+                    samplesPerPixel = ''
+                    extraSamples = ''
+                    extraSamplesFlag = False
+
+                if 'Resolution' in prop:
+                    resolution = re.split(r'[x]', prop['Resolution'])
+                    xResolution = resolution[0]
+                    yResolution = resolution[1]
+                else:
+                    xResolution = ''
+                    yResolution = ''
+
+                if 'Units' in prop:
+                    resolutionUnit = prop['Units']
+                else:
+                    resolutionUnit = ''
+
+                if 'Colorspace' in prop:
+                    colorSpace = prop['Colorspace']
+                else:
+                    colorSpace = ''
+
+                if 'Background color' in prop:
+                    backgroundColor = prop['Background color']
+                    backgroundColorFlag = True
+                else:
+                    backgroundColorFlag = False
+                    backgroundColor = ''
+
+                if 'Border color' in prop:
+                    borderColor = prop['Border color']
+                    borderColorFlag = True
+                else:
+                    borderColor = ''
+                    borderColorFlag = False
+
+                if 'Matte color' in prop:
+                    matteColor = prop['Matte color']
+                    matteColorFlag = True
+                else:
+                    matteColor = ''
+                    matteColorFlag = False
+
+                if 'Transparent color' in prop:
+                    transparentColor = prop['Transparent color']
+                    transparentColorFlag = True
+                else:
+                    transparentColor = ''
+                    transparentColorFlag = False
+
+                if 'tiff:rows-per-strip' in prop:
+                    rowsPerStrip = prop['tiff:rows-per-strip']
+                    rowsPerStripFlag = True
+                else:
+                    rowsPerStrip = ''
+                    rowsPerStripFlag = False
+
+                if 'tiff:endian' in prop:
+                    endian = prop['tiff:endian']
+                    endianFlag = True
+                else:
+                    endian = ''
+                    endianFlag = False
+
+                if 'Orientation' in prop:
+                    orientation = prop['Orientation']
+                    orientationFlag = True
+                else:
+                    orientation = ''
+                    orientationFlag = False
+
+                # convert the time to EDTF format
+                if 'tiff:timestamp' in prop:
+                    scanDateTime = prop['tiff:timestamp']
+                    date_format = datetime.strptime(scanDateTime, '%Y:%m:%d %H:%M:%S')
+                    new_format = date_format.strftime("%Y-%m-%d %H:%M:%S")
+                    timeStamp = new_format.replace(' ', 'T')
+                    timeZone = strftime('%z', localtime())
+                    timeZone = timeZone[:3] + ":" + timeZone[3:]
+                    scanDateTime = timeStamp + timeZone
+                else:
+                    scanDateTime = ''
+
+                if 'tiff:make' in prop:
+                    make = prop['tiff:make']
+                    makeFlag = True
+                else:
+                    make = ''
+                    makeFlag = False
+
+                if 'icc:model' in prop:
+                    model = prop['icc:model']
+                    modelFlag = True
+                else:
+                    model = ''
+                    modelFlag = False
+
+                if 'tiff:software' in prop:
+                    software = prop['tiff:software']
+                    softwareFlag = True
+                else:
+                    software = ''
+                    softwareFlag = False
+
+                # create a dictionary to store the missing technical property valueself. Using the flag values, the metadata is formed.
+                techDocument = {}
+                techDocument['rpsFlag'] = rowsPerStripFlag
+                techDocument['endFlag'] = endianFlag
+                techDocument['oriFlag'] = orientationFlag
+                techDocument['extFlag'] = extraSamplesFlag
+                techDocument['bacFlag'] = backgroundColorFlag
+                techDocument['borFlag'] = borderColorFlag
+                techDocument['matFlag'] = matteColorFlag
+                techDocument['traFlag'] = transparentColorFlag
+                techDocument['mkeFlag'] = makeFlag
+                techDocument['modFlag'] = modelFlag
+                techDocument['sofFlag'] = softwareFlag
+
+                # read the technical property metadata document schema and create the metadata record to update the database.
+                metadataRecord = createtechnicalProfile(techDocument)
+
+                if(imageWidth != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_width.name] = imageWidth
+                if(imageLength != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_length.name] = imageLength
+                if(bitsPerSample != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_bitsPerSample.name] = bitsPerSample
+                if(compression != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_compression.name] = compression
+                if(photometricInterpretation != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_photometricInterpretation.name] = photometricInterpretation
+                if(samplesPerPixel != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_samplesPerPixel.name] = samplesPerPixel
+                if(xResolution != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_xResolution.name] = xResolution
+                if(yResolution != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_yResolution.name] = yResolution
+                if(resolutionUnit != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_resolutionUnit.name] = resolutionUnit
+                if(colorSpace != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_colorSpace.name] = colorSpace
+                if(extraSamples != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_extraSamples.name] = extraSamples
+                if(backgroundColor != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_backgroundColor.name] = backgroundColor
+                if(borderColor != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_borderColor.name] = borderColor
+                if(matteColor != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_matteColor.name] = matteColor
+                if(transparentColor != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.img_entity.name][globalvars.labels.img_transparentColor.name] = transparentColor
+
+                if(scanDateTime != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_scanDateTime.name] = scanDateTime
+
+                if(make != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.scan_entity.name][globalvars.labels.scan_make.name] = make
+                if(model != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.scan_entity.name][globalvars.labels.scan_model.name] = model
+                if(software != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.scan_entity.name][globalvars.labels.scan_software.name] = software
+
+                if(rowsPerStrip != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_rowsPerStrip.name] = rowsPerStrip
+
+                if(endian != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_endian.name] = endian
+
+                if(orientation != ''):
+                    metadataRecord[globalvars.labels.tech_entity.name][globalvars.labels.tech_orientation.name] = orientation
+
+                print_info("The following record has been initialized for the file: '{}': {}".format(technicalFileNameExt, metadataRecord))
+
+                # Add the metadata technical profile and the metadataExtraction event to the
+                # database record in a single update, sent along with the rest of the batch.
+                metadataExtraction = createMetadataExtractionEvent(ver, metadataRecord)
+                dbUpdateTechProfile = queueRecordUpdate(document['_id'], metadataRecord, [metadataExtraction])
+
+        dbUpdateTechProfile = flushRecordUpdates()
 
     else:
         globalvars.technicalErrorList.append([errorcodes.ERROR_CANNOT_FIND_DOCUMENT["message"]])
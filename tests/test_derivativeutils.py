@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from metadatautilspkg.derivativeutils import (Image, getResizableImage, isBandStreamable, iterBands, loadReducedByBands,
+                                              renderDerivative)
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class RenderDerivativeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDir.cleanup)
+
+    def render(self, srcImage, fileType="tif", outFormat="JPEG"):
+        srcPath = os.path.join(self.tempDir.name, "src." + fileType)
+        srcImage.save(srcPath)
+        outPath = os.path.join(self.tempDir.name, "out." + outFormat.lower())
+        job = {"fullPath": srcPath, "outputs": [{"derivedFilePath": outPath, "boxWidth": 32, "boxHeight": 32,
+                                                 "format": outFormat, "quality": 90}]}
+        result = renderDerivative(job)
+        self.assertEqual(result["exitCode"], 0, result["message"])
+        self.assertEqual(result["outputs"][0]["exitCode"], 0, result["outputs"][0]["message"])
+        return Image.open(outPath)
+
+    def test_sixteen_bit_source_is_scaled_not_clipped(self):
+        with self.render(Image.new("I;16", (64, 48), 30000)) as outImage:
+            self.assertEqual(outImage.size, (32, 24))
+            low, high = outImage.getextrema()
+            self.assertLess(high, 255)
+            self.assertAlmostEqual(low, 30000 // 256, delta=2)
+
+    def test_sixteen_bit_big_endian_source_is_scaled(self):
+        image = Image.new("I;16B", (4, 4), 30000)
+        self.assertEqual(getResizableImage(image).getextrema(), (117, 117))
+
+    def test_wide_modes_are_stretched_to_their_range(self):
+        for mode, low, high in (("I", -70000, 70000), ("F", 0.0, 0.5)):
+            image = Image.new(mode, (4, 4), high)
+            image.putpixel((0, 0), low)
+            resizable = getResizableImage(image)
+            self.assertEqual(resizable.mode, "L")
+            self.assertEqual(resizable.getextrema(), (0, 255))
+
+    def test_flat_float_image_is_not_divided_by_zero(self):
+        self.assertEqual(getResizableImage(Image.new("F", (4, 4), 3.0)).getextrema(), (0, 0))
+
+    def test_eight_bit_and_palette_sources(self):
+        with self.render(Image.new("RGB", (64, 64), (200, 100, 50))) as outImage:
+            self.assertEqual(outImage.mode, "RGB")
+            self.assertEqual(outImage.size, (32, 32))
+        with self.render(Image.new("P", (64, 64), 3), fileType="gif", outFormat="PNG") as outImage:
+            self.assertEqual(outImage.mode, "RGBA")
+
+    def test_undecodable_source_fails_the_job(self):
+        srcPath = os.path.join(self.tempDir.name, "broken.tif")
+        with open(srcPath, "wb") as srcFile:
+            srcFile.write(b"II*\x00garbage")
+        job = {"fullPath": srcPath, "outputs": [{"derivedFilePath": srcPath + ".jpg", "boxWidth": 32, "boxHeight": 32,
+                                                 "format": "JPEG", "quality": 90}]}
+        result = renderDerivative(job)
+        self.assertNotEqual(result["exitCode"], 0)
+        self.assertEqual(result["outputs"][0]["exitCode"], result["exitCode"])
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class BandDecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempDir.cleanup)
+        self.image = Image.effect_noise((301, 1000), 64).convert("RGB")
+
+    def save(self, fileName, **saveOptions):
+        filePath = os.path.join(self.tempDir.name, fileName)
+        self.image.save(filePath, **saveOptions)
+        return filePath
+
+    def test_single_strip_uncompressed_tiff_is_streamed(self):
+        filePath = self.save("strip.tif")
+        with Image.open(filePath) as srcImage:
+            self.assertEqual(len(srcImage.tile), 1)
+            self.assertTrue(isBandStreamable(srcImage))
+
+        bandTops = []
+        decodedImage = Image.new("RGB", self.image.size)
+        for bandTop, bandImage in iterBands(filePath, 0, 3):
+            bandTops.append(bandTop)
+            decodedImage.paste(bandImage, (0, bandTop))
+        self.assertGreater(len(bandTops), 1)
+        self.assertTrue(all(bandTop % 3 == 0 for bandTop in bandTops))
+        self.assertEqual(decodedImage.tobytes(), self.image.tobytes())
+
+    def test_reduced_by_bands_matches_reduce(self):
+        filePath = self.save("strip.tif")
+        self.assertEqual(loadReducedByBands(filePath, 0, 3).tobytes(), self.image.reduce(3).tobytes())
+
+    def test_compressed_tiff_is_decoded_whole(self):
+        filePath = self.save("lzw.tif", compression="tiff_lzw")
+        with Image.open(filePath) as srcImage:
+            self.assertFalse(isBandStreamable(srcImage))
+
+
+if __name__ == "__main__":
+    unittest.main()
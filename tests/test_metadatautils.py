@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime
+
+from metadatautilspkg.metadatautils import getContentHash, getJsonPointer, getMetadataDelta
+
+
+class MetadataDeltaTest(unittest.TestCase):
+
+    def test_equal_metadata_has_no_delta(self):
+        profile = {"format": "TIFF", "size": [640, 480], "exif": {"Make": "Nikon"}}
+        self.assertEqual(getMetadataDelta(profile, dict(profile)), [])
+        self.assertEqual(getMetadataDelta({}, {}), [])
+
+    def test_added_replaced_and_removed_fields(self):
+        delta = getMetadataDelta({"format": "TIFF", "version": "6.0", "pages": 1},
+                                 {"format": "JPEG", "pages": 1, "quality": 80})
+        self.assertEqual(delta, [{"op": "remove", "path": "/version"},
+                                 {"op": "replace", "path": "/format", "value": "JPEG"},
+                                 {"op": "add", "path": "/quality", "value": 80}])
+
+    def test_new_profile(self):
+        self.assertEqual(getMetadataDelta({}, {"added": datetime(2020, 1, 1)}),
+                         [{"op": "add", "path": "/added", "value": datetime(2020, 1, 1)}])
+
+    def test_nested_fields_are_compared_field_by_field(self):
+        before = {"exif": {"Make": "Nikon", "Model": "D70", "GPS": {"lat": 1}}}
+        after = {"exif": {"Make": "Nikon", "Model": "D80", "GPS": {}}}
+        self.assertEqual(getMetadataDelta(before, after), [{"op": "replace", "path": "/exif/Model", "value": "D80"},
+                                                           {"op": "remove", "path": "/exif/GPS/lat"}])
+
+    def test_objects_and_lists_are_referenced_by_hash(self):
+        delta = getMetadataDelta({"size": [640, 480]}, {"size": [320, 240], "exif": {"Make": "Nikon"}})
+        self.assertEqual(delta, [{"op": "replace", "path": "/size", "valueHash": getContentHash([320, 240])},
+                                 {"op": "add", "path": "/exif", "valueHash": getContentHash({"Make": "Nikon"})}])
+        # An object replacing a scalar is referenced as well.
+        self.assertEqual(getMetadataDelta({"exif": None}, {"exif": {"Make": "Nikon"}}),
+                         [{"op": "replace", "path": "/exif", "valueHash": getContentHash({"Make": "Nikon"})}])
+
+    def test_top_level_dotted_keys_are_paths(self):
+        delta = getMetadataDelta({}, {"arrangement.box": "3", "exif": {"a.b": 1}})
+        self.assertEqual([operation["path"] for operation in delta], ["/arrangement/box", "/exif"])
+        self.assertEqual(getMetadataDelta({"exif": {"a.b": 1}}, {"exif": {"a.b": 2}}),
+                         [{"op": "replace", "path": "/exif/a.b", "value": 2}])
+
+    def test_pointers_are_escaped(self):
+        self.assertEqual(getJsonPointer(("exif", "a/b", "c~d", 0)), "/exif/a~1b/c~0d/0")
+        self.assertEqual(getMetadataDelta({"exif": {}}, {"exif": {"x/y": 1}}),
+                         [{"op": "add", "path": "/exif/x~1y", "value": 1}])
+
+    def test_content_hash_is_canonical(self):
+        self.assertEqual(getContentHash({"a": 1, "b": [1, 2]}), getContentHash({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(getContentHash([1, 2]), getContentHash([2, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from time import time
+
+import metadatautilspkg.globalvars as globalvars
+import metadatautilspkg.errorcodes as errorcodes
+import metadatautilspkg.sqlitebackend as sqlitebackend
+from metadatautilspkg.metadatautils import readLabelDictionary
+from metadatautilspkg.arrangementsummary import getSummaryNodeId
+from metadatautilspkg.outbox import (addRecordSummaryDelta, countOutboxRecords, getStoredHighestSerialNo, isCatalogAvailable,
+                                     queueOutboxSummaryDeltas, recordCatalogAccess, storeRecord, syncOutbox)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+SAVED_GLOBALS = ["labelsFileName", "labels", "quietMode", "outboxFileName", "outboxHandle", "dbBackend", "dbHandle", "dbCollection",
+                 "dbSummaryCollection", "dbEventsCollection", "summaryDeltas", "dbCircuitOpenUntil", "dbSlowWrites"]
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        savedGlobals = {name: getattr(globalvars, name) for name in SAVED_GLOBALS}
+        self.addCleanup(lambda: [setattr(globalvars, name, value) for name, value in savedGlobals.items()])
+
+        tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDir.cleanup)
+
+        globalvars.labelsFileName = os.path.join(CONFIG_DIR, "labels.json")
+        globalvars.labels = readLabelDictionary()
+        globalvars.quietMode = True
+        globalvars.outboxFileName = os.path.join(tempDir.name, "outbox.db")
+        globalvars.outboxHandle = None
+        globalvars.dbBackend = sqlitebackend
+        globalvars.dbHandle = sqlitebackend.connect({"dbpath": os.path.join(tempDir.name, "catalog.db")})
+        globalvars.dbCollection = "records"
+        globalvars.dbSummaryCollection = "summary"
+        globalvars.dbEventsCollection = None
+        globalvars.summaryDeltas = {}
+        globalvars.dbCircuitOpenUntil = 0
+        globalvars.dbSlowWrites = 0
+
+        self.addCleanup(lambda: globalvars.outboxHandle.close() if globalvars.outboxHandle != None else None)
+        self.addCleanup(globalvars.dbHandle.connection.close)
+
+    def getRecord(self, serialNo, fmtName="TIFF", size=100):
+        labels = globalvars.labels
+        return {"_id": "record-{}".format(serialNo),
+                labels.admn_entity.name: {labels.arrangement.name: {"seriesLabel": "1", labels.serial_nbr.name: serialNo}},
+                labels.pres_entity.name: {
+                    labels.obj_entity.name: {
+                        labels.obj_orig_name.name: "/data/src/file{}.tif".format(serialNo),
+                        labels.obj_chars.name: {labels.obj_size.name: size,
+                                                labels.obj_fmt.name: {labels.obj_fmt_dsgn.name: {labels.obj_fmt_name.name: fmtName}}}},
+                    labels.evt_parent_entity.name: [{labels.evt_entity.name: {labels.evt_id.name: {labels.evt_id_val.name: "ingestion"}}}]}}
+
+    def queueRecords(self, records):
+        # As accession.py does while the catalog is down.
+        globalvars.dbCircuitOpenUntil = time() + globalvars.DB_BREAKER_COOLDOWN
+        for record in records:
+            self.assertFalse(storeRecord(record))
+        globalvars.dbCircuitOpenUntil = 0
+
+    def queueSummaryDeltas(self, records):
+        # As accession.py does when the records reached the catalog, but not their summary changes.
+        for record in records:
+            self.assertTrue(storeRecord(record))
+            addRecordSummaryDelta(record)
+        queueOutboxSummaryDeltas()
+
+    def getSummaryNode(self, labelList):
+        return globalvars.dbHandle[globalvars.dbSummaryCollection].find_one({"_id": getSummaryNodeId(labelList)})
+
+    def test_records_are_queued_while_the_catalog_is_down(self):
+        self.queueRecords([self.getRecord(1), self.getRecord(2)])
+
+        self.assertEqual(countOutboxRecords(), 2)
+        self.assertEqual(globalvars.dbHandle[globalvars.dbCollection].count_documents({}), 0)
+        self.assertEqual(getStoredHighestSerialNo("/data/src"), 2)
+
+        globalvars.dbHandle = None
+        self.assertFalse(isCatalogAvailable())
+        self.assertEqual(getStoredHighestSerialNo("/data/src"), 2)
+        self.assertEqual(getStoredHighestSerialNo("/data/other"), None)
+
+    def test_records_go_to_the_catalog_when_it_is_available(self):
+        self.assertTrue(storeRecord(self.getRecord(1)))
+        self.assertEqual(countOutboxRecords(), 0)
+
+    def test_slow_writes_open_the_circuit(self):
+        for attempt in range(globalvars.DB_SLOW_WRITE_LIMIT - 1):
+            recordCatalogAccess(True, globalvars.DB_SLOW_WRITE_SECONDS)
+        self.assertTrue(isCatalogAvailable())
+
+        recordCatalogAccess(True, globalvars.DB_SLOW_WRITE_SECONDS)
+        self.assertFalse(isCatalogAvailable())
+
+    def test_sync_replays_the_records_and_the_summary(self):
+        self.queueRecords([self.getRecord(1), self.getRecord(2, "JPEG", 50)])
+
+        self.assertEqual(syncOutbox(), 2)
+        self.assertEqual(countOutboxRecords(), 0)
+        self.assertEqual(globalvars.dbHandle[globalvars.dbCollection].find_one({"_id": "record-2"}), self.getRecord(2, "JPEG", 50))
+
+        rootNode = self.getSummaryNode([])
+        self.assertEqual((rootNode["count"], rootNode["size"]), (2, 150))
+        self.assertEqual(rootNode["formats"]["JPEG"], {"count": 1, "size": 50})
+        self.assertEqual(self.getSummaryNode(["1"])["count"], 2)
+
+        # Syncing again is harmless.
+        self.assertEqual(syncOutbox(), 0)
+        self.assertEqual(self.getSummaryNode([])["count"], 2)
+
+    def test_sync_leaves_the_records_already_in_the_catalog(self):
+        # record-1 was written to the catalog by an interrupted sync, and changed since.
+        catalogRecord = self.getRecord(1, size=999)
+        globalvars.dbHandle[globalvars.dbCollection].insert_one(catalogRecord)
+        self.queueRecords([self.getRecord(1), self.getRecord(2)])
+
+        self.assertEqual(syncOutbox(), 2)
+        records = globalvars.dbHandle[globalvars.dbCollection]
+        self.assertEqual(records.find_one({"_id": "record-1"}), catalogRecord)
+        self.assertEqual(records.count_documents({}), 2)
+        # Only record-2, new to the catalog, is counted.
+        self.assertEqual(self.getSummaryNode([])["count"], 1)
+
+    def test_sync_with_an_events_collection(self):
+        globalvars.dbEventsCollection = "events"
+        self.queueRecords([self.getRecord(1), self.getRecord(2)])
+
+        self.assertEqual(syncOutbox(), 2)
+        self.assertNotIn(globalvars.labels.evt_parent_entity.name,
+                         globalvars.dbHandle[globalvars.dbCollection].find_one({"_id": "record-1"})[globalvars.labels.pres_entity.name])
+        events = globalvars.dbHandle[globalvars.dbEventsCollection]
+        self.assertEqual(sorted(event["_id"] for event in events.find({})), ["record-1/ingestion", "record-2/ingestion"])
+
+    def test_queued_summary_changes_are_applied_first(self):
+        self.queueSummaryDeltas([self.getRecord(1)])
+        self.queueRecords([self.getRecord(2)])
+        self.assertEqual(self.getSummaryNode([]), None)
+
+        self.assertEqual(syncOutbox(), 1)
+        self.assertEqual(self.getSummaryNode([])["count"], 2)
+
+    def test_failed_summary_changes_stay_in_the_outbox(self):
+        self.queueSummaryDeltas([self.getRecord(1)])
+        self.queueRecords([self.getRecord(2)])
+        # A root node whose count cannot be incremented fails the summary write.
+        globalvars.dbHandle[globalvars.dbSummaryCollection].insert_one({"_id": getSummaryNodeId([]), "count": "many"})
+
+        self.assertEqual(syncOutbox(), errorcodes.ERROR_CANNOT_UPDATE_DB["code"])
+        self.assertEqual(countOutboxRecords(), 1)
+        self.assertEqual(globalvars.dbHandle[globalvars.dbCollection].count_documents({}), 1)
+
+        globalvars.dbHandle[globalvars.dbSummaryCollection].delete_one({"_id": getSummaryNodeId([])})
+        self.assertEqual(syncOutbox(), 1)
+        self.assertEqual(self.getSummaryNode([])["count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import metadatautilspkg.sqlitebackend as sqlitebackend
+
+
+class SqliteBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDir.cleanup)
+        self.dbPath = os.path.join(tempDir.name, "catalog.db")
+        self.dbHandle = sqlitebackend.connect({"dbpath": self.dbPath})
+        self.addCleanup(self.dbHandle.connection.close)
+        self.records = self.dbHandle["records"]
+
+        self.records.insert_one({"_id": "a", "series": "1", "size": 10, "added": datetime(2020, 1, 1),
+                                 "events": [{"type": "ingestion"}, {"type": "migration", "hash": "h1"}]})
+        self.records.insert_one({"_id": "b", "series": "1", "size": 20, "added": datetime(2021, 6, 1),
+                                 "events": [{"type": "ingestion"}]})
+        self.records.insert_one({"_id": "c", "series": "2", "size": "unknown", "path": "/data/src/c.tif"})
+
+    def findIds(self, query, **kwargs):
+        return sorted(document["_id"] for document in self.records.find(query, **kwargs))
+
+    def getPlanStage(self, query):
+        return self.records.find(query).explain()["queryPlanner"]["winningPlan"]["stage"]
+
+    def test_equality_and_operators(self):
+        self.assertEqual(self.findIds({"series": "1"}), ["a", "b"])
+        self.assertEqual(self.findIds({"_id": {"$in": ["a", "c", "x"]}}), ["a", "c"])
+        self.assertEqual(self.findIds({"path": {"$exists": False}}), ["a", "b"])
+        self.assertEqual(self.findIds({"path": {"$regex": r"\.TIF$", "$options": "i"}}), ["c"])
+        self.assertEqual(self.findIds({"$or": [{"series": "2"}, {"size": {"$gte": 20}}]}), ["b", "c"])
+        self.assertEqual(self.findIds({"$nor": [{"series": "2"}]}), ["a", "b"])
+
+    def test_comparisons_are_within_a_type(self):
+        # As with MongoDB, a string is neither less nor greater than a number.
+        self.assertEqual(self.findIds({"size": {"$lt": 100}}), ["a", "b"])
+        self.assertEqual(self.findIds({"added": {"$gt": datetime(2020, 6, 1)}}), ["b"])
+
+    def test_fields_in_arrays(self):
+        self.assertEqual(self.findIds({"events.type": "migration"}), ["a"])
+        self.assertEqual(self.findIds({"events.hash": {"$ne": "h1"}}), ["b", "c"])
+
+    def test_dates_round_trip(self):
+        self.assertEqual(self.records.find_one({"_id": "b"})["added"], datetime(2021, 6, 1))
+
+    def test_projection(self):
+        self.assertEqual(self.records.find_one({"_id": "a"}, {"events.type": 1}),
+                         {"_id": "a", "events": [{"type": "ingestion"}, {"type": "migration"}]})
+        self.assertEqual(self.records.find_one({"_id": "c"}, {"_id": 0, "series": 1}), {"series": "2"})
+
+    def test_sort_and_limit(self):
+        page = self.records.find({"_id": {"$gt": "a"}}).sort("_id", sqlitebackend.ASCENDING).limit(1)
+        self.assertEqual([document["_id"] for document in page], ["b"])
+        bySize = self.records.find({"series": "1"}).sort("size", sqlitebackend.DESCENDING)
+        self.assertEqual([document["_id"] for document in bySize], ["b", "a"])
+
+    def test_update_operators(self):
+        result = self.records.update_one({"_id": "a"}, {"$set": {"arrangement.box": "3"}, "$inc": {"size": 5},
+                                                        "$push": {"events": {"$each": [{"type": "deletion"}]}}})
+        self.assertEqual((result.matched_count, result.modified_count), (1, 1))
+
+        document = self.records.find_one({"_id": "a"})
+        self.assertEqual(document["arrangement"], {"box": "3"})
+        self.assertEqual(document["size"], 15)
+        self.assertEqual([event["type"] for event in document["events"]], ["ingestion", "migration", "deletion"])
+
+        self.records.update_one({"_id": "b"}, {"$push": {"notes": "checked"}, "$unset": {"added": ""}})
+        document = self.records.find_one({"_id": "b"})
+        self.assertEqual(document["notes"], ["checked"])
+        self.assertNotIn("added", document)
+
+    def test_invalid_updates_raise_database_errors(self):
+        with self.assertRaises(sqlitebackend.DatabaseError):
+            self.records.update_one({"_id": "c"}, {"$inc": {"size": 1}})
+        with self.assertRaises(sqlitebackend.DatabaseError):
+            self.records.update_one({"_id": "a"}, {"$push": {"size": 1}})
+
+    def test_unchanged_documents_are_not_modified(self):
+        result = self.records.update_many({"series": "1"}, {"$set": {"size": 10}})
+        self.assertEqual((result.matched_count, result.modified_count), (2, 1))
+
+    def test_upsert(self):
+        result = self.records.update_one({"_id": "node", "parent": "[]"}, {"$inc": {"count": 2}, "$setOnInsert": {"name": "root"}},
+                                         upsert=True)
+        self.assertEqual((result.matched_count, result.upserted_count, result.upserted_id), (0, 1, "node"))
+        self.records.update_one({"_id": "node"}, {"$inc": {"count": 3}, "$setOnInsert": {"name": "other"}}, upsert=True)
+        self.assertEqual(self.records.find_one({"_id": "node"}), {"_id": "node", "parent": "[]", "count": 5, "name": "root"})
+
+    def test_bulk_write(self):
+        result = self.records.bulk_write([sqlitebackend.UpdateOne({"_id": "a"}, {"$inc": {"size": 1}}),
+                                          sqlitebackend.UpdateOne({"_id": "new"}, {"$set": {"series": "3"}}, upsert=True),
+                                          sqlitebackend.DeleteOne({"_id": "b"})], ordered=False)
+        self.assertEqual((result.modified_count, result.upserted_count, result.deleted_count), (1, 1, 1))
+        self.assertEqual(result.upserted_ids, {1: "new"})
+        self.assertEqual(self.findIds({}), ["a", "c", "new"])
+
+    def test_bulk_write_reports_the_failed_operations(self):
+        requests = [sqlitebackend.InsertOne({"_id": "a"}),
+                    sqlitebackend.UpdateOne({"_id": "b"}, {"$inc": {"size": 1}}),
+                    sqlitebackend.UpdateOne({"_id": "c"}, {"$inc": {"size": 1}})]
+        with self.assertRaises(sqlitebackend.BulkWriteError) as raised:
+            self.records.bulk_write(requests, ordered=False)
+        self.assertEqual([writeError["index"] for writeError in raised.exception.details["writeErrors"]], [0, 2])
+        self.assertEqual(self.records.find_one({"_id": "b"})["size"], 21)  # The others are written.
+
+    def test_duplicate_key(self):
+        with self.assertRaises(sqlitebackend.DuplicateKeyError):
+            self.records.insert_one({"_id": "a"})
+
+    def test_count_and_aggregate(self):
+        self.assertEqual(self.records.count_documents({"series": "1"}), 2)
+        groups = self.records.aggregate([{"$match": {"series": "1"}}, {"$group": {"_id": "$series", "count": {"$sum": 1},
+                                                                                   "size": {"$sum": "$size"}}}])
+        self.assertEqual(list(groups), [{"_id": "1", "count": 2, "size": 30}])
+
+    def test_explain_uses_indexes(self):
+        self.assertEqual(self.getPlanStage({"series": "1"}), "COLLSCAN")
+        self.assertEqual(self.getPlanStage({"_id": {"$gt": "a"}}), "FETCH")
+
+        self.records.create_index([("series", sqlitebackend.ASCENDING), ("size", sqlitebackend.ASCENDING)], name="seriesSize")
+        self.records.create_index([("path", sqlitebackend.ASCENDING)], name="path")
+        self.records.create_index([("events.type", sqlitebackend.ASCENDING)], name="eventType", multikey=True)
+
+        self.assertEqual(self.getPlanStage({"series": "1"}), "FETCH")
+        self.assertEqual(self.getPlanStage({"$and": [{"series": "1"}, {"size": {"$lt": 15}}]}), "FETCH")
+        self.assertEqual(self.getPlanStage({"path": {"$regex": "^/data/src/[^/]*$"}}), "FETCH")
+        self.assertEqual(self.getPlanStage({"path": {"$regex": "c.tif$"}}), "COLLSCAN")
+        self.assertEqual(self.getPlanStage({"events.type": "migration"}), "COLLSCAN")  # Multikey indexes are not looked up.
+
+        # The indexed lookups still check the whole query.
+        self.assertEqual(self.findIds({"series": "1", "size": {"$lt": 15}}), ["a"])
+        self.assertEqual(self.findIds({"path": {"$regex": "^/data/src/[^/]*$"}}), ["c"])
+        self.assertEqual(set(self.records.index_information()), {"_id_", "seriesSize", "path", "eventType"})
+
+    def test_indexes_persist(self):
+        self.records.create_index([("series", sqlitebackend.ASCENDING)], name="series")
+        dbHandle = sqlitebackend.connect({"dbpath": self.dbPath})
+        self.addCleanup(dbHandle.connection.close)
+        self.assertEqual(dbHandle["records"].find({"series": "2"}).explain()["queryPlanner"]["winningPlan"]["stage"], "FETCH")
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(sqlitebackend.ConfigurationError):
+            sqlitebackend.connect({"dbpath": self.dbPath, "synchronous": "SOMETIMES"})
+
+
+if __name__ == "__main__":
+    unittest.main()